@@ -1,21 +1,25 @@
 import threading
 import time
+from datetime import datetime, timezone
 from logging import Logger
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from binance.client import Client as BinanceClient
-from expiringdict import ExpiringDict
 from injector import inject, singleton
 from tqdm import tqdm
 
-from altymeter.api.exchange import (ExchangeOpenOrder,
+from altymeter.api import decoding
+from altymeter.api.exchange import (ExchangeFill,
+                                    ExchangeOpenOrder,
                                     ExchangeOrder,
                                     ExchangeTransfer,
                                     PairRecentStats,
                                     TradedPair,
                                     TradingExchange)
+from altymeter.api.metadata_cache import MetadataCache
+from altymeter.api.poll_schedule import get_span_seconds, PollSchedule
 from altymeter.module.constants import Configuration
-from altymeter.pricing import PriceData, Trade
+from altymeter.pricing import PriceData, TradeBatch
 
 
 @singleton
@@ -27,6 +31,7 @@ class BinanceApi(TradingExchange):
     @inject
     def __init__(self, config: Configuration,
                  logger: Logger,
+                 metadata_cache: MetadataCache,
                  price_data: PriceData,
                  ):
         config = config['exchanges']['Binance']
@@ -34,7 +39,7 @@ class BinanceApi(TradingExchange):
 
         self._logger = logger
         self._price_data = price_data
-        self._traded_pairs_cache = ExpiringDict(max_len=1, max_age_seconds=24 * 60 * 60)
+        self._metadata_cache = metadata_cache
 
     @property
     def name(self):
@@ -43,11 +48,29 @@ class BinanceApi(TradingExchange):
     def _get_market_history(self, pair: str, since=None) -> dict:
         return self._binance.get_historical_trades(symbol=pair, fromId=since)
 
+    @property
+    def trades_page_size(self) -> Optional[int]:
+        # Limit of number of trades retrieved as specified in API docs.
+        return 500
+
+    @property
+    def trades_calls_per_second(self) -> Optional[float]:
+        # Historical trades have a weight of 5 out of 1200 per minute. Leave room for other calls.
+        return 2
+
+    def fetch_trades(self, pair: str, since=None) -> Tuple[TradeBatch, Optional[int]]:
+        trades = decoding.parse_binance_trades(self._get_market_history(pair, since))
+        if len(trades) > 0:
+            since = int(trades.id[-1]) + 1
+        return trades, since
+
     def collect_data(self, pair: str, since: int = None, sleep_time=30,
                      stop_event: threading.Event = None):
         self._logger.info("Collecting data for %s since %s.", pair, since)
-        # Limit of number of trades retrieved as specified in API docs.
-        max_limit = 500
+        # Wait at most `sleep_time` between polls and less for busy pairs.
+        schedule = PollSchedule(self.trades_page_size,
+                                min_seconds=min(1 / self.trades_calls_per_second, sleep_time),
+                                max_seconds=sleep_time, default_seconds=sleep_time)
         with tqdm(desc="Collecting data for %s" % pair,
                   unit=" trades", unit_scale=True) as progress_bar:
             while True:
@@ -55,32 +78,13 @@ class BinanceApi(TradingExchange):
                     self._logger.info("Got signal to stop collecting %s.", pair)
                     break
                 try:
-                    pair_trades = self._get_market_history(pair, since)
-
-                    if pair_trades:
-                        trades = []
-                        for trade in pair_trades:
-                            since = trade['id']
-                            price = float(trade['price'])
-                            amount = float(trade['qty'])
-                            trade_time = trade['time'] / 1000
-                            trades.append(Trade(price, amount, trade_time))
-                        if since is not None:
-                            since += 1
+                    poll_time = time.time()
+                    trades, since = self.fetch_trades(pair, since)
+                    if len(trades) > 0:
                         self._price_data.add_prices(pair, trades)
                         progress_bar.update(len(trades))
-
-                    # If there are many trades, then we don't want to sleep much.
-                    if len(pair_trades) > 0.75 * max_limit:
-                        time.sleep(min(1, sleep_time))
-                    elif len(pair_trades) > 0.50 * max_limit:
-                        time.sleep(min(5, sleep_time))
-                    elif len(pair_trades) > 0.25 * max_limit:
-                        time.sleep(min(10, sleep_time))
-                    elif len(pair_trades) == 0:
-                        time.sleep(min(5, sleep_time))
-                    else:
-                        time.sleep(sleep_time)
+                    schedule.observe(len(trades), get_span_seconds(trades), poll_time)
+                    time.sleep(schedule.get_interval())
                 except:
                     self._logger.exception("Error getting trades.")
                     time.sleep(sleep_time / 3)
@@ -144,8 +148,39 @@ class BinanceApi(TradingExchange):
             order_type=resp['type'].lower(),
         )
 
-    def get_deposit_history(self) -> List[ExchangeTransfer]:
-        raise NotImplementedError
+    @staticmethod
+    def _to_ms(date: Optional[datetime]) -> Optional[int]:
+        if date is None:
+            return None
+        return int(date.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+    @staticmethod
+    def _from_ms(time_in_ms: int) -> datetime:
+        return datetime.fromtimestamp(time_in_ms / 1000, timezone.utc).replace(tzinfo=None)
+
+    def get_deposit_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
+        result = []
+        params = dict()
+        if since is not None:
+            params['startTime'] = self._to_ms(since)
+        deposits = self._binance.get_deposit_history(**params)
+        if isinstance(deposits, dict):
+            deposits = deposits.get('depositList') or []
+        for deposit in deposits:
+            # 1 means success.
+            if deposit.get('status') != 1:
+                continue
+            result.append(ExchangeTransfer(
+                name=deposit['asset'] if 'asset' in deposit else deposit['coin'],
+                exchange=self.name,
+                amount=float(deposit['amount']),
+                transfer_cost=None,
+                date=self._from_ms(deposit['insertTime']),
+                type='DEPOSIT',
+                destination=deposit.get('address'),
+                origin=None,
+            ))
+        return result
 
     def get_order_book(self, pair: Optional[str] = None,
                        base: Optional[str] = None, to: Optional[str] = None,
@@ -155,19 +190,19 @@ class BinanceApi(TradingExchange):
         result = []
         orders = self._binance.get_order_book(symbol=pair)
         if order_type != 'bid':
-            for order in orders['asks']:
+            for price, volume in decoding.parse_depth_levels(orders['asks']).tolist():
                 result.append(ExchangeOpenOrder(
                     pair, self.name,
-                    price=float(order[0]),
-                    volume=float(order[1]),
+                    price=price,
+                    volume=volume,
                     order_type='ask'
                 ))
         if order_type != 'ask':
-            for order in orders['bids']:
+            for price, volume in decoding.parse_depth_levels(orders['bids']).tolist():
                 result.append(ExchangeOpenOrder(
                     pair, self.name,
-                    price=float(order[0]),
-                    volume=float(order[1]),
+                    price=price,
+                    volume=volume,
                     order_type='bid'
                 ))
         return result
@@ -190,11 +225,7 @@ class BinanceApi(TradingExchange):
                                last_price=float(recent_stats['lastPrice']),
                                )
 
-    def get_traded_pairs(self) -> List[TradedPair]:
-        key = 'traded_pairs'
-        result = self._traded_pairs_cache.get(key)
-        if result:
-            return result
+    def _fetch_traded_pairs(self) -> List[TradedPair]:
         # TODO Get full names from another API like coinmarketcap.
         result = []
         for symbol in self._binance.get_exchange_info()['symbols']:
@@ -205,12 +236,77 @@ class BinanceApi(TradingExchange):
                                          base_full_name=symbol['quoteAsset'],
                                          to=symbol['baseAsset'],
                                          to_full_name=symbol['baseAsset']))
+        return result
+
+    def get_traded_pairs(self) -> List[TradedPair]:
+        return self._metadata_cache.get('{}_traded_pairs'.format(self.name),
+                                        self._fetch_traded_pairs,
+                                        decode=lambda pairs: list(map(TradedPair._make, pairs)))
+
+    @property
+    def trade_history_requires_pair(self) -> bool:
+        return True
 
-        self._traded_pairs_cache[key] = result
+    def get_trade_history(self, pair: Optional[str] = None,
+                          since: Optional[datetime] = None) -> List[ExchangeFill]:
+        assert pair is not None, "A pair is required to get the trade history from Binance."
+        # Limit of number of trades retrieved as specified in API docs.
+        max_limit = 1000
+        tp = self.get_traded_pair_index().get_by_name(pair)
+        result = []
+        params = dict(symbol=pair, limit=max_limit)
+        if since is not None:
+            params['startTime'] = self._to_ms(since)
+        while True:
+            trades = self._binance.get_my_trades(**params)
+            for trade in trades:
+                result.append(ExchangeFill(
+                    name=pair,
+                    exchange=self.name,
+                    id=str(trade['id']),
+                    date=self._from_ms(trade['time']),
+                    action_type='buy' if trade['isBuyer'] else 'sell',
+                    base=tp.base if tp is not None else None,
+                    to=tp.to if tp is not None else None,
+                    price=float(trade['price']),
+                    volume=float(trade['qty']),
+                    fee=float(trade['commission']),
+                    fee_asset=trade['commissionAsset'],
+                ))
+            if len(trades) < max_limit:
+                break
+            params = dict(symbol=pair, limit=max_limit, fromId=trades[-1]['id'] + 1)
         return result
 
-    def get_withdrawal_history(self) -> List[ExchangeTransfer]:
-        raise NotImplementedError
+    def get_withdrawal_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
+        result = []
+        params = dict()
+        if since is not None:
+            params['startTime'] = self._to_ms(since)
+        withdrawals = self._binance.get_withdraw_history(**params)
+        if isinstance(withdrawals, dict):
+            withdrawals = withdrawals.get('withdrawList') or []
+        for withdrawal in withdrawals:
+            # 6 means completed.
+            if withdrawal.get('status') != 6:
+                continue
+            apply_time = withdrawal['applyTime']
+            if isinstance(apply_time, str):
+                date = datetime.strptime(apply_time, '%Y-%m-%d %H:%M:%S')
+            else:
+                date = self._from_ms(apply_time)
+            fee = withdrawal.get('transactionFee')
+            result.append(ExchangeTransfer(
+                name=withdrawal['asset'] if 'asset' in withdrawal else withdrawal['coin'],
+                exchange=self.name,
+                amount=float(withdrawal['amount']),
+                transfer_cost=float(fee) if fee is not None else None,
+                date=date,
+                type='WITHDRAW',
+                destination=withdrawal.get('address'),
+                origin=None,
+            ))
+        return result
 
 
 if __name__ == '__main__':
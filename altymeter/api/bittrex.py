@@ -7,17 +7,19 @@ from logging import Logger
 from typing import List, Optional
 from urllib.parse import urlencode
 
+import numpy as np
 import pandas as pd
 import requests
-from expiringdict import ExpiringDict
 from injector import inject, singleton
 
-from altymeter.api.exchange import (ExchangeOpenOrder,
+from altymeter.api.exchange import (ExchangeFill,
+                                    ExchangeOpenOrder,
                                     ExchangeOrder,
                                     ExchangeTransfer,
                                     PairRecentStats,
                                     TradedPair,
                                     TradingExchange)
+from altymeter.api.metadata_cache import MetadataCache
 from altymeter.module.constants import Configuration
 
 
@@ -29,20 +31,21 @@ class BittrexApi(TradingExchange):
 
     _url_base = 'https://bittrex.com/api/v1.1/%s/%s?apikey=%s&nonce=%d'
 
-    _account_methods = {'getdeposithistory', 'getwithdrawalhistory'}
+    _account_methods = {'getdeposithistory', 'getorderhistory', 'getwithdrawalhistory'}
     _market_methods = {'buylimit', 'cancel', 'getopenorders', 'selllimit'}
 
     _date_format = '%Y-%m-%dT%H:%M:%S.%f'
 
     @inject
-    def __init__(self, config: Configuration, logger: Logger):
+    def __init__(self, config: Configuration, logger: Logger,
+                 metadata_cache: MetadataCache):
         self._logger = logger
 
         config = config['exchanges']['Bittrex']
         self._api_key = config['api key']
         self._api_secret = config['api secret']
 
-        self._traded_pairs_cache = ExpiringDict(max_len=1, max_age_seconds=24 * 60 * 60)
+        self._metadata_cache = metadata_cache
 
     @property
     def name(self):
@@ -80,39 +83,45 @@ class BittrexApi(TradingExchange):
     def collect_data(self, pair: str, since=None, sleep_time=90, stop_event=None):
         raise NotImplementedError()
 
-    def convert_actions(self, path: str) -> pd.DataFrame:
+    def convert_actions(self, path: str, chunk_size: int = 100000) -> pd.DataFrame:
         result = []
-        data = pd.read_csv(path,
-                           parse_dates=['Closed', 'Opened'],
-                           )
-        for row in data.itertuples():
-            from_currency, to_currency = row.Exchange.split('-')
-            if 'BUY' in row.Type:
-                price = row.Price + row.CommissionPaid
-                quantity = row.Quantity
-            elif 'SELL' in row.Type:
-                from_currency, to_currency = to_currency, from_currency
-                price = row.Quantity
-                quantity = row.Price + row.CommissionPaid
-            else:
-                raise ValueError(f"Invalid row type: {row.Type}\nfor row: {row}")
-            result.append({
-                'Date': row.Closed,
-                'Type': 'Trade',
-                'Quantity': quantity,
-                'Currency': to_currency,
-                'Exchange': self.name,
-                'Wallet': f'{to_currency} Wallet',
-                'Price': price,
-                'Currency.1': from_currency,
-                'Exchange.1': self.name,
-                'Wallet.1': f'{from_currency} Wallet',
-                'Disabled': None,
-            })
-
-        result = pd.DataFrame(result)
+        for data in pd.read_csv(path,
+                                parse_dates=['Closed', 'Opened'],
+                                dtype=dict(Exchange=str, Type=str,
+                                           Quantity=np.float64, Price=np.float64, CommissionPaid=np.float64),
+                                chunksize=chunk_size,
+                                ):
+            result.append(self._convert_actions(data))
+        if not result:
+            return pd.DataFrame()
+        result = pd.concat(result, ignore_index=True)
         return result
 
+    def _convert_actions(self, data: pd.DataFrame) -> pd.DataFrame:
+        currencies = data.Exchange.str.split('-', expand=True)
+        is_buy = data.Type.str.contains('BUY').to_numpy()
+        is_sell = data.Type.str.contains('SELL').to_numpy()
+        invalid = ~(is_buy | is_sell)
+        if invalid.any():
+            row = data[invalid].iloc[0]
+            raise ValueError(f"Invalid row type: {row.Type}\nfor row: {row}")
+        cost = (data.Price + data.CommissionPaid).to_numpy()
+        from_currency = np.where(is_buy, currencies[0], currencies[1])
+        to_currency = np.where(is_buy, currencies[1], currencies[0])
+        return pd.DataFrame({
+            'Date': data.Closed.to_numpy(),
+            'Type': 'Trade',
+            'Quantity': np.where(is_buy, data.Quantity, cost),
+            'Currency': to_currency,
+            'Exchange': self.name,
+            'Wallet': to_currency + ' Wallet',
+            'Price': np.where(is_buy, cost, data.Quantity),
+            'Currency.1': from_currency,
+            'Exchange.1': self.name,
+            'Wallet.1': from_currency + ' Wallet',
+            'Disabled': None,
+        })
+
     def create_order(self, pair: str,
                      action_type: str, order_type: str,
                      volume: float,
@@ -148,19 +157,28 @@ class BittrexApi(TradingExchange):
     def get_currencies(self):
         return self._request('getcurrencies')
 
-    def get_deposit_history(self) -> List:
+    def _parse_date(self, date: str) -> datetime:
+        # Fractions of seconds are not always given.
+        if '.' not in date:
+            date += '.0'
+        return datetime.strptime(date, self._date_format)
+
+    def get_deposit_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
         result = []
         deposits = self._request('getdeposithistory')
         deposits = deposits['result']
         for deposit in deposits:
             if deposit.get('Canceled', False) or not deposit.get('Authorized', True):
                 continue
+            date = self._parse_date(deposit['LastUpdated'])
+            if since is not None and date < since:
+                continue
             result.append(ExchangeTransfer(
                 name=deposit['Currency'],
                 exchange=self.name,
                 amount=deposit['Amount'],
                 transfer_cost=None,
-                date=datetime.strptime(deposit['LastUpdated'], self._date_format),
+                date=date,
                 type='DEPOSIT',
                 destination=deposit['CryptoAddress'],
                 origin=None
@@ -229,11 +247,7 @@ class BittrexApi(TradingExchange):
     def get_ticker(self, market):
         return self._request('getticker', dict(market=market))
 
-    def get_traded_pairs(self) -> List[TradedPair]:
-        key = 'traded_pairs'
-        result = self._traded_pairs_cache.get(key)
-        if result:
-            return result
+    def _fetch_traded_pairs(self) -> List[TradedPair]:
         result = []
         markets = self._request('getmarkets')
         for market in markets['result']:
@@ -245,22 +259,59 @@ class BittrexApi(TradingExchange):
                                          to=market['MarketCurrency'],
                                          to_full_name=market['MarketCurrencyLong']
                                          ))
-        self._traded_pairs_cache[key] = result
         return result
 
-    def get_withdrawal_history(self) -> List[ExchangeTransfer]:
+    def get_traded_pairs(self) -> List[TradedPair]:
+        return self._metadata_cache.get('{}_traded_pairs'.format(self.name),
+                                        self._fetch_traded_pairs,
+                                        decode=lambda pairs: list(map(TradedPair._make, pairs)))
+
+    def get_trade_history(self, pair: Optional[str] = None,
+                          since: Optional[datetime] = None) -> List[ExchangeFill]:
+        result = []
+        # All of the orders are returned at once.
+        params = dict(market=pair) if pair is not None else None
+        orders = self._request('getorderhistory', params)
+        orders = orders['result']
+        for order in orders:
+            volume = order['Quantity'] - order['QuantityRemaining']
+            if volume <= 0:
+                continue
+            date = self._parse_date(order.get('Closed') or order['TimeStamp'])
+            if since is not None and date < since:
+                continue
+            base, to = order['Exchange'].split('-')
+            result.append(ExchangeFill(
+                name=order['Exchange'],
+                exchange=self.name,
+                id=order['OrderUuid'],
+                date=date,
+                action_type='buy' if 'BUY' in order['OrderType'] else 'sell',
+                base=base,
+                to=to,
+                price=order['PricePerUnit'],
+                volume=volume,
+                fee=order['Commission'],
+                fee_asset=base,
+            ))
+        return result
+
+    def get_withdrawal_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
         result = []
         withdrawals = self._request('getwithdrawalhistory')
         withdrawals = withdrawals['result']
         for withdrawal in withdrawals:
             if withdrawal.get('Canceled', False) or not withdrawal.get('Authorized', True):
                 continue
+            date = self._parse_date(withdrawal['Opened'])
+            if since is not None and date < since:
+                continue
             result.append(ExchangeTransfer(
                 name=withdrawal['Currency'],
                 exchange=self.name,
                 amount=withdrawal['Amount'],
                 transfer_cost=withdrawal['TxCost'],
-                date=datetime.strptime(withdrawal['Opened'], self._date_format),
+                date=date,
                 type='WITHDRAW',
                 destination=withdrawal['Address'],
                 origin=None
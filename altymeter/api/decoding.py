@@ -0,0 +1,75 @@
+"""
+Decode payloads from exchanges straight into NumPy arrays and `TradeBatch`es.
+
+`orjson` is used to parse JSON when it is installed, otherwise the standard `json` module is used.
+"""
+import json
+from operator import itemgetter
+from typing import Any, Sequence, Union
+
+import numpy as np
+
+from altymeter.pricing import TradeBatch
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+level_dtype = np.dtype([
+    ('price', np.float64),
+    ('volume', np.float64),
+])
+"""
+The fields of a level of an order book in a structured array.
+"""
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _floats(values, count: int) -> np.ndarray:
+    # `float` parses numbers given as strings faster than NumPy does.
+    return np.fromiter(map(float, values), np.float64, count)
+
+
+def parse_kraken_trades(rows: Sequence[list]) -> TradeBatch:
+    """
+    :param rows: Trades from Kraken's public/Trades: [price, volume, time, side, type, misc, (id)].
+    """
+    count = len(rows)
+    return TradeBatch.from_columns(
+        price=_floats(map(itemgetter(0), rows), count),
+        amount=_floats(map(itemgetter(1), rows), count),
+        time=_floats(map(itemgetter(2), rows), count),
+        id=np.fromiter((row[6] if len(row) > 6 else -1 for row in rows), np.int64, count))
+
+
+def parse_binance_trades(rows: Sequence[dict]) -> TradeBatch:
+    """
+    :param rows: Trades from Binance's historicalTrades: {id, price, qty, time (ms), ...}.
+    """
+    count = len(rows)
+    return TradeBatch.from_columns(
+        price=_floats(map(itemgetter('price'), rows), count),
+        amount=_floats(map(itemgetter('qty'), rows), count),
+        time=_floats(map(itemgetter('time'), rows), count) / 1000,
+        id=np.fromiter(map(itemgetter('id'), rows), np.int64, count))
+
+
+def parse_depth_levels(levels: Sequence[list]) -> np.ndarray:
+    """
+    :param levels: Levels of an order book: [price, volume, ...].
+    :return: The levels with `level_dtype`.
+    """
+    count = len(levels)
+    result = np.empty(count, dtype=level_dtype)
+    result['price'] = _floats(map(itemgetter(0), levels), count)
+    result['volume'] = _floats(map(itemgetter(1), levels), count)
+    return result
@@ -1,6 +1,7 @@
 from abc import ABCMeta, abstractmethod
-from collections import namedtuple
-from typing import List, Optional
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
 
 
 class ExchangeOpenOrder(namedtuple('Order', [
@@ -43,6 +44,36 @@ class ExchangeOrder(namedtuple('Order', [
     """
 
 
+class ExchangeFill(namedtuple('ExchangeFill', [
+    'name',
+    'exchange',
+    'id',
+    'date',
+    'action_type',
+    'base',
+    'to',
+    'price',
+    'volume',
+    'fee',
+    'fee_asset',
+])):
+    """
+    A trade that was executed for one of your orders on an exchange.
+
+    :param name: The name of the pair traded (e.g. ETHCAD).
+    :param exchange: The name of the exchange (e.g. Kraken).
+    :param id: Identifies the trade on the exchange.
+    :param date: When the trade happened in UTC.
+    :param action_type: 'buy' to get `to` with `base` or 'sell' to get `base` with `to`.
+    :param base: The asset used to buy and obtained after selling (e.g. CAD). See `TradedPair`.
+    :param to: The asset obtained after buying and used to sell (e.g. ETH). See `TradedPair`.
+    :param price: The price in `base`.
+    :param volume: The amount of `to` traded.
+    :param fee: The fee paid.
+    :param fee_asset: The asset the fee was paid in.
+    """
+
+
 class ExchangeTransfer(namedtuple('ExchangeTransfer', [
     'name',
     'exchange',
@@ -103,6 +134,66 @@ class TradedPair(namedtuple('TradedPair', [
     """
 
 
+class TradedPairIndex(object):
+    """
+    Constant time lookups for the pairs traded on an exchange.
+
+    :param traded_pairs: The pairs traded on an exchange.
+    """
+
+    def __init__(self, traded_pairs: List[TradedPair]):
+        self._traded_pairs = traded_pairs
+        self._by_base_to = dict()
+        self._by_name = dict()
+        self._by_key = dict()
+        self._by_to = defaultdict(list)
+        self._by_to_full_name = defaultdict(list)
+        for tp in traded_pairs:
+            self._by_base_to[(tp.base, tp.to)] = tp
+            self._by_name[tp.name] = tp
+            self._by_key[tp.to + tp.base] = tp
+            self._by_to[tp.to].append(tp)
+            self._by_to_full_name[tp.to_full_name].append(tp)
+
+    @property
+    def traded_pairs(self) -> List[TradedPair]:
+        """
+        :return: The pairs that the index was built from.
+        """
+        return self._traded_pairs
+
+    def get(self, base: str, to: str) -> Optional[TradedPair]:
+        """
+        :return: The pair to buy `to` with `base` or `None` if it is not traded.
+        """
+        return self._by_base_to.get((base, to))
+
+    def get_by_name(self, name: str) -> Optional[TradedPair]:
+        """
+        :param name: The name of the pair on the exchange (e.g. ETHCAD).
+        """
+        return self._by_name.get(name)
+
+    def get_by_key(self, key: str) -> Optional[TradedPair]:
+        """
+        :param key: The `to` and `base` of the pair joined together.
+            Some exchanges use this instead of the name (e.g. XETHZCAD on Kraken).
+        """
+        return self._by_key.get(key)
+
+    def get_by_to(self, to: str) -> List[TradedPair]:
+        """
+        :return: The pairs that can be used to buy `to`.
+        """
+        return self._by_to.get(to, [])
+
+    def get_by_to_full_name(self, to_full_name: str) -> List[TradedPair]:
+        """
+        :return: The pairs that can be used to buy the asset with the full name `to_full_name`.
+        """
+        return self._by_to_full_name.get(to_full_name, [])
+
+
 class TradingExchange(metaclass=ABCMeta):
     @property
     @abstractmethod
@@ -113,6 +204,31 @@ class TradingExchange(metaclass=ABCMeta):
     def collect_data(self, pair: str, since=None, sleep_time=90, stop_event=None):
         raise NotImplementedError
 
+    def fetch_trades(self, pair: str, since=None) -> Tuple[list, Any]:
+        """
+        Get one page of the public trades for a pair.
+
+        :param pair: The pair to get trades for.
+        :param since: Where to start from as returned by the previous call or `None` for recent trades.
+        :return: The trades in the page as a `TradeBatch` (or a list of `Trade`s)
+            and the `since` to use to get the next page.
+        """
+        raise NotImplementedError
+
+    @property
+    def trades_page_size(self) -> Optional[int]:
+        """
+        The most trades that `fetch_trades` returns at once or `None` if it is not known.
+        """
+        return None
+
+    @property
+    def trades_calls_per_second(self) -> Optional[float]:
+        """
+        The most calls per second to make to `fetch_trades` for all pairs or `None` if it is not limited.
+        """
+        return None
+
     @abstractmethod
     def create_order(self, pair: str,
                      action_type: str,
@@ -123,7 +239,11 @@ class TradingExchange(metaclass=ABCMeta):
         raise NotImplementedError
 
     @abstractmethod
-    def get_deposit_history(self) -> List[ExchangeTransfer]:
+    def get_deposit_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
+        """
+        :param since: Only get deposits from this time in UTC.
+        :return: The deposits into the exchange.
+        """
         raise NotImplementedError
 
     @abstractmethod
@@ -142,10 +262,43 @@ class TradingExchange(metaclass=ABCMeta):
     def get_recent_stats(self, pair: str) -> PairRecentStats:
         raise NotImplementedError
 
+    def get_traded_pair_index(self) -> TradedPairIndex:
+        """
+        :return: An index of the result of `get_traded_pairs`.
+            It is only rebuilt when the traded pairs are refreshed.
+        """
+        traded_pairs = self.get_traded_pairs()
+        result = getattr(self, '_traded_pair_index', None)
+        if result is None or result.traded_pairs is not traded_pairs:
+            result = TradedPairIndex(traded_pairs)
+            self._traded_pair_index = result
+        return result
+
     @abstractmethod
     def get_traded_pairs(self) -> List[TradedPair]:
         raise NotImplementedError
 
+    def get_trade_history(self, pair: Optional[str] = None,
+                          since: Optional[datetime] = None) -> List[ExchangeFill]:
+        """
+        :param pair: The pair to get trades for.
+            Some exchanges require a pair, others get the trades for all pairs if it is `None`.
+        :param since: Only get trades from this time in UTC.
+        :return: Your trades on the exchange.
+        """
+        raise NotImplementedError
+
+    @property
+    def trade_history_requires_pair(self) -> bool:
+        """
+        :return: `True` if `get_trade_history` needs a pair.
+        """
+        return False
+
     @abstractmethod
-    def get_withdrawal_history(self) -> List[ExchangeTransfer]:
+    def get_withdrawal_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
+        """
+        :param since: Only get withdrawals from this time in UTC.
+        :return: The withdrawals from the exchange.
+        """
         raise NotImplementedError
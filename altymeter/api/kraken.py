@@ -5,22 +5,26 @@ import logging
 import threading
 import time
 from base64 import b64decode, b64encode
+from datetime import datetime, timezone
 from logging import Logger
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urlencode
 
 import requests
-from expiringdict import ExpiringDict
 from injector import inject, singleton
 from tqdm import tqdm
 
-from altymeter.api.exchange import (ExchangeOpenOrder,
+from altymeter.api import decoding
+from altymeter.api.exchange import (ExchangeFill,
+                                    ExchangeOpenOrder,
                                     ExchangeTransfer,
                                     PairRecentStats,
                                     TradedPair,
                                     TradingExchange)
+from altymeter.api.metadata_cache import MetadataCache
+from altymeter.api.poll_schedule import get_span_seconds, PollSchedule
 from altymeter.module.constants import Configuration
-from altymeter.pricing import PriceData, Trade
+from altymeter.pricing import PriceData, TradeBatch
 
 
 @singleton
@@ -32,9 +36,16 @@ class KrakenApi(TradingExchange):
     _url_base = 'https://api.kraken.com'
     _api_version = '0'
 
+    # Kraken's names for assets that have more common symbols.
+    _standard_symbols = {
+        'XBT': 'BTC',
+        'XDG': 'DOGE',
+    }
+
     @inject
     def __init__(self, config: Configuration,
                  logger: Logger,
+                 metadata_cache: MetadataCache,
                  price_data: PriceData,
                  ):
         config = config['exchanges']['Kraken']
@@ -44,7 +55,7 @@ class KrakenApi(TradingExchange):
         self._logger = logger
         self._price_data = price_data
 
-        self._traded_pairs_cache = ExpiringDict(max_len=1, max_age_seconds=24 * 60 * 60)
+        self._metadata_cache = metadata_cache
 
     @property
     def name(self):
@@ -89,7 +100,7 @@ class KrakenApi(TradingExchange):
                           },
                           timeout=timeout)
         r.raise_for_status()
-        result = r.json()
+        result = decoding.loads(r.content)
         if self._logger.isEnabledFor(logging.DEBUG):
             resp_str = json.dumps(result, indent=2)
             if len(resp_str) < 200:
@@ -102,8 +113,35 @@ class KrakenApi(TradingExchange):
     def cancel(self, transaction_id):
         return self._request('private/CancelOrder', dict(txid=transaction_id))
 
+    @property
+    def trades_page_size(self) -> Optional[int]:
+        return 1000
+
+    @property
+    def trades_calls_per_second(self) -> Optional[float]:
+        # Public calls are limited to about 1 per second.
+        return 1
+
+    def fetch_trades(self, pair: str, since=None) -> Tuple[TradeBatch, Optional[str]]:
+        r = self._get_market_history(pair, since)
+        pair_result = r.get('result')
+        pair_trades = pair_result.get(pair)
+        if pair_trades is None:
+            # Trades could be under another key.
+            for key, val in pair_result.items():
+                if key != 'last':
+                    pair_trades = val
+                    break
+
+        trades = decoding.parse_kraken_trades(pair_trades or [])
+        return trades, pair_result.get('last', since)
+
     def collect_data(self, pair: str, since: int = None, sleep_time=90, stop_event: threading.Event = None):
         self._logger.info("Collecting data for %s since %s.", pair, since)
+        # Wait at most `sleep_time` between polls and less for busy pairs.
+        schedule = PollSchedule(self.trades_page_size,
+                                min_seconds=min(1 / self.trades_calls_per_second, sleep_time),
+                                max_seconds=sleep_time, default_seconds=sleep_time)
         with tqdm(desc="Collecting data for %s" % pair,
                   unit=" trades", unit_scale=True) as progress_bar:
             while True:
@@ -111,30 +149,16 @@ class KrakenApi(TradingExchange):
                     self._logger.info("Got signal to stop collecting %s.", pair)
                     break
                 try:
-                    r = self._get_market_history(pair, since)
-                    pair_result = r.get('result')
-                    pair_trades = pair_result.get(pair)
-                    if pair_trades is None:
-                        # Trades could be under another key.
-                        for key, val in pair_result.items():
-                            if key != 'last':
-                                pair_trades = val
-                                break
-
-                    if pair_trades:
-                        trades = []
-                        for trade in pair_trades:
-                            price = float(trade[0])
-                            amount = float(trade[1])
-                            trade_time = trade[2]
-                            trades.append(Trade(price, amount, trade_time))
+                    poll_time = time.time()
+                    trades, since = self.fetch_trades(pair, since)
+                    if len(trades) > 0:
                         # Note that duplicate data will fail to insert here but it's okay
                         # because eventually new trades will be found soon.
                         # Even if `since` is specified, the API ignores very old `since` values.
                         self._price_data.add_prices(pair, trades)
                         progress_bar.update(len(trades))
-                    since = pair_result.get('last')
-                    time.sleep(sleep_time)
+                    schedule.observe(len(trades), get_span_seconds(trades), poll_time)
+                    time.sleep(schedule.get_interval())
                 except:
                     self._logger.exception("Error getting trades.")
                     time.sleep(sleep_time / 3)
@@ -168,8 +192,54 @@ class KrakenApi(TradingExchange):
     def get_currencies(self):
         raise NotImplementedError
 
-    def get_deposit_history(self) -> List[ExchangeTransfer]:
-        raise NotImplementedError
+    def _get_pages(self, method: str, key: str, data: dict) -> Iterator[Tuple[str, dict]]:
+        """
+        Page through a private history method.
+
+        :param method: The method to call.
+        :param key: The key in the result with entries by their id.
+        :param data: The parameters for the method.
+        :return: The ids of the entries and the entries.
+        """
+        offset = 0
+        while True:
+            r = self._request(method, dict(data, ofs=offset), timeout=15)
+            result = r.get('result') or {}
+            entries = result.get(key) or {}
+            yield from entries.items()
+            offset += len(entries)
+            if len(entries) == 0 or offset >= int(result.get('count', 0)):
+                break
+
+    @staticmethod
+    def _to_timestamp(date: Optional[datetime]) -> Optional[float]:
+        if date is None:
+            return None
+        return date.replace(tzinfo=timezone.utc).timestamp()
+
+    @staticmethod
+    def _from_timestamp(time_in_s: float) -> datetime:
+        return datetime.fromtimestamp(time_in_s, timezone.utc).replace(tzinfo=None)
+
+    def _get_transfers(self, transfer_type: str, since: Optional[datetime]) -> List[ExchangeTransfer]:
+        result = []
+        ledger_type = 'deposit' if transfer_type == 'DEPOSIT' else 'withdrawal'
+        for entry_id, entry in self._get_pages('private/Ledgers', 'ledger',
+                                               dict(type=ledger_type, start=self._to_timestamp(since))):
+            result.append(ExchangeTransfer(
+                name=self.get_asset_symbol(entry['asset']),
+                exchange=self.name,
+                amount=abs(float(entry['amount'])),
+                transfer_cost=float(entry['fee']),
+                date=self._from_timestamp(entry['time']),
+                type=transfer_type,
+                destination=None,
+                origin=None,
+            ))
+        return result
+
+    def get_deposit_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
+        return self._get_transfers('DEPOSIT', since)
 
     def get_markets(self):
         raise NotImplementedError
@@ -187,19 +257,19 @@ class KrakenApi(TradingExchange):
         orders = self._request('public/Depth', data, timeout=7)
         for order_dict in orders['result'].values():
             if order_type != 'bid':
-                for order in order_dict['asks']:
+                for price, volume in decoding.parse_depth_levels(order_dict['asks']).tolist():
                     result.append(ExchangeOpenOrder(
                         pair, self.name,
-                        price=float(order[0]),
-                        volume=float(order[1]),
+                        price=price,
+                        volume=volume,
                         order_type='ask'
                     ))
             if order_type != 'ask':
-                for order in order_dict['bids']:
+                for price, volume in decoding.parse_depth_levels(order_dict['bids']).tolist():
                     result.append(ExchangeOpenOrder(
                         pair, self.name,
-                        price=float(order[0]),
-                        volume=float(order[1]),
+                        price=price,
+                        volume=volume,
                         order_type='bid'
                     ))
 
@@ -211,10 +281,9 @@ class KrakenApi(TradingExchange):
         if result is None:
             assert base is not None and to is not None
             # Kraken has tricky combination rules with fiat currencies so it's easiest to just check all pairs.
-            for tp in self.get_traded_pairs():
-                if tp.base == base and tp.to == to:
-                    result = tp.name
-                    break
+            tp = self.get_traded_pair_index().get(base, to)
+            if tp is not None:
+                result = tp.name
         else:
             assert base is None and to is None
         return result
@@ -225,11 +294,7 @@ class KrakenApi(TradingExchange):
     def get_ticker(self, market):
         raise NotImplementedError
 
-    def get_traded_pairs(self) -> List[TradedPair]:
-        key = 'traded_pairs'
-        result = self._traded_pairs_cache.get(key)
-        if result:
-            return result
+    def _fetch_traded_pairs(self) -> List[TradedPair]:
         result = []
         markets = self._request('public/AssetPairs', timeout=15)
         markets = markets.get('result') or []
@@ -242,11 +307,61 @@ class KrakenApi(TradingExchange):
                 to=market.get('base'),
                 to_full_name=market.get('base'),
             ))
-        self._traded_pairs_cache[key] = result
         return result
 
-    def get_withdrawal_history(self) -> List[ExchangeTransfer]:
-        raise NotImplementedError
+    def _fetch_asset_symbols(self) -> Dict[str, str]:
+        assets = self._request('public/Assets', timeout=15)
+        assets = assets.get('result') or {}
+        return {code: self._standard_symbols.get(asset['altname'], asset['altname'])
+                for code, asset in assets.items()}
+
+    def get_asset_symbol(self, code: str) -> str:
+        """
+        :param code: Kraken's code for an asset (e.g. XXBT or ZCAD).
+        :return: The common symbol for the asset (e.g. BTC or CAD).
+        """
+        symbols = self._metadata_cache.get('{}_asset_symbols'.format(self.name), self._fetch_asset_symbols)
+        result = symbols.get(code)
+        if result is None:
+            # Older assets have an X (or Z for fiat) in front of their names.
+            result = code[1:] if len(code) == 4 and code[0] in 'XZ' else code
+            result = self._standard_symbols.get(result, result)
+        return result
+
+    def get_traded_pairs(self) -> List[TradedPair]:
+        return self._metadata_cache.get('{}_traded_pairs'.format(self.name),
+                                        self._fetch_traded_pairs,
+                                        decode=lambda pairs: list(map(TradedPair._make, pairs)))
+
+    def get_trade_history(self, pair: Optional[str] = None,
+                          since: Optional[datetime] = None) -> List[ExchangeFill]:
+        result = []
+        traded_pairs = self.get_traded_pair_index()
+        for trade_id, trade in self._get_pages('private/TradesHistory', 'trades',
+                                               dict(start=self._to_timestamp(since))):
+            # Trades use the key of the pair (e.g. XETHZCAD) instead of the name (e.g. ETHCAD).
+            tp = traded_pairs.get_by_key(trade['pair']) or traded_pairs.get_by_name(trade['pair'])
+            if pair is not None and (tp is None or tp.name != pair) and trade['pair'] != pair:
+                continue
+            base = self.get_asset_symbol(tp.base) if tp is not None else None
+            result.append(ExchangeFill(
+                name=tp.name if tp is not None else trade['pair'],
+                exchange=self.name,
+                id=trade_id,
+                date=self._from_timestamp(trade['time']),
+                action_type=trade['type'],
+                base=base,
+                to=self.get_asset_symbol(tp.to) if tp is not None else None,
+                price=float(trade['price']),
+                volume=float(trade['vol']),
+                fee=float(trade['fee']),
+                # Fees are in the quote currency.
+                fee_asset=base,
+            ))
+        return result
+
+    def get_withdrawal_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
+        return self._get_transfers('WITHDRAW', since)
 
 
 if __name__ == '__main__':
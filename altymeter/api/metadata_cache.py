@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from logging import Logger
+from typing import Any, Callable, Optional
+
+from injector import inject, singleton
+
+from altymeter.module.constants import Configuration, user_dir
+
+
+@singleton
+class MetadataCache(object):
+    """
+    Metadata from exchanges (e.g. the pairs that are traded) that is persisted in the user's directory
+    so that it does not need to be downloaded every time a process starts.
+
+    Values older than `max age seconds` are still returned right away while they get refreshed on a background thread.
+    Values older than `max stale seconds` are fetched again before returning.
+    """
+
+    @inject
+    def __init__(self, config: Configuration,
+                 logger: Logger):
+        self._logger = logger
+
+        cache_config = config.get('metadata cache') or {}
+        self._dir = os.path.expanduser(cache_config.get('path') or os.path.join(user_dir, 'cache'))
+        self._max_age_s = cache_config.get('max age seconds', 24 * 60 * 60)
+        self._max_stale_s = cache_config.get('max stale seconds', 7 * 24 * 60 * 60)
+
+        self._lock = threading.Lock()
+        # Maps keys to (time saved in seconds, decoded value).
+        self._entries = dict()
+        self._refreshing = set()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self._dir, '{}.json'.format(key))
+
+    def _load(self, key: str, decode: Optional[Callable[[Any], Any]]):
+        path = self._get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+            value = saved['value']
+            if decode is not None:
+                value = decode(value)
+            return saved['time'], value
+        except:
+            self._logger.exception("Error loading `%s`. It will be fetched again.", path)
+            return None
+
+    def _save(self, key: str, value, saved_time: float):
+        path = self._get_path(key)
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(time=saved_time, value=value), f)
+            os.replace(tmp_path, path)
+        except:
+            self._logger.exception("Error saving `%s`.", path)
+
+    def _fetch(self, key: str, fetch: Callable[[], Any]):
+        value = fetch()
+        saved_time = time.time()
+        self._save(key, value, saved_time)
+        with self._lock:
+            self._entries[key] = (saved_time, value)
+        return value
+
+    def _refresh(self, key: str, fetch: Callable[[], Any]):
+        try:
+            self._fetch(key, fetch)
+            self._logger.debug("Refreshed `%s`.", key)
+        except:
+            self._logger.exception("Error refreshing `%s`. The stale value will be kept.", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key: str, fetch: Callable[[], Any],
+            decode: Optional[Callable[[Any], Any]] = None):
+        """
+        :param key: Identifies the value. Used in the file name.
+        :param fetch: Gets a new value. The value must be JSON serializable (namedtuples are saved as lists).
+        :param decode: Converts the value loaded from JSON back to what `fetch` returns.
+        :return: The cached value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key, decode)
+            if entry is not None:
+                with self._lock:
+                    entry = self._entries.setdefault(key, entry)
+
+        if entry is None:
+            return self._fetch(key, fetch)
+
+        saved_time, value = entry
+        age_s = time.time() - saved_time
+        if age_s > self._max_stale_s:
+            return self._fetch(key, fetch)
+        if age_s > self._max_age_s:
+            with self._lock:
+                is_refreshing = key in self._refreshing
+                self._refreshing.add(key)
+            if not is_refreshing:
+                thread = threading.Thread(target=self._refresh, args=(key, fetch),
+                                          name='refresh_{}'.format(key),
+                                          daemon=True)
+                thread.start()
+        return value
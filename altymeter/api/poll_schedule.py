@@ -0,0 +1,149 @@
+import math
+import time
+from typing import Optional, Sequence
+
+
+def get_span_seconds(trades: Sequence) -> Optional[float]:
+    """
+    :param trades: `Trade`s or a `TradeBatch` sorted by time.
+    :return: The time between the first and the last trade or `None` if there are not enough trades.
+    """
+    if len(trades) < 2:
+        return None
+    return trades[-1].time - trades[0].time
+
+
+class PollSchedule(object):
+    """
+    Chooses when to poll a pair for new trades.
+
+    The arrival rate of trades is estimated with an exponentially weighted moving average (EWMA)
+    and the next poll is set so that the expected number of new trades fills `target_fill` of a page.
+    Busy pairs are polled before their pages overflow and quiet pairs are polled rarely.
+
+    :param page_size: The most trades that a poll returns or `None` if it is not known.
+    :param target_fill: The fraction of a page that should be filled by each poll.
+    :param min_seconds: The shortest time between polls.
+    :param max_seconds: The longest time between polls.
+    :param default_seconds: The time between polls when the rate cannot be used to decide.
+    :param half_life_seconds: How long until an observation has half of its weight.
+    """
+
+    def __init__(self, page_size: Optional[int],
+                 target_fill: float = 0.5,
+                 min_seconds: float = 1,
+                 max_seconds: float = 10 * 60,
+                 default_seconds: float = 60,
+                 half_life_seconds: float = 10 * 60):
+        assert 0 < target_fill <= 1
+        assert 0 < min_seconds <= max_seconds
+        self._page_size = page_size
+        self._target_fill = target_fill
+        self._min_seconds = min_seconds
+        self._max_seconds = max_seconds
+        self._default_seconds = min(max(default_seconds, min_seconds), max_seconds)
+        self._half_life_seconds = half_life_seconds
+
+        self._rate: Optional[float] = None
+        self._is_behind = False
+        self._last_poll_time: Optional[float] = None
+
+    @property
+    def rate(self) -> Optional[float]:
+        """
+        The estimated number of trades per second or `None` if nothing was observed yet.
+        """
+        return self._rate
+
+    def observe(self, num_trades: int, span_seconds: Optional[float] = None, poll_time: Optional[float] = None):
+        """
+        Update the estimated rate with the result of a poll.
+
+        :param num_trades: The number of trades returned.
+        :param span_seconds: The time between the first and the last trades returned.
+        :param poll_time: When the poll was made. Defaults to now.
+        """
+        if poll_time is None:
+            poll_time = time.time()
+        prev_poll_time, self._last_poll_time = self._last_poll_time, poll_time
+        self._is_behind = self._page_size is not None and num_trades >= self._page_size
+        if self._is_behind or prev_poll_time is None:
+            # The trades are not only the ones since the previous poll so use the time that they cover.
+            elapsed_seconds = span_seconds
+        else:
+            elapsed_seconds = poll_time - prev_poll_time
+        if not elapsed_seconds or elapsed_seconds <= 0:
+            return
+        observed = num_trades / elapsed_seconds
+        if self._rate is None:
+            self._rate = observed
+        else:
+            weight = 1 - math.pow(2, -elapsed_seconds / self._half_life_seconds)
+            self._rate += weight * (observed - self._rate)
+        if self._is_behind:
+            # A full page only shows a lower bound for the rate.
+            self._rate = max(self._rate, observed)
+
+    def get_interval(self) -> float:
+        """
+        :return: The number of seconds to wait before the next poll.
+        """
+        if self._is_behind:
+            # More trades are waiting.
+            return self._min_seconds
+        if self._page_size is None or self._rate is None:
+            return self._default_seconds
+        if self._rate <= 0:
+            return self._max_seconds
+        result = self._target_fill * self._page_size / self._rate
+        return min(max(result, self._min_seconds), self._max_seconds)
+
+
+class RateBudget(object):
+    """
+    Keeps polls of an exchange within a number of calls per second.
+
+    Pairs report how often they want to be polled. When the total is over the budget,
+    every pair's interval is stretched by the same factor.
+    Calls should also be spaced out with `next_call_time` so that bursts stay within the budget.
+
+    :param calls_per_second: The most calls per second to make or `None` for no limit.
+    """
+
+    def __init__(self, calls_per_second: Optional[float]):
+        self._calls_per_second = calls_per_second
+        self._demands = dict()
+        self._total_demand = 0.
+        self._next_call_time = 0.
+
+    def get_interval(self, key, interval: float) -> float:
+        """
+        :param key: Identifies the pair.
+        :param interval: The number of seconds that the pair would like to wait before its next poll.
+        :return: The number of seconds to wait so that all of the pairs stay within the budget.
+        """
+        demand = 1 / interval
+        self._total_demand += demand - self._demands.get(key, 0)
+        self._demands[key] = demand
+        if self._calls_per_second is None or self._total_demand <= self._calls_per_second:
+            return interval
+        return interval * self._total_demand / self._calls_per_second
+
+    def remove(self, key):
+        self._total_demand -= self._demands.pop(key, 0)
+
+    @property
+    def next_call_time(self) -> float:
+        """
+        The earliest time that the next call can be made.
+        """
+        return self._next_call_time
+
+    def add_call(self, now: Optional[float] = None):
+        """
+        Record that a call is being made.
+        """
+        if now is None:
+            now = time.time()
+        if self._calls_per_second is not None:
+            self._next_call_time = max(now, self._next_call_time) + 1 / self._calls_per_second
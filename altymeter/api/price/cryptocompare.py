@@ -1,5 +1,6 @@
 import socket
 from logging import Logger
+from typing import Dict, List, Optional
 
 import requests
 from injector import inject, singleton
@@ -9,6 +10,11 @@ from altymeter.module.constants import Configuration
 
 @singleton
 class CryptoCompareApi(object):
+    max_hours_per_request = 2000
+    """
+    The most hours that the API returns in one request.
+    """
+
     @inject
     def __init__(self, config: Configuration,
                  logger: Logger):
@@ -17,13 +23,18 @@ class CryptoCompareApi(object):
 
         self._metric_keys = ['close', 'high', 'low', 'open']
 
-    def get_hour_value(self, symbol: str, fiat_symbol: str, time_in_s: float) -> float:
+    def _get_entry_value(self, entry: dict) -> float:
+        return sum([entry[key] for key in self._metric_keys]) / 4
+
+    def _get_hour_data(self, symbol: str, fiat_symbol: str, time_in_s: int, limit: int) -> List[dict]:
+        """
+        :return: The entries for the `limit + 1` hours up to and including the hour of `time_in_s`.
+        """
         app_name = f'{socket.gethostname()}-altymeter'
-        time_in_s = int(time_in_s)
         params = {
             'fsym': symbol,
             'tsym': fiat_symbol,
-            'limit': 1,
+            'limit': limit,
             'aggregate': 1,
             'toTs': time_in_s,
             'extraParams': app_name,
@@ -32,10 +43,41 @@ class CryptoCompareApi(object):
         r.raise_for_status()
         response = r.json()
         assert response['Response'] == 'Success', response
-        data = response['Data']
-        assert len(data) > 0
+        return response['Data']
+
+    def get_hour_value(self, symbol: str, fiat_symbol: str, time_in_s: float) -> Optional[float]:
+        """
+        :return: The value at the hour of `time_in_s` or `None` if there is no data for it.
+        """
+        time_in_s = int(time_in_s)
+        data = self._get_hour_data(symbol, fiat_symbol, time_in_s, limit=1)
+        if not data:
+            return None
         last_entry = data[-1]
-        result = sum([last_entry[key] for key in self._metric_keys]) / 4
+        result = self._get_entry_value(last_entry)
+        return result
+
+    def get_hour_values(self, symbol: str, fiat_symbol: str,
+                        start_time_in_s: int, end_time_in_s: int) -> Dict[int, float]:
+        """
+        Get the values for a range of hours using as few requests as possible.
+
+        :param start_time_in_s: The start of the first hour.
+        :param end_time_in_s: The start of the last hour.
+        :return: Maps the start of each hour in the range to the value at that hour.
+        """
+        result = dict()
+        to_time_in_s = int(end_time_in_s)
+        while to_time_in_s >= start_time_in_s:
+            limit = min(self.max_hours_per_request, int((to_time_in_s - start_time_in_s) / 3600))
+            # Ask for at least 1 hour back because the API can return nothing for a limit of 0.
+            data = self._get_hour_data(symbol, fiat_symbol, to_time_in_s, limit=max(1, limit))
+            if not data:
+                break
+            for entry in data:
+                if start_time_in_s <= entry['time'] <= end_time_in_s:
+                    result[entry['time']] = self._get_entry_value(entry)
+            to_time_in_s -= (limit + 1) * 3600
         return result
 
 
@@ -1,4 +1,5 @@
 import os
+from datetime import datetime
 from logging import Logger
 from typing import List, Optional
 
@@ -40,91 +41,93 @@ class QuadrigaCxApi(TradingExchange):
     def collect_data(self, pair: str, since=None, sleep_time=90, stop_event=None):
         raise NotImplementedError
 
-    def convert_actions(self, dir_path: str) -> pd.DataFrame:
+    def convert_actions(self, dir_path: str, chunk_size: int = 100000) -> pd.DataFrame:
         result = []
         for path in os.listdir(dir_path):
             path = os.path.join(dir_path, path)
-            data = pd.read_csv(path,
-                               parse_dates=['datetime'],
-                               )
-
             if 'fundings' in path:
-                net_amount_index = data.columns.get_loc('net amount') + 1
-                for row in data.itertuples():
-                    quantity = row.gross
-                    if np.isnan(quantity):
-                        quantity = row[net_amount_index]
-                    if isinstance(row.address, str):
-                        wallet = row.address
-                        from_exchange = 'Local Wallet'
-                    else:
-                        wallet = None
-                        from_exchange = None
-                    currency = row.currency.upper()
-                    result.append({
-                        'Date': row.datetime,
-                        'Type': 'Transfer',
-                        'Quantity': quantity,
-                        'Currency': currency,
-                        'Exchange': from_exchange,
-                        'Wallet': wallet,
-                        'Price': quantity,
-                        'Currency.1': currency,
-                        'Exchange.1': self.name,
-                        'Wallet.1': None,
-                        'Disabled': None,
-                    })
+                convert = self._convert_fundings
             elif 'trades' in path:
-                for row in data.itertuples():
-                    if row.type == 'buy':
-                        from_currency = row.minor.upper()
-                        to_currency = row.major.upper()
-                        price = row.value
-                    elif row.type == 'sell':
-                        from_currency = row.major.upper()
-                        to_currency = row.minor.upper()
-                        price = row.amount
-                    else:
-                        raise ValueError(f"Invalid row type: {row.type}\nfor row: {row}")
-                    result.append({
-                        'Date': row.datetime,
-                        'Type': 'Trade',
-                        'Quantity': row.total,
-                        'Currency': to_currency,
-                        'Exchange': self.name,
-                        'Wallet': f'{to_currency} Wallet',
-                        'Price': price,
-                        'Currency.1': from_currency,
-                        'Exchange.1': self.name,
-                        'Wallet.1': f'{from_currency} Wallet',
-                        'Disabled': None,
-                    })
+                convert = self._convert_trades
             elif 'withdrawals' in path:
-                for row in data.itertuples():
-                    if isinstance(row.address, str):
-                        wallet = row.address
-                        to_exchange = 'Local Wallet'
-                    else:
-                        wallet = None
-                        to_exchange = None
-                    currency = row.currency.upper()
-                    result.append({
-                        'Date': row.datetime,
-                        'Type': 'Transfer',
-                        'Quantity': row.amount,
-                        'Currency': currency,
-                        'Exchange': self.name,
-                        'Wallet': f'{currency} Wallet',
-                        'Price': row.amount,
-                        'Currency.1': currency,
-                        'Exchange.1': to_exchange,
-                        'Wallet.1': wallet,
-                        'Disabled': None,
-                    })
-
-        result = pd.DataFrame(result)
+                convert = self._convert_withdrawals
+            else:
+                continue
+            # Explicit types so that columns such as `address` do not change type when a chunk has no values.
+            for data in pd.read_csv(path,
+                                    parse_dates=['datetime'],
+                                    dtype={'address': str, 'currency': str, 'type': str, 'major': str, 'minor': str,
+                                           'amount': np.float64, 'gross': np.float64, 'net amount': np.float64,
+                                           'total': np.float64, 'value': np.float64},
+                                    chunksize=chunk_size,
+                                    ):
+                result.append(convert(data))
+
+        if not result:
+            return pd.DataFrame()
+        result = pd.concat(result, ignore_index=True)
         return result
 
+    def _convert_fundings(self, data: pd.DataFrame) -> pd.DataFrame:
+        quantity = data.gross.fillna(data['net amount']).to_numpy()
+        has_address = data.address.map(lambda address: isinstance(address, str)).to_numpy(dtype=bool)
+        currency = data.currency.str.upper().to_numpy()
+        return pd.DataFrame({
+            'Date': data.datetime.to_numpy(),
+            'Type': 'Transfer',
+            'Quantity': quantity,
+            'Currency': currency,
+            'Exchange': np.where(has_address, 'Local Wallet', None),
+            'Wallet': np.where(has_address, data.address, None),
+            'Price': quantity,
+            'Currency.1': currency,
+            'Exchange.1': self.name,
+            'Wallet.1': None,
+            'Disabled': None,
+        })
+
+    def _convert_trades(self, data: pd.DataFrame) -> pd.DataFrame:
+        is_buy = (data.type == 'buy').to_numpy()
+        is_sell = (data.type == 'sell').to_numpy()
+        invalid = ~(is_buy | is_sell)
+        if invalid.any():
+            row = data[invalid].iloc[0]
+            raise ValueError(f"Invalid row type: {row.type}\nfor row: {row}")
+        major = data.major.str.upper()
+        minor = data.minor.str.upper()
+        from_currency = np.where(is_buy, minor, major)
+        to_currency = np.where(is_buy, major, minor)
+        return pd.DataFrame({
+            'Date': data.datetime.to_numpy(),
+            'Type': 'Trade',
+            'Quantity': data.total.to_numpy(),
+            'Currency': to_currency,
+            'Exchange': self.name,
+            'Wallet': to_currency + ' Wallet',
+            'Price': np.where(is_buy, data.value, data.amount),
+            'Currency.1': from_currency,
+            'Exchange.1': self.name,
+            'Wallet.1': from_currency + ' Wallet',
+            'Disabled': None,
+        })
+
+    def _convert_withdrawals(self, data: pd.DataFrame) -> pd.DataFrame:
+        has_address = data.address.map(lambda address: isinstance(address, str)).to_numpy(dtype=bool)
+        currency = data.currency.str.upper().to_numpy()
+        return pd.DataFrame({
+            'Date': data.datetime.to_numpy(),
+            'Type': 'Transfer',
+            'Quantity': data.amount.to_numpy(),
+            'Currency': currency,
+            'Exchange': self.name,
+            'Wallet': currency + ' Wallet',
+            'Price': data.amount.to_numpy(),
+            'Currency.1': currency,
+            'Exchange.1': np.where(has_address, 'Local Wallet', None),
+            'Wallet.1': np.where(has_address, data.address, None),
+            'Disabled': None,
+        })
+
     def create_order(self, pair: str,
                      action_type: str,
                      order_type: str,
@@ -133,7 +136,7 @@ class QuadrigaCxApi(TradingExchange):
                      **kwargs) -> ExchangeOrder:
         raise NotImplementedError
 
-    def get_deposit_history(self) -> List[ExchangeTransfer]:
+    def get_deposit_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
         raise NotImplementedError
 
     def get_order_book(self, pair: Optional[str] = None,
@@ -152,7 +155,7 @@ class QuadrigaCxApi(TradingExchange):
     def get_traded_pairs(self) -> List[TradedPair]:
         raise NotImplementedError
 
-    def get_withdrawal_history(self) -> List[ExchangeTransfer]:
+    def get_withdrawal_history(self, since: Optional[datetime] = None) -> List[ExchangeTransfer]:
         raise NotImplementedError
 
 
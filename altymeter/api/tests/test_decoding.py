@@ -0,0 +1,27 @@
+import unittest
+
+import numpy as np
+
+from altymeter.api import decoding
+from altymeter.pricing import Trade
+
+
+class TestDecoding(unittest.TestCase):
+    def test_parse_kraken_trades(self):
+        rows = decoding.loads(b'[["0.1", "2.5", 1518214842.1, "b", "l", ""],'
+                              b' ["0.2", "1", 1518214843, "s", "m", "", 7]]')
+        trades = decoding.parse_kraken_trades(rows)
+        self.assertEqual([Trade(0.1, 2.5, 1518214842.1), Trade(0.2, 1, 1518214843)], trades)
+        self.assertEqual([-1, 7], trades.id.tolist())
+        self.assertEqual(0, len(decoding.parse_kraken_trades([])))
+
+    def test_parse_binance_trades(self):
+        rows = [dict(id=3, price='0.1', qty='2.5', time=1518214842100, isBuyerMaker=True)]
+        trades = decoding.parse_binance_trades(rows)
+        self.assertEqual([Trade(0.1, 2.5, 1518214842.1)], trades)
+        self.assertEqual([3], trades.id.tolist())
+
+    def test_parse_depth_levels(self):
+        levels = decoding.parse_depth_levels([['1.5', '2', 1518214842], ['1.4', '3', 1518214843]])
+        np.testing.assert_equal([1.5, 1.4], levels['price'])
+        np.testing.assert_equal([2, 3], levels['volume'])
@@ -0,0 +1,22 @@
+import unittest
+
+from altymeter.api.exchange import TradedPair, TradedPairIndex
+
+
+class TestTradedPairIndex(unittest.TestCase):
+    def test_lookups(self):
+        eth_btc = TradedPair('ETHBTC', 'Test', base='BTC', base_full_name='Bitcoin', to='ETH', to_full_name='Ethereum')
+        eth_usd = TradedPair('ETHUSD', 'Test', base='USD', base_full_name='USD', to='ETH', to_full_name='Ethereum')
+        xrp_btc = TradedPair('XRPBTC', 'Test', base='BTC', base_full_name='Bitcoin', to='XRP', to_full_name='Ripple')
+        index = TradedPairIndex([eth_btc, eth_usd, xrp_btc])
+
+        self.assertEqual(eth_btc, index.get('BTC', 'ETH'))
+        self.assertIsNone(index.get('ETH', 'BTC'))
+        self.assertEqual(xrp_btc, index.get_by_name('XRPBTC'))
+        self.assertIsNone(index.get_by_name('BTCXRP'))
+        self.assertEqual(xrp_btc, index.get_by_key('XRPBTC'))
+        self.assertIsNone(index.get_by_key('BTCXRP'))
+        self.assertEqual([eth_btc, eth_usd], index.get_by_to('ETH'))
+        self.assertEqual([], index.get_by_to('BTC'))
+        self.assertEqual([xrp_btc], index.get_by_to_full_name('Ripple'))
+        self.assertEqual([eth_btc, eth_usd, xrp_btc], index.traded_pairs)
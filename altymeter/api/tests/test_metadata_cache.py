@@ -0,0 +1,60 @@
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from altymeter.api.exchange import TradedPair
+from altymeter.api.metadata_cache import MetadataCache
+
+
+def _decode(pairs):
+    return list(map(TradedPair._make, pairs))
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.config = {'metadata cache': {'path': self.dir.name}}
+        self.pairs = [
+            TradedPair('ETHBTC', 'Test', base='BTC', base_full_name='BTC', to='ETH', to_full_name='ETH'),
+        ]
+        self.num_fetches = 0
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _fetch(self):
+        self.num_fetches += 1
+        return self.pairs
+
+    def test_get_persists(self):
+        cache = MetadataCache(self.config, logging.getLogger('test'))
+        self.assertEqual(self.pairs, cache.get('Test_traded_pairs', self._fetch, _decode))
+        self.assertEqual(self.pairs, cache.get('Test_traded_pairs', self._fetch, _decode))
+        self.assertEqual(1, self.num_fetches)
+        self.assertTrue(os.path.exists(os.path.join(self.dir.name, 'Test_traded_pairs.json')))
+
+        # A new process should load from disk.
+        cache = MetadataCache(self.config, logging.getLogger('test'))
+        self.assertEqual(self.pairs, cache.get('Test_traded_pairs', self._fetch, _decode))
+        self.assertEqual(1, self.num_fetches)
+
+    def test_get_stale(self):
+        self.config['metadata cache']['max age seconds'] = 0
+        cache = MetadataCache(self.config, logging.getLogger('test'))
+        cache.get('Test_traded_pairs', self._fetch, _decode)
+        time.sleep(0.01)
+        # The stale value is returned and refreshed in the background.
+        self.assertEqual(self.pairs, cache.get('Test_traded_pairs', self._fetch, _decode))
+        for _ in range(100):
+            if self.num_fetches == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(2, self.num_fetches)
+
+        self.config['metadata cache']['max stale seconds'] = 0
+        cache = MetadataCache(self.config, logging.getLogger('test'))
+        time.sleep(0.01)
+        cache.get('Test_traded_pairs', self._fetch, _decode)
+        self.assertEqual(3, self.num_fetches)
@@ -0,0 +1,44 @@
+import unittest
+
+from altymeter.api.poll_schedule import PollSchedule, RateBudget
+
+
+class TestPollSchedule(unittest.TestCase):
+    def test_get_interval(self):
+        schedule = PollSchedule(100, target_fill=0.5, min_seconds=1, max_seconds=600, default_seconds=60,
+                                half_life_seconds=60)
+        self.assertEqual(60, schedule.get_interval())
+
+        # 10 trades in 10 seconds.
+        schedule.observe(10, span_seconds=10, poll_time=0)
+        self.assertEqual(1, schedule.rate)
+        self.assertEqual(50, schedule.get_interval())
+
+        # No trades for one half life.
+        schedule.observe(0, poll_time=60)
+        self.assertAlmostEqual(0.5, schedule.rate)
+        self.assertAlmostEqual(100, schedule.get_interval())
+
+        # A full page means the pair is behind.
+        schedule.observe(100, span_seconds=10, poll_time=160)
+        self.assertEqual(10, schedule.rate)
+        self.assertEqual(1, schedule.get_interval())
+
+        schedule.observe(0, poll_time=100000)
+        self.assertEqual(600, schedule.get_interval())
+
+
+class TestRateBudget(unittest.TestCase):
+    def test_budget(self):
+        budget = RateBudget(1)
+        self.assertEqual(4, budget.get_interval('a', 4))
+        self.assertEqual(4, budget.get_interval('b', 4))
+        # 1/4 + 1/4 + 1 calls per second is 1.5 times the budget.
+        self.assertEqual(1.5, budget.get_interval('c', 1))
+        budget.remove('c')
+        self.assertEqual(2, budget.get_interval('c', 2))
+
+        budget.add_call(10)
+        self.assertEqual(11, budget.next_call_time)
+        budget.add_call(10.5)
+        self.assertEqual(12, budget.next_call_time)
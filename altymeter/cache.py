@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable
+
+_MISSING = object()
+
+
+class LruCache(object):
+    """
+    A thread safe cache that evicts the least recently used entries once it has `max_size` entries.
+
+    :param max_size: The maximum number of entries to keep.
+    """
+
+    def __init__(self, max_size: int):
+        assert max_size > 0, "`max_size` must be positive."
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __contains__(self, key: Hashable):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        """
+        :return: The value for `key` or `default` if it is not cached.
+        """
+        with self._lock:
+            result = self._entries.get(key, _MISSING)
+            if result is _MISSING:
+                self._misses += 1
+                return default
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: The number of hits, misses, evictions, and the current size.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return dict(hits=self._hits,
+                        misses=self._misses,
+                        hit_rate=self._hits / lookups if lookups else 0,
+                        evictions=self._evictions,
+                        size=len(self._entries),
+                        )
@@ -1,41 +1,321 @@
+import heapq
+import itertools
+import multiprocessing
+import queue
+import signal
 import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from logging import Logger
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Tuple
 
 from injector import inject, singleton
 
 from altymeter.api.exchange import TradingExchange
+from altymeter.api.poll_schedule import get_span_seconds, PollSchedule, RateBudget
+from altymeter.metrics import Metrics
 from altymeter.module.constants import Configuration
+from altymeter.pricing import PriceData, TradeBatch
+
+
+class CollectJob(object):
+    """
+    The state of collecting the trades of a pair on an exchange.
+    """
+
+    def __init__(self, exchange: TradingExchange, pair: str, schedule: PollSchedule):
+        self.exchange = exchange
+        self.pair = pair
+        self.schedule = schedule
+
+        # Where to continue collecting from.
+        self.since = None
+        self.next_time = 0.
+        self.num_failures = 0
+
+    @property
+    def trade_rate(self) -> float:
+        return self.schedule.rate or 0.
+
+    @property
+    def name(self) -> str:
+        return f"{self.exchange.name} {self.pair}"
 
 
 @singleton
 class DataCollector(object):
+    """
+    Collects trades for the pairs listed under `collect` for each exchange.
+
+    Polls for all of the pairs are scheduled on a bounded pool of workers.
+    Each pair is polled when about `target page fill` of a page of new trades is expected,
+    as long as the exchange's budget of calls allows it.
+    When several polls are due, pairs with more trades go first.
+    Failed polls are retried with exponential backoff.
+
+    With `collector.processes` greater than 1, the pairs are split between worker processes
+    which send the trades they get to this process to be written to the database.
+    """
+
     @inject
     def __init__(self, config: Configuration,
                  exchanges: Dict[str, TradingExchange],
-                 logger: Logger):
+                 logger: Logger,
+                 price_data: PriceData,
+                 metrics: Metrics):
         self._exchanges = exchanges
         self._logger = logger
+        self._price_data = price_data
+        self._metrics = metrics
 
         self._exchanges_config = config['exchanges']
 
-    def collect_data(self):
+        collector_config = config.get('collector') or {}
+        self._max_workers = collector_config.get('max workers') or 4
+        # Used until the rate of trades of a pair is known.
+        self._default_poll_seconds = collector_config.get('poll seconds') or 60
+        self._min_poll_seconds = collector_config.get('min poll seconds') or 1
+        self._max_poll_seconds = collector_config.get('max poll seconds') or 10 * 60
+        self._target_page_fill = collector_config.get('target page fill') or 0.5
+        self._rate_half_life_seconds = collector_config.get('rate half life seconds') or 10 * 60
+        self._retry_seconds = collector_config.get('retry seconds') or 10
+        self._max_backoff_seconds = collector_config.get('max backoff seconds') or 15 * 60
+        self._num_processes = collector_config.get('processes') or 1
+        self._budgets: Dict[str, RateBudget] = dict()
+        # How often to check if collection should stop while waiting.
+        self._max_wait_seconds = 1
+
+    def _get_jobs(self, shard: Optional[Tuple[int, int]] = None) -> List[CollectJob]:
+        result = []
+        calls_per_second = dict()
         for exchange_name, conf in self._exchanges_config.items():
             pairs = conf.get('collect')
             if pairs is None:
                 continue
             exchange = self._exchanges[exchange_name]
+            poll_seconds = conf.get('poll seconds') or self._default_poll_seconds
+            calls_per_second[exchange.name] = conf.get('max polls per second') or \
+                                              exchange.trades_calls_per_second
             for pair in pairs:
                 base, to = pair.split(',')
                 pair = exchange.get_pair(base=base, to=to)
                 if pair is None:
                     raise Exception(f"Could not find {base} to {to} in {exchange_name}.\nTraded pairs: " +
                                     "\n".join(map(str, exchange.get_traded_pairs())))
+                schedule = PollSchedule(exchange.trades_page_size,
+                                        target_fill=self._target_page_fill,
+                                        min_seconds=self._min_poll_seconds,
+                                        max_seconds=self._max_poll_seconds,
+                                        default_seconds=poll_seconds,
+                                        half_life_seconds=self._rate_half_life_seconds)
+                result.append(CollectJob(exchange, pair, schedule))
+
+        num_jobs = Counter(job.exchange.name for job in result)
+        if shard is not None:
+            index, num_shards = shard
+            result = result[index::num_shards]
+        num_shard_jobs = Counter(job.exchange.name for job in result)
+        for exchange_name, limit in calls_per_second.items():
+            if limit is not None and num_shard_jobs[exchange_name] > 0:
+                # Each shard gets a share of the exchange's budget.
+                limit *= num_shard_jobs[exchange_name] / num_jobs[exchange_name]
+            self._budgets[exchange_name] = RateBudget(limit)
+        return result
+
+    def _finish(self, job: CollectJob, future: Future, poll_time: float,
+                trades_queue: Optional[multiprocessing.Queue] = None) -> bool:
+        """
+        Handle the result of a poll.
+
+        :return: `True` if the job should be scheduled again.
+        """
+        now = time.time()
+        budget = self._budgets[job.exchange.name]
+        try:
+            trades, since = future.result()
+        except NotImplementedError:
+            self._logger.error("Collecting trades is not supported for %s.", job.exchange.name)
+            budget.remove(job)
+            return False
+        except:
+            job.num_failures += 1
+            self._metrics.increment('collector.errors', exchange=job.exchange.name, pair=job.pair)
+            delay = min(self._max_backoff_seconds, self._retry_seconds * 2 ** (job.num_failures - 1))
+            self._logger.exception("Error getting trades for %s. Retrying in %.0fs.", job.name, delay)
+            job.next_time = now + delay
+            return True
+
+        job.num_failures = 0
+        job.since = since
+        if len(trades) > 0:
+            if trades_queue is not None:
+                # Arrays are much faster to send than lists of tuples.
+                trades_queue.put((job.pair, TradeBatch.from_trades(trades)))
+            else:
+                # Only this thread writes to the database.
+                self._price_data.add_prices(job.pair, trades)
+        job.schedule.observe(len(trades), get_span_seconds(trades), poll_time)
+        self._metrics.increment('collector.trades', len(trades), exchange=job.exchange.name, pair=job.pair)
+        self._metrics.gauge('collector.trade rate', job.trade_rate, exchange=job.exchange.name, pair=job.pair)
+        job.next_time = now + budget.get_interval(job, job.schedule.get_interval())
+        return True
+
+    def collect_data(self, stop_event: Optional[threading.Event] = None,
+                     shard: Optional[Tuple[int, int]] = None,
+                     trades_queue: Optional[multiprocessing.Queue] = None):
+        """
+        Collect trades until `stop_event` is set.
+
+        :param shard: The index of the shard and the number of shards to only collect some of the pairs.
+        :param trades_queue: Where to send the trades that are collected instead of writing them.
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        if shard is None and trades_queue is None and self._num_processes > 1:
+            self.collect_data_sharded(self._num_processes, stop_event)
+            return
+        jobs = self._get_jobs(shard)
+        if not jobs:
+            self._logger.warning("No pairs to collect.")
+            return
+        self._logger.info("Collecting data for %d pairs with %d workers.", len(jobs), self._max_workers)
+
+        counter = itertools.count()
+        # Jobs ordered by when they are due.
+        scheduled = []
+        # Due jobs ordered with the busiest pairs first.
+        ready = []
+        # The job and the start time of each poll.
+        running: Dict[Future, Tuple[CollectJob, float]] = dict()
+
+        def schedule(j: CollectJob):
+            heapq.heappush(scheduled, (j.next_time, next(counter), j))
+
+        for job in jobs:
+            schedule(job)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='collect') as executor:
+            while not stop_event.is_set() and (scheduled or ready or running):
+                now = time.time()
+                while scheduled and scheduled[0][0] <= now:
+                    _, _, job = heapq.heappop(scheduled)
+                    heapq.heappush(ready, (-job.trade_rate, next(counter), job))
+                while ready and len(running) < self._max_workers:
+                    _, _, job = heapq.heappop(ready)
+                    budget = self._budgets[job.exchange.name]
+                    if budget.next_call_time > now:
+                        job.next_time = budget.next_call_time
+                        schedule(job)
+                        continue
+                    budget.add_call(now)
+                    running[executor.submit(job.exchange.fetch_trades, job.pair, job.since)] = (job, now)
+
+                timeout = self._max_wait_seconds
+                if scheduled and len(running) < self._max_workers:
+                    timeout = min(timeout, max(0., scheduled[0][0] - now))
+                if running:
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job, poll_time = running.pop(future)
+                        if self._finish(job, future, poll_time, trades_queue):
+                            schedule(job)
+                else:
+                    stop_event.wait(timeout)
+
+            # Keep the trades from polls that were in progress.
+            for future in as_completed(running):
+                job, poll_time = running[future]
+                self._finish(job, future, poll_time, trades_queue)
+        self._logger.info("Stopped collecting data.")
+
+    def collect_data_sharded(self, num_processes: int, stop_event: Optional[threading.Event] = None,
+                             get_collector: Optional[Callable[[], 'DataCollector']] = None):
+        """
+        Collect trades in worker processes that each poll some of the pairs
+        while this process writes all of the trades to the database.
+        Workers that crash are restarted.
+
+        :param num_processes: The number of worker processes.
+        :param stop_event: Set to stop collecting.
+        :param get_collector: Creates the collector in each worker.
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+        if get_collector is None:
+            get_collector = _get_collector
+        context = multiprocessing.get_context('spawn')
+        trades_queue = context.Queue(maxsize=1000)
+        workers_stop_event = context.Event()
+
+        def start(shard: int) -> multiprocessing.Process:
+            result = context.Process(target=_collect_shard,
+                                     args=(get_collector, (shard, num_processes), trades_queue, workers_stop_event),
+                                     name=f'collect_{shard}',
+                                     daemon=True)
+            result.start()
+            return result
+
+        self._logger.info("Collecting data with %d processes.", num_processes)
+        processes = [start(shard) for shard in range(num_processes)]
+        finished = set()
+        num_trades = 0
+        try:
+            while len(finished) < num_processes:
+                if stop_event.is_set():
+                    workers_stop_event.set()
+                try:
+                    item = trades_queue.get(timeout=self._max_wait_seconds)
+                except queue.Empty:
+                    for shard, process in enumerate(processes):
+                        if shard in finished or process.is_alive():
+                            continue
+                        if workers_stop_event.is_set():
+                            finished.add(shard)
+                        else:
+                            self._logger.error("Collector %d stopped with exit code %s. Restarting it.",
+                                               shard, process.exitcode)
+                            processes[shard] = start(shard)
+                    continue
+                pair, trades = item
+                if trades is None:
+                    # The worker is done.
+                    finished.add(pair)
+                    continue
+                self._price_data.add_prices(pair, trades)
+                num_trades += len(trades)
+        except KeyboardInterrupt:
+            self._logger.info("Stopping collectors.")
+            workers_stop_event.set()
+            # Save what the workers already collected.
+            while True:
+                try:
+                    pair, trades = trades_queue.get(timeout=self._max_wait_seconds)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    continue
+                if trades is not None:
+                    self._price_data.add_prices(pair, trades)
+                    num_trades += len(trades)
+        for process in processes:
+            process.join()
+        self._logger.info("Stopped collecting data. Wrote %d trades.", num_trades)
+
+
+def _get_collector() -> DataCollector:
+    from altymeter.module.module import AltymeterModule
+
+    return AltymeterModule.get_injector().get(DataCollector)
+
 
-                thread_name = f"collect_{exchange.name}_{pair}"
-                thread = threading.Thread(target=lambda: exchange.collect_data(pair),
-                                          name=thread_name)
-                thread.start()
+def _collect_shard(get_collector: Callable[[], DataCollector], shard: Tuple[int, int],
+                   trades_queue: multiprocessing.Queue, stop_event: threading.Event):
+    # The main process decides when to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    collector = get_collector()
+    collector.collect_data(stop_event, shard=shard, trades_queue=trades_queue)
+    trades_queue.put((shard[0], None))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+import logging
+from logging import Logger
+
+from injector import inject, singleton
+
+
+class Metrics(object):
+    """
+    Receives measurements, such as progress and throughput, from long running processes.
+
+    This default ignores them. Bind a subclass to send them somewhere else, e.g. a monitoring system.
+    Configure `metrics: log` to log them.
+    """
+
+    def increment(self, name: str, value: float = 1, **tags):
+        """
+        Add to a count.
+
+        :param name: The name of the count, e.g. 'pricing.trades read'.
+        :param value: The amount to add.
+        :param tags: Details about the measurement, e.g. the pair.
+        """
+
+    def gauge(self, name: str, value: float, **tags):
+        """
+        Record the current value of something.
+        """
+
+    def timing(self, name: str, seconds: float, **tags):
+        """
+        Record how long something took.
+        """
+
+
+@singleton
+class LoggingMetrics(Metrics):
+    """
+    Logs measurements at the debug level.
+    """
+
+    @inject
+    def __init__(self, logger: Logger):
+        self._logger = logger
+
+    def _log(self, kind: str, name: str, value: float, tags: dict):
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("%s %s: %s %s", kind, name, value, tags)
+
+    def increment(self, name: str, value: float = 1, **tags):
+        self._log('increment', name, value, tags)
+
+    def gauge(self, name: str, value: float, **tags):
+        self._log('gauge', name, value, tags)
+
+    def timing(self, name: str, seconds: float, **tags):
+        self._log('timing', name, seconds, tags)
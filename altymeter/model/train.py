@@ -22,7 +22,7 @@ from keras.models import load_model
 from tqdm import tqdm
 
 from altymeter.module.constants import Configuration, user_dir
-from altymeter.pricing import PriceData
+from altymeter.pricing import PriceData, SplitPrices
 
 ALL_FEATURES = {
     'price',
@@ -58,18 +58,22 @@ class TradingModel(object):
 
         self._model_type = training_config.get('model type', 'conv').lower()
 
+        # The number of seconds in each step.
+        # When set, prices come from the stored bars so models with different resolutions can share them.
+        self._resolution = training_config.get('resolution')
+
         # Number of steps to look backward for training data.
         self._num_lookback_steps = training_config.get('num lookback steps')
         if self._num_lookback_steps is None:
             # Default to look back 4 hours.
-            self._num_lookback_steps = int(4 * 60 * 60 / self._price_data.time_grouping)
+            self._num_lookback_steps = int(4 * 60 * 60 / self.resolution)
         self._logger.info("Number of look back steps: %d", self._num_lookback_steps)
 
         # Number of steps to look forward when setting expected value.
         self._num_lookahead_steps = training_config.get('num lookahead steps')
         if self._num_lookahead_steps is None:
             # Default to lookahead 2 hours.
-            self._num_lookahead_steps = int(2 * 60 * 60 / self._price_data.time_grouping)
+            self._num_lookahead_steps = int(2 * 60 * 60 / self.resolution)
 
         # Thresholds for deciding if change or neutral flag.
         self._increase_threshold = training_config.get('increase threshold', 0.01)
@@ -141,7 +145,13 @@ class TradingModel(object):
         if is_data_plottable is None:
             is_data_plottable = self._is_data_plottable
 
-        split_prices = self._price_data.get_prices(pairs)
+        prices_by_pair = self._price_data.get_prices_by_pair(pairs, self._resolution)
+        split_prices = SplitPrices()
+        # The pair of each chunk.
+        chunk_pairs = []
+        for pair, pair_prices in prices_by_pair.items():
+            split_prices.extend(pair_prices)
+            chunk_pairs.extend([pair] * pair_prices.get_num_chunks())
 
         num_chunks = 0
         data_len = 0
@@ -156,6 +166,7 @@ class TradingModel(object):
         X, y = [], []
         X_val, y_val = [], []
         validation_market_values = []
+        validation_pairs = []
 
         self._logger.debug("Using %d chunk(s).", num_chunks)
 
@@ -235,6 +246,7 @@ class TradingModel(object):
                     X_val.append(training_datum)
                     y_val.append(expected)
                     validation_market_values.append(prices[index])
+                    validation_pairs.append(chunk_pairs[split_index])
 
                 if is_data_plottable:
                     plot_data.append(dict(price=prices[index],
@@ -284,13 +296,14 @@ class TradingModel(object):
             X_val = X_val[-last:]
             y_val = y_val[-last:]
             validation_market_values = validation_market_values[-last:]
+            validation_pairs = validation_pairs[-last:]
 
         X = np.array(X, dtype=np.float32)
         y = np.array(y, dtype=np.float32)
         X_val = np.array(X_val, dtype=np.float32)
         y_val = np.array(y_val, dtype=np.float32)
 
-        return X, y, (X_val, y_val), validation_market_values
+        return X, y, (X_val, y_val), validation_market_values, validation_pairs
 
     def interpret_decision(self, prediction: np.ndarray):
         argmax = prediction.argmax()
@@ -309,11 +322,19 @@ class TradingModel(object):
     def num_look_back_steps(self):
         return self._num_lookback_steps
 
+    @property
+    def resolution(self) -> int:
+        """
+        :return: The number of seconds in each step.
+        """
+        return self._resolution or self._price_data.time_grouping
+
     def train(self, pairs: Iterable[str] = None,
               validation_split=0.3,
               load_path=None):
 
-        X, y, validation_data, validation_market_values = self.build_training_data(pairs, validation_split)
+        X, y, validation_data, validation_market_values, validation_pairs = \
+            self.build_training_data(pairs, validation_split)
 
         if load_path:
             self._model = self.load(load_path)
@@ -381,8 +402,13 @@ class TradingModel(object):
                         validation_data=validation_data)
 
         if validation_data and validation_market_values:
-            # TODO Backtest on each pair separately.
-            self.backtest(validation_data, validation_market_values)
+            X_val, y_val = validation_data
+            validation_market_values = np.array(validation_market_values)
+            validation_pairs = np.array(validation_pairs)
+            for pair in np.unique(validation_pairs):
+                print("Backtesting %s:" % pair)
+                mask = validation_pairs == pair
+                self.backtest((X_val[mask], y_val[mask]), validation_market_values[mask])
 
         return self._model
 
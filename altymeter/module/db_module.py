@@ -21,6 +21,18 @@ class DbModule(Module):
                        'pair, time ASC'
                        ')')
 
+        # Trades grouped into intervals of several resolutions.
+        cursor.execute('CREATE TABLE IF NOT EXISTS bar ('
+                       'pair TEXT, resolution INTEGER, time_class INTEGER, value REAL, volume REAL, count INTEGER,'
+                       'UNIQUE (pair, resolution, time_class)'
+                       ')')
+
+        # Trades before `time` were moved out of the database into archive files.
+        cursor.execute('CREATE TABLE IF NOT EXISTS trade_compaction ('
+                       'pair TEXT, time REAL,'
+                       'UNIQUE (pair)'
+                       ')')
+
         cursor.execute('CREATE TABLE IF NOT EXISTS hour_price ('
                        'symbol TEXT, fiat TEXT, time_in_s INTEGER, val REAL,'
                        'UNIQUE (symbol, fiat, time_in_s, val)'
@@ -28,6 +40,22 @@ class DbModule(Module):
         cursor.execute('CREATE INDEX IF NOT EXISTS hour_price_index ON hour_price ('
                        'symbol, fiat, time_in_s'
                        ')')
+
+        # History of your account on exchanges.
+        cursor.execute('CREATE TABLE IF NOT EXISTS exchange_fill ('
+                       'exchange TEXT, id TEXT, pair TEXT, time REAL, action_type TEXT,'
+                       'base TEXT, to_asset TEXT, price REAL, volume REAL, fee REAL, fee_asset TEXT,'
+                       'UNIQUE (exchange, id)'
+                       ')')
+        cursor.execute('CREATE TABLE IF NOT EXISTS exchange_transfer ('
+                       'exchange TEXT, type TEXT, asset TEXT, time REAL, amount REAL, fee REAL, address TEXT,'
+                       'UNIQUE (exchange, type, asset, time, amount)'
+                       ')')
+        # When each kind of history was last downloaded from each exchange.
+        cursor.execute('CREATE TABLE IF NOT EXISTS exchange_sync ('
+                       'exchange TEXT, stream TEXT, time REAL,'
+                       'UNIQUE (exchange, stream)'
+                       ')')
         db.commit()
 
     def _get_database(self, config):
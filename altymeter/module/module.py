@@ -9,6 +9,7 @@ from altymeter.api.binance_api import BinanceApi
 from altymeter.api.bittrex import BittrexApi
 from altymeter.api.exchange import TradingExchange
 from altymeter.api.kraken import KrakenApi
+from altymeter.metrics import LoggingMetrics, Metrics
 from altymeter.module.constants import Configuration, user_dir
 from altymeter.module.db_module import DbModule
 
@@ -128,5 +129,12 @@ class AltymeterModule(Module):
             result['kraken'] = k
         return result
 
+    @singleton
+    @provider
+    def provide_metrics(self, config: Configuration, inj: Injector) -> Metrics:
+        if config.get('metrics') == 'log':
+            return inj.get(LoggingMetrics)
+        return Metrics()
+
     def configure(self, binder: Binder):
         pass
@@ -1,18 +1,22 @@
+import copy
+import hashlib
+import logging
 import os
-import time
-from collections import defaultdict
 from logging import Logger
 from operator import itemgetter
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-from bidict import bidict
 from injector import inject, singleton
 from tqdm import tqdm
 
 from altymeter.api.exchange import TradingExchange
-from altymeter.module.constants import Configuration
+from altymeter.module.constants import Configuration, user_dir
+from altymeter.portfolio.checkpoint import AnalysisCheckpoints, AnalysisState, get_row_hashes
+from altymeter.portfolio.exchange_ledger import ExchangeLedger
+from altymeter.portfolio.holdings import HoldingsTable
+from altymeter.portfolio.ledger import AssetTimeIndex, Ledger, merge_sorted, read_ledger
 from altymeter.pricing import PriceData
 
 seconds_per_day = 24 * 60 * 60
@@ -20,74 +24,17 @@ seconds_per_day = 24 * 60 * 60
 trade_types = {'Bought', 'Sold', 'Trade'}
 
 
-class DigitalAssetHodling(object):
-    def __init__(self):
-        self._amount = 0
-        self._cost_of_amount = 0
-        # Grouped by year.
-        self._total_cost_of_amount_sold = defaultdict(float)
-        # Grouped by year.
-        self._proceeds = defaultdict(float)
-
-    def __isub__(self, amount: float):
-        assert isinstance(amount, float)
-        assert self._amount > 0
-        self._cost_of_amount *= (self._amount - amount) / self._amount
-        self._amount -= amount
-        return self
-
-    @property
-    def amount(self):
-        return self._amount
-
-    @property
-    def avg_cost(self):
-        if self._amount != 0:
-            return self._cost_of_amount / self._amount
-        else:
-            return 0
-
-    def add(self, amount: float, cost: float):
-        self._amount += amount
-        self._cost_of_amount += cost
-
-    def add_loss(self, loss: float):
-        """
-        Consider a loss as a superficial loss and add it to your cost basis.
-        :param loss: The positive amount of fiat lost in a trade.
-        """
-        assert loss > 0
-        self._cost_of_amount += loss
-
-    def get_proceeds(self, year: Optional[int] = None):
-        if year is None:
-            return sum(self._proceeds.values())
-        else:
-            return self._proceeds[year]
-
-    def get_total_cost_of_amount_sold(self, year: Optional[int] = None):
-        if year is None:
-            return sum(self._total_cost_of_amount_sold.values())
-        else:
-            return self._total_cost_of_amount_sold[year]
-
-    def update_cost_of_amount_sold(self, amount: float, date):
-        # Update total_cost based on proportion of amount.
-        self._total_cost_of_amount_sold[date.year] += amount / self._amount * self._cost_of_amount
-
-    def update_proceeds(self, proceeds_to_add: float, date):
-        self._proceeds[date.year] += proceeds_to_add
-
-
 @singleton
 class Portfolio(object):
     @inject
     def __init__(self, config: Configuration,
                  exchanges: Dict[str, TradingExchange],
+                 exchange_ledger: ExchangeLedger,
                  logger: Logger,
                  price_data: PriceData):
         self._logger = logger
         self._exchanges = exchanges
+        self._exchange_ledger = exchange_ledger
         self._price_data = price_data
 
         self._asset_map = {
@@ -98,6 +45,12 @@ class Portfolio(object):
         self._fiat = self._analysis_config.get('fiat')
         self._ignore_assets = set(self._analysis_config.get('ignore assets'))
         self._num_transfer_days = self._analysis_config.get('num transfer days') or 1.5
+        self._import_chunk_size = self._analysis_config.get('import chunk size') or 100000
+        # Save the state at the first row of each period (a NumPy datetime unit such as 'M' for month)
+        # so that later analyses can resume from the last state before rows that changed.
+        self._checkpoint_period = self._analysis_config.get('checkpoint period')
+        self._checkpoint_path = os.path.expanduser(self._analysis_config.get('checkpoint path') or
+                                                   os.path.join(user_dir, 'portfolio_checkpoints.pkl'))
 
         # Canada has a superficial loss period where losses are complicated to claim
         # if the asset was purchased within some days of the loss.
@@ -113,202 +66,222 @@ class Portfolio(object):
     def analyze(self):
         print("WARNING DISCLAIMER NOTICE: The results and code provided are not meant as tax advice.")
         imports = self._analysis_config.get('import') or []
-        data = []
-        for i in imports:
-            path = os.path.expanduser(i['path'])
-            d = pd.read_csv(path,
-                            parse_dates=['Date'],
-                            )
-            data.append(d)
+        paths = [os.path.expanduser(i['path']) for i in imports]
+        # Each file is read in chunks and merged in order of date.
+        streams = [read_ledger(path, self._import_chunk_size) for path in paths]
+        if self._exchange_ledger.is_configured:
+            # Trades and transfers downloaded from exchanges listed in config.
+            self._exchange_ledger.sync()
+            streams.append([self._exchange_ledger.load()])
+        data = list(merge_sorted(streams))
 
         assert data, "No transactions found."
-        data: pd.DataFrame = pd.concat(data)
+        data: pd.DataFrame = pd.concat(data, ignore_index=True)
 
-        if 'Currency.1' in data.columns:
-            traded_asset_index = data.columns.get_loc('Currency.1') + 1
-        else:
-            traded_asset_index = data.columns.get_loc('Sent Currency') + 1
-
-        # Used to be just 'Currency'.
-        received_currency_index = data.columns.get_loc('Received Currency') + 1
-        # Used to be just 'Quantity'.
-        received_quantity_index = data.columns.get_loc('Received Quantity') + 1
-        # Used to be just 'Price'.
-        sent_quantity_index = data.columns.get_loc('Sent Quantity') + 1
-
-        exchange_index = data.columns.get_loc('Received Wallet Type') + 1
-
-        data.sort_values('Date', inplace=True)
-        # Reset the index column.
-        data.reset_index(drop=True, inplace=True)
+        ledger = Ledger(data)
+        is_skipped = self._get_skipped_rows(ledger)
 
-        matched_rows = bidict()
-
-        # TODO Load trades from exchanges based on ones listed in config.
-
-        # Iterate over trades, withdrawals, and fundings to tally:
-        # * costs and proceeds
-        # * link transfers of similar amounts at close times to not consider them as a trade.
-        assets = defaultdict(DigitalAssetHodling)
+        holdings = HoldingsTable()
         losses = []
         prev_year = None
         fiat_values = []
         gains = []
-        for row in tqdm(data.itertuples(),
-                        desc="Processing actions",
-                        total=len(data),
-                        unit_scale=True, mininterval=2, unit=" actions"):
+        transfer_pairs = []
+        start = 0
+        checkpoints = []
+        checkpoint_rows = set()
+        if self._checkpoint_period:
+            analysis_checkpoints = self._get_checkpoints()
+            row_hashes = get_row_hashes(data)
+            resume = analysis_checkpoints.get_resume(ledger, row_hashes)
+            if resume is not None:
+                state = resume.state
+                start = state.row
+                self._logger.info("Resuming from the checkpoint at row %d.", start)
+                holdings = copy.deepcopy(state.holdings)
+                losses = list(resume.losses)
+                prev_year = state.prev_year
+                fiat_values = list(resume.fiat_values)
+                gains = list(resume.gains)
+                transfer_pairs = resume.transfer_pairs
+                checkpoints = list(resume.checkpoints)
+            periods = ledger.dates.astype(f'datetime64[{self._checkpoint_period}]')
+            checkpoint_rows = set(np.flatnonzero(periods[1:] != periods[:-1]) + 1)
+
+        # Link transfers of similar amounts at close times to not consider them as a trade.
+        has_transfer, transfer_pairs = self._match_transfers(ledger, is_skipped, transfer_pairs, start)
+        unit_values, unit_value_errors = self._get_unit_values(ledger, is_skipped, has_transfer, start)
+        candidate_fiat_values = self._get_fiat_values(ledger, unit_values)
+        # For superficial losses.
+        purchases = AssetTimeIndex(ledger.received_currencies, ledger.date_ns,
+                                   np.isin(ledger.types, list(trade_types)))
+
+        def get_fiat_value(index: int):
+            error = unit_value_errors.get(index)
+            if error is not None:
+                raise error
+            return candidate_fiat_values[index]
+
+        # Iterate over trades, withdrawals, and fundings to tally costs and proceeds.
+        # Use Python scalars so that arithmetic behaves like it does for rows (e.g. dividing by 0 raises).
+        is_debug = self._logger.isEnabledFor(logging.DEBUG)
+        types = ledger.types.tolist()
+        received_currencies = ledger.received_currencies.tolist()
+        received_quantities = ledger.received_quantities.tolist()
+        sent_currencies = ledger.sent_currencies.tolist()
+        sent_quantities = ledger.sent_quantities.tolist()
+        years = ledger.years.tolist()
+        unit_values = unit_values.tolist()
+        candidate_fiat_values = candidate_fiat_values.tolist()
+        for index in tqdm(range(start, len(ledger)),
+                          desc="Processing actions",
+                          unit_scale=True, mininterval=2, unit=" actions"):
+            if index in checkpoint_rows and index > start:
+                checkpoints.append(AnalysisState(index, copy.deepcopy(holdings), len(losses), prev_year))
+
             fiat_value = None
             gain = None
-            if (isinstance(row.Disabled, (bool, str)) and row.Disabled) or \
-                    (self._ignore_assets and (self._map_asset(row[received_currency_index]) in self._ignore_assets or
-                                              self._map_asset(row[traded_asset_index]) in self._ignore_assets)):
-                self._logger.debug("Skipping row %s.", row)
+            if is_skipped[index]:
+                if is_debug:
+                    self._logger.debug("Skipping row %s.", ledger.get_row(index))
                 fiat_values.append(fiat_value)
                 gains.append(gain)
                 continue
 
+            year = years[index]
             if prev_year is not None:
-                if row.Date.year != prev_year:
-                    self.summarize(assets, losses, prev_year)
-            prev_year = row.Date.year
-
-            if row.Type == 'Received':
-                asset = row[received_currency_index]
-                if self.find_nearby(asset, row, data, matched_rows,
-                                    received_quantity_index, sent_quantity_index) is None:
-                    amount = row[received_quantity_index]
-                    asset_hodlings = assets[self._map_asset(asset)]
-                    time_in_s = time.mktime(row.Date.timetuple())
+                if year != prev_year:
+                    self.summarize(holdings, losses, prev_year)
+            prev_year = year
+
+            row_type = types[index]
+            if row_type == 'Received':
+                if not has_transfer[index]:
+                    asset = received_currencies[index]
+                    amount = received_quantities[index]
+                    asset_id = holdings.get_id(self._map_asset(asset))
                     try:
-                        fiat_value = amount * self._price_data.get_hour_value(asset, self._fiat, time_in_s)
+                        fiat_value = get_fiat_value(index)
                         # Assume the value paid, if any, is the current price.
                         # E.g. a friend pays you so it's like you took the money to buy the asset.
-                        asset_hodlings.add(amount, fiat_value)
+                        holdings.add(asset_id, amount, fiat_value)
                     except:
-                        self._logger.exception("Error processing %s.", row)
-            elif row.Type == 'Sent':
-                asset = row[traded_asset_index]
-                if self.find_nearby(asset, row, data, matched_rows,
-                                    received_quantity_index, sent_quantity_index) is None:
+                        self._logger.exception("Error processing %s.", ledger.get_row(index))
+            elif row_type == 'Sent':
+                if not has_transfer[index]:
                     # Consider unmatched sends as payments and realize gain/loss.
-                    asset_hodlings = assets[self._map_asset(asset)]
-                    amount = row[sent_quantity_index]
-                    time_in_s = time.mktime(row.Date.timetuple())
-                    asset_value_per_amount = self._price_data.get_hour_value(asset, self._fiat, time_in_s)
-                    fiat_value = amount * asset_value_per_amount
+                    asset = sent_currencies[index]
+                    asset_id = holdings.get_id(self._map_asset(asset))
+                    amount = sent_quantities[index]
+                    fiat_value = get_fiat_value(index)
+                    asset_value_per_amount = unit_values[index]
 
                     loss = 0
                     claim_loss_now = True
 
-                    if asset_value_per_amount < asset_hodlings.avg_cost:
+                    if asset_value_per_amount < holdings.get_avg_cost(asset_id):
                         # Loss found.
-                        loss = amount * asset_hodlings.avg_cost - fiat_value
+                        loss = amount * holdings.get_avg_cost(asset_id) - fiat_value
                         losses.append((loss, asset))
 
                         # Check cases for superficial loss.
-                        if self.check_traded(asset, row.Index, data, self._num_superficial_loss_days,
-                                             received_currency_index,
+                        if self.check_traded(asset, index, ledger, self._num_superficial_loss_days,
+                                             purchases,
                                              after=True):
                             # Was bought after, so cannot claim loss.
                             claim_loss_now = False
-                        elif not np.isclose(amount, asset_hodlings.amount, rtol=0.02) \
-                                and self.check_traded(asset, row.Index, data,
-                                                      self._num_superficial_loss_days,
-                                                      received_currency_index,
+                        elif not np.isclose(amount, holdings.get_amount(asset_id), rtol=0.02) \
+                                and self.check_traded(asset, index, ledger, self._num_superficial_loss_days,
+                                                      purchases,
                                                       after=False):
                             # Was bought too soon before and holdings are still kept, so cannot claim loss.
                             claim_loss_now = False
                     try:
                         if not claim_loss_now and loss > 0:
-                            asset_hodlings -= amount
+                            holdings.subtract(asset_id, amount)
 
                             # Add loss to ACB.
-                            asset_hodlings.add_loss(loss)
+                            holdings.add_loss(asset_id, loss)
                             # Do not update proceeds.
                         else:
                             # Can claim loss/gain.
-                            gain = fiat_value - amount * asset_hodlings.avg_cost
+                            gain = fiat_value - amount * holdings.get_avg_cost(asset_id)
 
-                            asset_hodlings.update_cost_of_amount_sold(amount, row.Date)
-                            asset_hodlings -= amount
-                            asset_hodlings.update_proceeds(fiat_value, row.Date)
+                            holdings.update_cost_of_amount_sold(asset_id, amount, year)
+                            holdings.subtract(asset_id, amount)
+                            holdings.update_proceeds(asset_id, fiat_value, year)
                     except:
-                        self._logger.exception("Error processing %s.", row)
-            elif row.Type in trade_types:
-                bought_asset = row[received_currency_index]
-                bought_quantity = row[received_quantity_index]
-                traded_quantity = row[sent_quantity_index]
-                traded_asset = row[traded_asset_index]
-
-                if self._is_fiat(traded_asset):
-                    fiat_value = traded_quantity
-                elif self._is_fiat(bought_asset):
-                    fiat_value = bought_quantity
-                else:
-                    time_in_s = time.mktime(row.Date.timetuple())
-                    fiat_value = traded_quantity * self._price_data.get_hour_value(traded_asset, self._fiat, time_in_s)
+                        self._logger.exception("Error processing %s.", ledger.get_row(index))
+            elif row_type in trade_types:
+                bought_asset = received_currencies[index]
+                bought_quantity = received_quantities[index]
+                traded_quantity = sent_quantities[index]
+                traded_asset = sent_currencies[index]
+
+                fiat_value = get_fiat_value(index)
 
                 if not self._is_fiat(traded_asset):
                     # Realize gain/loss on traded_asset.
                     loss = 0
                     claim_loss_now = True
                     traded_asset_value_per_amount = fiat_value / traded_quantity
-                    traded_asset_hodlings = assets[self._map_asset(traded_asset)]
+                    traded_asset_id = holdings.get_id(self._map_asset(traded_asset))
 
-                    if traded_asset_value_per_amount < traded_asset_hodlings.avg_cost:
+                    if traded_asset_value_per_amount < holdings.get_avg_cost(traded_asset_id):
                         # Loss found.
-                        loss = traded_quantity * traded_asset_hodlings.avg_cost - fiat_value
+                        loss = traded_quantity * holdings.get_avg_cost(traded_asset_id) - fiat_value
                         losses.append((loss, traded_asset))
 
                         # Check cases for superficial loss.
-                        if self.check_traded(traded_asset, row.Index, data, self._num_superficial_loss_days,
-                                             received_currency_index,
+                        if self.check_traded(traded_asset, index, ledger, self._num_superficial_loss_days,
+                                             purchases,
                                              after=True):
                             # Was bought after, so cannot claim loss.
                             claim_loss_now = False
-                        elif not np.isclose(traded_quantity, traded_asset_hodlings.amount, rtol=0.02) \
-                                and self.check_traded(traded_asset, row.Index, data, self._num_superficial_loss_days,
-                                                      received_currency_index,
+                        elif not np.isclose(traded_quantity, holdings.get_amount(traded_asset_id), rtol=0.02) \
+                                and self.check_traded(traded_asset, index, ledger, self._num_superficial_loss_days,
+                                                      purchases,
                                                       after=False):
                             # Was bought too soon before and holdings are still kept, so cannot claim loss.
                             claim_loss_now = False
                     try:
                         if not claim_loss_now and loss > 0:
-                            traded_asset_hodlings -= traded_quantity
+                            holdings.subtract(traded_asset_id, traded_quantity)
 
                             # Add loss to ACB.
-                            traded_asset_hodlings.add_loss(loss)
+                            holdings.add_loss(traded_asset_id, loss)
                             # Do not update proceeds.
                         else:
                             # Can claim loss/gain.
-                            gain = fiat_value - traded_quantity * traded_asset_hodlings.avg_cost
+                            gain = fiat_value - traded_quantity * holdings.get_avg_cost(traded_asset_id)
 
-                            traded_asset_hodlings.update_cost_of_amount_sold(traded_quantity, row.Date)
-                            traded_asset_hodlings -= traded_quantity
-                            traded_asset_hodlings.update_proceeds(fiat_value, row.Date)
+                            holdings.update_cost_of_amount_sold(traded_asset_id, traded_quantity, year)
+                            holdings.subtract(traded_asset_id, traded_quantity)
+                            holdings.update_proceeds(traded_asset_id, fiat_value, year)
                     except:
-                        self._logger.exception("Error processing %s.", row)
+                        self._logger.exception("Error processing %s.", ledger.get_row(index))
 
                 if not self._is_fiat(bought_asset):
                     # Update bought asset info.
-                    bought_asset_hodlings = assets[self._map_asset(bought_asset)]
-                    bought_asset_hodlings.add(bought_quantity, fiat_value)
-            elif row.Type == 'Transfer':
-                if not isinstance(row[exchange_index], str):
+                    bought_asset_id = holdings.get_id(self._map_asset(bought_asset))
+                    holdings.add(bought_asset_id, bought_quantity, fiat_value)
+            elif row_type == 'Transfer':
+                if not isinstance(ledger.received_wallet_types[index], str):
                     # Should be fiat.
-                    asset = self._map_asset(row[received_currency_index])
-                    asset_hodlings = assets[asset]
-                    asset_hodlings.add(row[received_quantity_index], row[received_quantity_index])
+                    asset_id = holdings.get_id(self._map_asset(received_currencies[index]))
+                    holdings.add(asset_id, received_quantities[index], received_quantities[index])
                 else:
                     # Ignore since it should already be accounted for.
                     pass
             else:
-                raise ValueError(f"Unrecognized row type {row.Type} in {row}.")
+                raise ValueError(f"Unrecognized row type {row_type} in {ledger.get_row(index)}.")
 
             fiat_values.append(fiat_value)
             gains.append(gain)
 
+        if self._checkpoint_period:
+            analysis_checkpoints.save(ledger, row_hashes, checkpoints, losses, fiat_values, gains, transfer_pairs)
+
         export_path = self._analysis_config.get('export path')
         if export_path is not None:
             self._logger.info("Exporting actions to `%s`.", export_path)
@@ -325,126 +298,216 @@ class Portfolio(object):
                                  ],
                         index=False)
 
-        self.summarize(assets, losses, prev_year)
-        self.summarize(assets, losses, show_all_assets=True)
+        self._price_data.flush_hour_values()
+        self._logger.debug("Hourly value stats: %s", self._price_data.hour_value_stats)
+
+        self.summarize(holdings, losses, prev_year)
+        self.summarize(holdings, losses, show_all_assets=True)
+
+    def _get_checkpoints(self) -> AnalysisCheckpoints:
+        settings = (self._fiat, sorted(self._ignore_assets), sorted(self._asset_map.items()),
+                    self._num_transfer_days, self._num_superficial_loss_days)
+        fingerprint = hashlib.sha256(repr(settings).encode('utf-8')).hexdigest()
+        # Matching a transfer can depend on matches up to two transfer windows away.
+        lookahead_days = max(2 * self._num_transfer_days, self._num_superficial_loss_days)
+        return AnalysisCheckpoints(self._checkpoint_path, fingerprint,
+                                   int(lookahead_days * seconds_per_day * 10 ** 9),
+                                   self._logger)
+
+    def _get_skipped_rows(self, ledger: Ledger) -> np.ndarray:
+        """
+        :return: Indicates the rows that are disabled or for ignored assets.
+        """
+        result = np.fromiter((isinstance(disabled, (bool, str)) and bool(disabled) for disabled in ledger.disabled),
+                             dtype=bool, count=len(ledger))
+        if self._ignore_assets:
+            for currencies in (ledger.received_currencies, ledger.sent_currencies):
+                result |= np.fromiter((self._map_asset(c) in self._ignore_assets for c in currencies),
+                                      dtype=bool, count=len(ledger))
+        return result
+
+    def _match_transfers(self, ledger: Ledger, is_skipped: np.ndarray,
+                         transfer_pairs: Optional[List[Tuple[int, int]]] = None,
+                         start: int = 0) \
+            -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """
+        Find the transfers that were sent and received between wallets.
+        Matching is greedy in the order of the rows so that each row can only be matched once.
+
+        :param is_skipped: Indicates rows that should not be matched from.
+            They can still be matched to by other rows.
+        :param transfer_pairs: Transfers already matched by rows before `start`.
+        :param start: The first row to match from.
+        :return: Indicates the rows that are part of a transfer
+            and the (row, matched row) pairs in the order they were matched.
+        """
+        result = np.zeros(len(ledger), dtype=bool)
+        transfer_pairs = list(transfer_pairs or [])
+        for pair in transfer_pairs:
+            result[list(pair)] = True
+        types = ledger.types
+        # The rows that can be the other side of a row of each type.
+        candidates = {
+            'Received': AssetTimeIndex(ledger.sent_currencies, ledger.date_ns,
+                                       np.isin(types, ['Sent', 'Transfer'])),
+            'Sent': AssetTimeIndex(ledger.received_currencies, ledger.date_ns,
+                                   np.isin(types, ['Received', 'Transfer'])),
+        }
+        is_transfer = np.isin(types, ['Received', 'Sent']) & ~is_skipped
+        is_transfer[:start] = False
+        for index in np.flatnonzero(is_transfer):
+            if result[index]:
+                # Already found by an earlier row.
+                continue
+            found_index = self.find_nearby(index, ledger, result, candidates[types[index]])
+            if found_index is not None:
+                result[found_index] = True
+                result[index] = True
+                transfer_pairs.append((int(index), found_index))
+        return result, transfer_pairs
+
+    def _get_unit_values(self, ledger: Ledger, is_skipped: np.ndarray, has_transfer: np.ndarray,
+                         start: int = 0) \
+            -> Tuple[np.ndarray, Dict[int, Exception]]:
+        """
+        Get the value of one unit of each asset that needs to be valued in fiat for the rows from `start`.
+
+        :return: The value per unit for each row (NaN if not needed)
+            and the errors getting values by row index which should be raised when the value is used.
+        """
+        types = ledger.types
+        received_currencies = ledger.received_currencies
+        sent_currencies = ledger.sent_currencies
+        is_trade = np.isin(types, list(trade_types))
+        is_fiat = np.vectorize(self._is_fiat, otypes=[bool])
+        assets = np.where(types == 'Received', received_currencies, sent_currencies)
+        is_needed = ~is_skipped & (
+                ((types == 'Received') & ~has_transfer)
+                | ((types == 'Sent') & ~has_transfer)
+                | (is_trade & ~is_fiat(sent_currencies) & ~is_fiat(received_currencies)))
+        is_needed[:start] = False
+        indices = np.flatnonzero(is_needed)
+        times = {index: ledger.get_local_time_s(index) for index in indices}
+        self._price_data.prefetch_hour_values([(assets[index], self._fiat, times[index])
+                                               for index in indices
+                                               if isinstance(assets[index], str)])
+
+        result = np.full(len(ledger), np.nan)
+        errors = dict()
+        for index in indices:
+            try:
+                result[index] = self._price_data.get_hour_value(assets[index], self._fiat, times[index])
+            except Exception as e:
+                errors[index] = e
+        return result, errors
+
+    def _get_fiat_values(self, ledger: Ledger, unit_values: np.ndarray) -> np.ndarray:
+        """
+        :return: The fiat value of each row if it is not part of a transfer.
+        """
+        types = ledger.types
+        is_fiat = np.vectorize(self._is_fiat, otypes=[bool])
+        is_trade = np.isin(types, list(trade_types))
+        is_sent_fiat = is_fiat(ledger.sent_currencies)
+        is_received_fiat = is_fiat(ledger.received_currencies)
+        received_quantities = ledger.received_quantities.astype(np.float64)
+        sent_quantities = ledger.sent_quantities.astype(np.float64)
+        return np.select([types == 'Received',
+                          types == 'Sent',
+                          is_trade & is_sent_fiat,
+                          is_trade & is_received_fiat,
+                          is_trade],
+                         [received_quantities * unit_values,
+                          sent_quantities * unit_values,
+                          sent_quantities,
+                          received_quantities,
+                          sent_quantities * unit_values],
+                         default=np.nan)
 
     def check_traded(self,
                      symbol: str,
-                     index: int, data: pd.DataFrame,
+                     index: int, ledger: Ledger,
                      num_days: float,
-                     received_currency_index: int,
+                     purchases: AssetTimeIndex,
                      after: bool = True):
-        result = False
+        """
+        :param purchases: The trades indexed by the asset received.
+        :return: `True` if `symbol` was bought within `num_days` after (or before) the row at `index`.
+        """
         if num_days <= 0:
-            return result
-        date = data.iloc[index].Date
-
-        while True:
-            if after:
-                index += 1
-                if index >= len(data):
-                    break
-            else:
-                index -= 1
-                if index < 0:
-                    break
-
-            row = data.iloc[index]
-            if np.abs(row.Date - date).seconds / seconds_per_day > self._num_superficial_loss_days:
-                break
-            if row.Type in trade_types and row[received_currency_index] == symbol:
-                result = True
-                break
+            return False
+        date_ns = ledger.date_ns[index]
+        window_ns = int(num_days * seconds_per_day * 10 ** 9)
+        if after:
+            return purchases.has_rows_after(symbol, index, date_ns + window_ns)
+        else:
+            return purchases.has_rows_before(symbol, index, date_ns - window_ns)
 
-        return result
+    def find_nearby(self, index: int, ledger: Ledger, is_matched: np.ndarray,
+                    candidates: AssetTimeIndex) -> Optional[int]:
+        """
+        Find the other side of a transfer.
 
-    def find_nearby(self, symbol: str, row, data: pd.DataFrame, matched_rows: bidict,
-                    received_quantity_index: int, sent_quantity_index: int):
+        :param index: The index of a 'Received' or 'Sent' row.
+        :param is_matched: Indicates rows that are already part of a transfer.
+        :param candidates: The rows that could be the other side of the transfer.
+        :return: The index of an unmatched row for about the same amount of the same asset close in time.
+            The closest earlier row is preferred, then the closest later row.
+        """
         result = None
 
-        result_index = matched_rows.get(row.Index)
-        if result_index is not None:
-            return data.iloc[result_index]
-
-        if row.Type == 'Received':
-            amount = row[received_quantity_index]
-            amount_field = 'Sent Quantity'
-            currency_field = 'Sent Currency'
-            types_to_find = {'Sent', 'Transfer'}
-        elif row.Type == 'Sent':
-            amount = row[sent_quantity_index]
-            amount_field = 'Received Quantity'
-            currency_field = 'Received Currency'
-            types_to_find = {'Received', 'Transfer'}
+        row_type = ledger.types[index]
+        if row_type == 'Received':
+            symbol = ledger.received_currencies[index]
+            amount = ledger.received_quantities[index]
+            amounts = ledger.sent_quantities
+        elif row_type == 'Sent':
+            symbol = ledger.sent_currencies[index]
+            amount = ledger.sent_quantities[index]
+            amounts = ledger.received_quantities
         else:
-            raise ValueError(f"Unrecognized row type in {row}")
-
-        date = row.Date
+            raise ValueError(f"Unrecognized row type in {ledger.get_row(index)}")
+
+        date_ns = ledger.date_ns[index]
+        window_ns = int(self._num_transfer_days * seconds_per_day * 10 ** 9)
+        rows = candidates.get_rows(symbol, date_ns - window_ns, date_ns + window_ns)
+        rows = rows[~is_matched[rows]]
+        rows = rows[np.isclose(np.asarray(amounts[rows], dtype=np.float64), amount, rtol=0.05)]
+        if len(rows) > 0:
+            # `index` is not a candidate since candidates have a different type.
+            position = np.searchsorted(rows, index)
+            if position > 0:
+                result = int(rows[position - 1])
+            else:
+                result = int(rows[0])
 
-        for i in range(row.Index - 1, -1, -1):
-            if i in matched_rows or i in matched_rows.inv:
-                continue
-            found_row = data.iloc[i]
-            if (date - found_row.Date).seconds / seconds_per_day > self._num_transfer_days:
-                break
-            if found_row.Type in types_to_find \
-                    and symbol == getattr(found_row, currency_field) \
-                    and np.isclose(getattr(found_row, amount_field), amount, rtol=0.05):
-                result = found_row
-                matched_rows[i] = row.Index
-                break
-
-        if result is None:
-            for i in range(row.Index + 1, len(data)):
-                if i in matched_rows or i in matched_rows.inv:
-                    continue
-                found_row = data.iloc[i]
-                if (found_row.Date - date).seconds / seconds_per_day > self._num_transfer_days:
-                    break
-                if found_row.Type in types_to_find \
-                        and symbol == getattr(found_row, currency_field) \
-                        and np.isclose(getattr(found_row, amount_field), amount, rtol=0.05):
-                    result = found_row
-                    matched_rows[i] = row.Index
-                    break
-
-        if result is not None:
-            self._logger.debug("For row: %s\nfound  :%s", row, result)
+        if result is not None and self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug("For row: %s\nfound  :%s", ledger.get_row(index), ledger.get_row(result))
         return result
 
-    def summarize(self, assets: Dict[str, DigitalAssetHodling],
+    def summarize(self, holdings: HoldingsTable,
                   losses: List[tuple],
                   year: Optional[int] = None, show_all_assets: bool = False):
-        total_proceeds = 0
-        total_cost_of_amount_sold = 0
-
         if year is None:
             print("Summary:")
         else:
             print(f"Summary of {year}:")
 
-        if show_all_assets:
-            asset_iter = sorted(assets.items(),
-                                key=lambda a: a[1].get_proceeds(year) - a[1].get_total_cost_of_amount_sold(year),
-                                reverse=True)
-        else:
-            asset_iter = assets.items()
+        proceeds = holdings.get_proceeds(year)
+        costs_sold = holdings.get_costs_of_amounts_sold(year)
+        total_proceeds = proceeds.sum()
+        total_cost_of_amount_sold = costs_sold.sum()
 
-        for name, asset_hodlings in asset_iter:
-            asset_hodlings: DigitalAssetHodling
-            proceeds = asset_hodlings.get_proceeds(year)
-            cost_basis = asset_hodlings.get_total_cost_of_amount_sold(year)
-
-            total_proceeds += proceeds
-            total_cost_of_amount_sold += cost_basis
-            if show_all_assets:
-                print(name)
-                if year is None:
-                    print(f"  Amount: {asset_hodlings.amount}")
-                print(f"  Proceeds: {proceeds}")
-                print(f"  Cost basis for amount sold: {cost_basis}")
-                print(f"  Diff: {proceeds - cost_basis}")
         if show_all_assets:
+            names = holdings.names
+            amounts = holdings.amounts
+            for i in np.argsort(-(proceeds - costs_sold), kind='stable'):
+                print(names[i])
+                if year is None:
+                    print(f"  Amount: {amounts[i]}")
+                print(f"  Proceeds: {proceeds[i]}")
+                print(f"  Cost basis for amount sold: {costs_sold[i]}")
+                print(f"  Diff: {proceeds[i] - costs_sold[i]}")
             print()
         print(f"Total proceeds: {total_proceeds}")
         print(f"Total cost basis for amounts sold: {total_cost_of_amount_sold}")
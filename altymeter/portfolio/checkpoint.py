@@ -0,0 +1,161 @@
+import os
+import pickle
+from collections import namedtuple
+from logging import Logger
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from altymeter.portfolio.ledger import Ledger, ledger_columns
+
+# Increase when the format or the meaning of the saved state changes.
+_version = 2
+
+
+class AnalysisState(namedtuple('AnalysisState', [
+    'row',
+    'holdings',
+    'num_losses',
+    'prev_year',
+])):
+    """
+    The state of an analysis right before processing a row.
+
+    :param row: The index of the next row to process.
+    :param holdings: The holdings of each asset.
+    :param num_losses: The number of losses found so far.
+    :param prev_year: The year of the last row processed.
+    """
+
+
+class Resume(namedtuple('Resume', [
+    'state',
+    'losses',
+    'fiat_values',
+    'gains',
+    'transfer_pairs',
+    'checkpoints',
+])):
+    """
+    What is needed to resume an analysis from a checkpoint.
+
+    :param state: The state to resume from.
+    :param losses: The losses found before `state.row`.
+    :param fiat_values: The fiat value of each row before `state.row`.
+    :param gains: The gain of each row before `state.row`.
+    :param transfer_pairs: The (row, matched row) pairs of transfers matched by rows before `state.row`.
+    :param checkpoints: The checkpoints up to `state`, which are still valid.
+    """
+
+
+def get_row_hashes(data: pd.DataFrame) -> np.ndarray:
+    """
+    :return: A hash of each row of a ledger.
+    """
+    return pd.util.hash_pandas_object(data[ledger_columns], index=False).to_numpy()
+
+
+class AnalysisCheckpoints(object):
+    """
+    Saves the state of an analysis at some rows so that a later analysis can resume from the last state
+    that does not depend on rows that changed.
+
+    :param path: The file to save checkpoints in.
+    :param fingerprint: Identifies the settings used for the analysis.
+        Checkpoints saved with different settings are ignored.
+    :param lookahead_ns: How far after a row, in nanoseconds, that processing the row can look.
+    """
+
+    def __init__(self, path: str, fingerprint: str, lookahead_ns: int, logger: Logger):
+        self._path = path
+        self._fingerprint = fingerprint
+        self._lookahead_ns = lookahead_ns
+        self._logger = logger
+
+    def _load(self) -> Optional[dict]:
+        if not os.path.exists(self._path):
+            return None
+        try:
+            with open(self._path, 'rb') as f:
+                result = pickle.load(f)
+        except:
+            self._logger.exception("Error loading checkpoints from `%s`.", self._path)
+            return None
+        if result.get('version') != _version or result.get('fingerprint') != self._fingerprint:
+            self._logger.info("Ignoring checkpoints in `%s` since they were saved with different settings.",
+                              self._path)
+            return None
+        return result
+
+    def get_resume(self, ledger: Ledger, row_hashes: np.ndarray) -> Optional[Resume]:
+        """
+        :param ledger: The ledger to analyze.
+        :param row_hashes: The hashes of the rows of `ledger`.
+        :return: How to resume analyzing `ledger` or `None` to start from the beginning.
+        """
+        saved = self._load()
+        if saved is None:
+            return None
+
+        saved_hashes = saved['row_hashes']
+        saved_date_ns = saved['date_ns']
+        num_common = min(len(saved_hashes), len(row_hashes))
+        changed = np.flatnonzero(saved_hashes[:num_common] != row_hashes[:num_common])
+        first_changed = changed[0] if len(changed) > 0 else num_common
+        # The earliest time of a row that was added, removed, or changed.
+        changed_date_ns = []
+        if first_changed < len(row_hashes):
+            changed_date_ns.append(ledger.date_ns[first_changed])
+        if first_changed < len(saved_hashes):
+            changed_date_ns.append(saved_date_ns[first_changed])
+
+        state = None
+        num_checkpoints = 0
+        for i, checkpoint in enumerate(saved['checkpoints']):
+            row = checkpoint.row
+            if row > first_changed:
+                break
+            if row > 0 and changed_date_ns \
+                    and saved_date_ns[row - 1] + self._lookahead_ns >= min(changed_date_ns):
+                # Rows before the checkpoint could have looked at changed rows.
+                break
+            state = checkpoint
+            num_checkpoints = i + 1
+        if state is None:
+            return None
+
+        row = state.row
+        transfer_pairs = [(r, found) for r, found in saved['transfer_pairs'] if r < row]
+        return Resume(state,
+                      losses=saved['losses'][:state.num_losses],
+                      fiat_values=saved['fiat_values'][:row],
+                      gains=saved['gains'][:row],
+                      transfer_pairs=transfer_pairs,
+                      checkpoints=saved['checkpoints'][:num_checkpoints])
+
+    def save(self, ledger: Ledger, row_hashes: np.ndarray,
+             checkpoints: List[AnalysisState],
+             losses: List[tuple],
+             fiat_values: list, gains: list,
+             transfer_pairs: List[Tuple[int, int]]):
+        """
+        Save the checkpoints of a complete analysis.
+        """
+        saved = dict(version=_version,
+                     fingerprint=self._fingerprint,
+                     row_hashes=row_hashes,
+                     date_ns=ledger.date_ns,
+                     checkpoints=checkpoints,
+                     losses=losses,
+                     fiat_values=fiat_values,
+                     gains=gains,
+                     transfer_pairs=transfer_pairs)
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            tmp_path = '{}.tmp'.format(self._path)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path)
+        except:
+            self._logger.exception("Error saving checkpoints to `%s`.", self._path)
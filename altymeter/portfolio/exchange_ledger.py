@@ -0,0 +1,234 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from logging import Logger
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from injector import inject, singleton
+
+from altymeter.api.exchange import ExchangeFill, ExchangeTransfer, TradingExchange
+from altymeter.module.constants import Configuration
+from altymeter.portfolio.ledger import ledger_columns
+
+
+@singleton
+class ExchangeLedger(object):
+    """
+    Your trades, deposits, and withdrawals downloaded from exchanges and kept in the database.
+    Each sync only asks for what happened since the previous sync.
+
+    Configured with `analysis.exchanges`, e.g.:
+        - name: Kraken
+        - name: Binance
+          # Binance needs the pairs to get trades for.
+          pairs: [ETHBTC]
+    """
+
+    @inject
+    def __init__(self, config: Configuration,
+                 db: sqlite3.Connection,
+                 exchanges: Dict[str, TradingExchange],
+                 logger: Logger):
+        self._db = db
+        self._exchanges = exchanges
+        self._logger = logger
+
+        analysis_config = config.get('analysis') or {}
+        self._exchanges_config = analysis_config.get('exchanges') or []
+        self._max_workers = analysis_config.get('exchange max workers', 8)
+        # Ask for some history before the last sync again in case it was recorded late.
+        self._sync_overlap_s = analysis_config.get('exchange sync overlap seconds', 24 * 60 * 60)
+
+        self._db_lock = threading.Lock()
+
+    @property
+    def is_configured(self) -> bool:
+        return len(self._exchanges_config) > 0
+
+    def _get_jobs(self) -> List[Tuple[TradingExchange, str, Optional[str]]]:
+        """
+        :return: The exchange, kind of history, and pair (if any) for each history to download.
+        """
+        result = []
+        for exchange_config in self._exchanges_config:
+            name = exchange_config['name']
+            exchange = self._exchanges.get(name) or self._exchanges.get(name.lower())
+            if exchange is None:
+                self._logger.warning("The exchange \"%s\" is not in your configuration.", name)
+                continue
+            result.append((exchange, 'deposits', None))
+            result.append((exchange, 'withdrawals', None))
+            if exchange.trade_history_requires_pair:
+                pairs = exchange_config.get('pairs') or []
+                if not pairs:
+                    self._logger.warning("No pairs given to get trades for from %s.", exchange.name)
+                for pair in pairs:
+                    result.append((exchange, 'fills', pair))
+            else:
+                result.append((exchange, 'fills', None))
+        return result
+
+    @staticmethod
+    def _get_stream(kind: str, pair: Optional[str]) -> str:
+        if pair is None:
+            return kind
+        return '{}:{}'.format(kind, pair)
+
+    def _get_cursor(self, exchange: str, stream: str) -> Optional[float]:
+        with self._db_lock:
+            cursor = self._db.cursor()
+            cursor.execute('SELECT time FROM exchange_sync WHERE exchange=? AND stream=?', (exchange, stream))
+            row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def _fetch(self, exchange: TradingExchange, kind: str, pair: Optional[str], since_s: Optional[float]) \
+            -> Tuple[list, float]:
+        sync_time = time.time()
+        since = None
+        if since_s is not None:
+            since = datetime.utcfromtimestamp(max(0, since_s - self._sync_overlap_s))
+        if kind == 'deposits':
+            entries = exchange.get_deposit_history(since=since)
+        elif kind == 'withdrawals':
+            entries = exchange.get_withdrawal_history(since=since)
+        elif kind == 'fills':
+            entries = exchange.get_trade_history(pair, since=since)
+        else:
+            raise ValueError("Invalid kind: '{}'".format(kind))
+        return entries, sync_time
+
+    @staticmethod
+    def _to_timestamp(date: datetime) -> float:
+        return (date - datetime(1970, 1, 1)).total_seconds()
+
+    def _save(self, exchange: str, stream: str, entries: list, sync_time: float):
+        fills = [(f.exchange, f.id, f.name, self._to_timestamp(f.date), f.action_type,
+                  f.base, f.to, f.price, f.volume, f.fee, f.fee_asset)
+                 for f in entries if isinstance(f, ExchangeFill)]
+        transfers = [(t.exchange, t.type, t.name, self._to_timestamp(t.date), t.amount, t.transfer_cost,
+                      t.destination or t.origin)
+                     for t in entries if isinstance(t, ExchangeTransfer)]
+        with self._db_lock:
+            cursor = self._db.cursor()
+            cursor.executemany('INSERT OR IGNORE INTO exchange_fill VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               fills)
+            cursor.executemany('INSERT OR IGNORE INTO exchange_transfer VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               transfers)
+            cursor.execute('INSERT OR REPLACE INTO exchange_sync VALUES (?, ?, ?)', (exchange, stream, sync_time))
+            self._db.commit()
+
+    def sync(self):
+        """
+        Download new history from the configured exchanges.
+        Histories are downloaded concurrently for each exchange and pair.
+        """
+        jobs = self._get_jobs()
+        if not jobs:
+            return
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='exchange_ledger') as executor:
+            futures = dict()
+            for exchange, kind, pair in jobs:
+                stream = self._get_stream(kind, pair)
+                since_s = self._get_cursor(exchange.name, stream)
+                future = executor.submit(self._fetch, exchange, kind, pair, since_s)
+                futures[future] = (exchange.name, stream)
+            for future in as_completed(futures):
+                exchange, stream = futures[future]
+                try:
+                    entries, sync_time = future.result()
+                except NotImplementedError:
+                    self._logger.warning("Getting %s from %s is not supported.", stream, exchange)
+                    continue
+                except:
+                    self._logger.exception("Error getting %s from %s.", stream, exchange)
+                    continue
+                self._logger.info("Got %d %s from %s.", len(entries), stream, exchange)
+                self._save(exchange, stream, entries, sync_time)
+
+    def load(self) -> pd.DataFrame:
+        """
+        :return: The downloaded history of the configured exchanges as a ledger sorted by date.
+        """
+        exchanges = [exchange_config['name'] for exchange_config in self._exchanges_config]
+        exchanges = [(self._exchanges.get(name) or self._exchanges.get(name.lower()) or name) for name in exchanges]
+        exchanges = [e.name if isinstance(e, TradingExchange) else e for e in exchanges]
+        placeholders = ','.join('?' * len(exchanges))
+        with self._db_lock:
+            fills = pd.read_sql_query('SELECT * FROM exchange_fill WHERE exchange IN ({})'.format(placeholders),
+                                      self._db, params=exchanges)
+            transfers = pd.read_sql_query(
+                'SELECT * FROM exchange_transfer WHERE exchange IN ({})'.format(placeholders),
+                self._db, params=exchanges)
+
+        unknown = fills.base.isna() | fills.to_asset.isna()
+        if unknown.any():
+            self._logger.warning("Ignoring %d trades for unknown pairs: %s", unknown.sum(),
+                                 sorted(fills.pair[unknown].unique()))
+            fills = fills[~unknown]
+
+        result = pd.concat([self._convert_fills(fills), self._convert_transfers(transfers)], ignore_index=True)
+        result.sort_values('Date', kind='mergesort', inplace=True)
+        result.reset_index(drop=True, inplace=True)
+        return result[ledger_columns]
+
+    @staticmethod
+    def _convert_fills(fills: pd.DataFrame) -> pd.DataFrame:
+        is_buy = (fills.action_type == 'buy').to_numpy()
+        base = fills.base.to_numpy()
+        to = fills.to_asset.to_numpy()
+        volume = fills.volume.to_numpy()
+        cost = (fills.price * fills.volume).to_numpy()
+        fee = fills.fee.fillna(0).to_numpy()
+        is_base_fee = (fills.fee_asset == fills.base).to_numpy()
+        is_to_fee = (fills.fee_asset == fills.to_asset).to_numpy()
+        # Fees in other assets (e.g. BNB on Binance) are not included.
+        received_currency = np.where(is_buy, to, base)
+        sent_currency = np.where(is_buy, base, to)
+        received_quantity = np.where(is_buy,
+                                     volume - np.where(is_to_fee, fee, 0),
+                                     cost - np.where(is_base_fee, fee, 0))
+        sent_quantity = np.where(is_buy,
+                                 cost + np.where(is_base_fee, fee, 0),
+                                 volume + np.where(is_to_fee, fee, 0))
+        return pd.DataFrame({
+            'Date': pd.to_datetime(fills.time.to_numpy(), unit='s').astype('datetime64[ns]'),
+            'Type': 'Trade',
+            'Received Quantity': received_quantity,
+            'Received Currency': received_currency,
+            'Received Exchange': fills.exchange.to_numpy(),
+            'Received Wallet': received_currency + ' Wallet',
+            'Received Wallet Type': None,
+            'Sent Quantity': sent_quantity,
+            'Sent Currency': sent_currency,
+            'Sent Exchange': fills.exchange.to_numpy(),
+            'Sent Wallet': sent_currency + ' Wallet',
+            'Sent Wallet Type': None,
+            'Disabled': None,
+        }, columns=ledger_columns)
+
+    @staticmethod
+    def _convert_transfers(transfers: pd.DataFrame) -> pd.DataFrame:
+        is_deposit = (transfers.type == 'DEPOSIT').to_numpy()
+        asset = transfers.asset.to_numpy()
+        amount = transfers.amount.to_numpy()
+        exchange = transfers.exchange.to_numpy()
+        wallet = asset + ' Wallet'
+        return pd.DataFrame({
+            'Date': pd.to_datetime(transfers.time.to_numpy(), unit='s').astype('datetime64[ns]'),
+            'Type': np.where(is_deposit, 'Received', 'Sent'),
+            'Received Quantity': np.where(is_deposit, amount, np.nan),
+            'Received Currency': np.where(is_deposit, asset, None),
+            'Received Exchange': np.where(is_deposit, exchange, None),
+            'Received Wallet': np.where(is_deposit, wallet, None),
+            'Received Wallet Type': None,
+            'Sent Quantity': np.where(is_deposit, np.nan, amount),
+            'Sent Currency': np.where(is_deposit, None, asset),
+            'Sent Exchange': np.where(is_deposit, None, exchange),
+            'Sent Wallet': np.where(is_deposit, None, wallet),
+            'Sent Wallet Type': None,
+            'Disabled': None,
+        }, columns=ledger_columns)
@@ -0,0 +1,130 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+class HoldingsTable(object):
+    """
+    The holdings of every asset as columns of arrays indexed by asset id.
+    Proceeds and the cost of amounts sold are also grouped by year.
+
+    Updates have the same checks as they would for Python floats,
+    e.g. selling from an asset with no amount raises `ZeroDivisionError`.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._ids = dict()
+        self._names = []
+        self._amounts = np.zeros(capacity)
+        self._costs = np.zeros(capacity)
+
+        self._year_columns = dict()
+        # Shape: (asset capacity, year capacity).
+        self._proceeds = np.zeros((capacity, 4))
+        self._costs_sold = np.zeros((capacity, 4))
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._names)
+
+    @property
+    def amounts(self) -> np.ndarray:
+        return self._amounts[:len(self)]
+
+    def get_id(self, name: str) -> int:
+        """
+        :return: The id for the asset called `name`. It is added if it is not in the table yet.
+        """
+        result = self._ids.get(name)
+        if result is None:
+            result = len(self._names)
+            if result == len(self._amounts):
+                self._grow_assets()
+            self._ids[name] = result
+            self._names.append(name)
+        return result
+
+    def _grow_assets(self):
+        capacity = 2 * len(self._amounts)
+        self._amounts = np.resize(self._amounts, capacity)
+        self._amounts[len(self):] = 0
+        self._costs = np.resize(self._costs, capacity)
+        self._costs[len(self):] = 0
+        self._proceeds = np.vstack([self._proceeds, np.zeros_like(self._proceeds)])
+        self._costs_sold = np.vstack([self._costs_sold, np.zeros_like(self._costs_sold)])
+
+    def _get_year_column(self, year: int) -> int:
+        result = self._year_columns.get(year)
+        if result is None:
+            result = len(self._year_columns)
+            if result == self._proceeds.shape[1]:
+                self._proceeds = np.hstack([self._proceeds, np.zeros_like(self._proceeds)])
+                self._costs_sold = np.hstack([self._costs_sold, np.zeros_like(self._costs_sold)])
+            self._year_columns[year] = result
+        return result
+
+    def get_amount(self, asset_id: int) -> float:
+        return float(self._amounts[asset_id])
+
+    def get_avg_cost(self, asset_id: int) -> float:
+        amount = self._amounts[asset_id]
+        if amount != 0:
+            return float(self._costs[asset_id] / amount)
+        else:
+            return 0
+
+    def add(self, asset_id: int, amount: float, cost: float):
+        self._amounts[asset_id] += amount
+        self._costs[asset_id] += cost
+
+    def subtract(self, asset_id: int, amount: float):
+        assert isinstance(amount, float)
+        current_amount = self._amounts[asset_id]
+        assert current_amount > 0
+        self._costs[asset_id] *= (current_amount - amount) / current_amount
+        self._amounts[asset_id] -= amount
+
+    def add_loss(self, asset_id: int, loss: float):
+        """
+        Consider a loss as a superficial loss and add it to the cost basis.
+        :param loss: The positive amount of fiat lost in a trade.
+        """
+        assert loss > 0
+        self._costs[asset_id] += loss
+
+    def update_cost_of_amount_sold(self, asset_id: int, amount: float, year: int):
+        # Update total_cost based on proportion of amount.
+        current_amount = self._amounts[asset_id]
+        if current_amount == 0:
+            raise ZeroDivisionError("No amount of {} to sell.".format(self._names[asset_id]))
+        self._costs_sold[asset_id, self._get_year_column(year)] += \
+            amount / current_amount * self._costs[asset_id]
+
+    def update_proceeds(self, asset_id: int, proceeds: float, year: int):
+        self._proceeds[asset_id, self._get_year_column(year)] += proceeds
+
+    def _get_by_year(self, values: np.ndarray, year: Optional[int]) -> np.ndarray:
+        values = values[:len(self), :len(self._year_columns)]
+        if year is None:
+            return values.sum(axis=1)
+        column = self._year_columns.get(year)
+        if column is None:
+            return np.zeros(len(self))
+        return values[:, column]
+
+    def get_proceeds(self, year: Optional[int] = None) -> np.ndarray:
+        """
+        :param year: The year to get proceeds for or `None` for all years.
+        :return: The proceeds of each asset.
+        """
+        return self._get_by_year(self._proceeds, year)
+
+    def get_costs_of_amounts_sold(self, year: Optional[int] = None) -> np.ndarray:
+        """
+        :param year: The year to get costs for or `None` for all years.
+        :return: The cost basis of the amount sold of each asset.
+        """
+        return self._get_by_year(self._costs_sold, year)
@@ -0,0 +1,229 @@
+import time
+from collections import defaultdict
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+
+ledger_columns = [
+    'Date', 'Type',
+    'Received Quantity', 'Received Currency', 'Received Exchange', 'Received Wallet', 'Received Wallet Type',
+    'Sent Quantity', 'Sent Currency', 'Sent Exchange', 'Sent Wallet', 'Sent Wallet Type',
+    'Disabled',
+]
+
+# Maps the old names of columns to their current names.
+_legacy_columns = {
+    'Quantity': 'Received Quantity',
+    'Currency': 'Received Currency',
+    'Exchange': 'Received Exchange',
+    'Wallet': 'Received Wallet',
+    'Price': 'Sent Quantity',
+    'Currency.1': 'Sent Currency',
+    'Exchange.1': 'Sent Exchange',
+    'Wallet.1': 'Sent Wallet',
+}
+
+# `Disabled` is left to be inferred since it can be a flag or text.
+_column_dtypes = {
+    'Type': str,
+    'Received Quantity': np.float64,
+    'Received Currency': str,
+    'Received Exchange': str,
+    'Received Wallet': str,
+    'Received Wallet Type': str,
+    'Sent Quantity': np.float64,
+    'Sent Currency': str,
+    'Sent Exchange': str,
+    'Sent Wallet': str,
+    'Sent Wallet Type': str,
+}
+
+
+class Ledger(object):
+    """
+    The columns of a ledger of actions (trades, sends, receives, and transfers) as arrays
+    so that rows do not need to be materialized while analyzing them.
+
+    :param data: The actions in the columns of `ledger_columns` sorted by date with a reset index.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self._data = data
+
+        self.types = data['Type'].to_numpy()
+        self.disabled = np.array(data['Disabled'].tolist(), dtype=object)
+        self.received_currencies = data['Received Currency'].to_numpy()
+        self.received_quantities = data['Received Quantity'].to_numpy()
+        self.sent_currencies = data['Sent Currency'].to_numpy()
+        self.sent_quantities = data['Sent Quantity'].to_numpy()
+        self.received_wallet_types = data['Received Wallet Type'].to_numpy()
+
+        self.dates = data['Date'].to_numpy(dtype='datetime64[ns]')
+        self.date_ns = self.dates.astype(np.int64)
+        self.years = data['Date'].dt.year.to_numpy()
+        self.datetimes = np.asarray(data['Date'].dt.to_pydatetime(), dtype=object)
+
+    def __len__(self):
+        return len(self.types)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        return self._data
+
+    def get_row(self, index: int) -> pd.Series:
+        """
+        :return: The row at `index`. Slow, so only use it for messages.
+        """
+        return self._data.iloc[index]
+
+    def get_local_time_s(self, index: int) -> float:
+        """
+        :return: The time of the row at `index` in seconds, interpreting the date in the local time zone.
+        """
+        return time.mktime(self.datetimes[index].timetuple())
+
+
+class AssetTimeIndex(object):
+    """
+    The rows for each asset sorted by time so that the rows for an asset in a time window can be found with binary search.
+
+    :param assets: The asset of each row.
+    :param date_ns: The time of each row in nanoseconds. Must be sorted.
+    :param include: Indicates the rows to include.
+    """
+
+    def __init__(self, assets: np.ndarray, date_ns: np.ndarray, include: np.ndarray):
+        rows_by_asset = defaultdict(list)
+        for row in np.flatnonzero(include):
+            rows_by_asset[assets[row]].append(row)
+        self._rows = dict()
+        self._date_ns = dict()
+        for asset, rows in rows_by_asset.items():
+            rows = np.array(rows, dtype=np.int64)
+            self._rows[asset] = rows
+            self._date_ns[asset] = date_ns[rows]
+
+    def get_rows(self, asset, start_ns: int, end_ns: int) -> np.ndarray:
+        """
+        :return: The indices, in order, of the rows for `asset` with times from `start_ns` to `end_ns` inclusive.
+        """
+        date_ns = self._date_ns.get(asset)
+        if date_ns is None:
+            return np.zeros(0, dtype=np.int64)
+        start = np.searchsorted(date_ns, start_ns, side='left')
+        end = np.searchsorted(date_ns, end_ns, side='right')
+        return self._rows[asset][start:end]
+
+    def has_rows_after(self, asset, row: int, end_ns: int) -> bool:
+        """
+        :return: `True` if there are rows for `asset` after `row` with times up to `end_ns` inclusive.
+        """
+        rows = self._rows.get(asset)
+        if rows is None:
+            return False
+        start = np.searchsorted(rows, row, side='right')
+        end = np.searchsorted(self._date_ns[asset], end_ns, side='right')
+        return end > start
+
+    def has_rows_before(self, asset, row: int, start_ns: int) -> bool:
+        """
+        :return: `True` if there are rows for `asset` before `row` with times from `start_ns` inclusive.
+        """
+        rows = self._rows.get(asset)
+        if rows is None:
+            return False
+        start = np.searchsorted(self._date_ns[asset], start_ns, side='left')
+        end = np.searchsorted(rows, row, side='left')
+        return end > start
+
+
+def _normalize(data: pd.DataFrame, renames: dict) -> pd.DataFrame:
+    data = data.rename(columns=renames)
+    for column in ledger_columns:
+        if column not in data.columns:
+            data[column] = np.nan if _column_dtypes.get(column) == np.float64 else None
+    return data[ledger_columns]
+
+
+def _is_sorted(path: str, chunk_size: int) -> bool:
+    prev_date = None
+    for chunk in pd.read_csv(path, usecols=['Date'], parse_dates=['Date'], chunksize=chunk_size):
+        dates = chunk['Date']
+        if not dates.is_monotonic_increasing:
+            return False
+        if len(dates) > 0:
+            if prev_date is not None and dates.iloc[0] < prev_date:
+                return False
+            prev_date = dates.iloc[-1]
+    return True
+
+
+def read_ledger(path: str, chunk_size: int = 100000) -> Iterator[pd.DataFrame]:
+    """
+    Read a ledger in chunks sorted by date.
+    Columns are normalized to `ledger_columns`, including the old column names.
+    Files that are not already sorted by date are loaded fully to sort them.
+
+    :param path: The path to a CSV file.
+    :param chunk_size: The number of rows to read at a time.
+    :return: The chunks of the ledger.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    renames = {old: new for old, new in _legacy_columns.items()
+               if old in header and new not in header}
+    use_columns = [c for c in header if renames.get(c, c) in ledger_columns]
+    dtype = {c: _column_dtypes[renames.get(c, c)] for c in use_columns if renames.get(c, c) in _column_dtypes}
+    read_kwargs = dict(usecols=use_columns, dtype=dtype, parse_dates=['Date'])
+
+    if _is_sorted(path, chunk_size):
+        for chunk in pd.read_csv(path, chunksize=chunk_size, **read_kwargs):
+            yield _normalize(chunk, renames)
+    else:
+        data = pd.read_csv(path, **read_kwargs)
+        data.sort_values('Date', kind='mergesort', inplace=True)
+        data = _normalize(data, renames)
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+
+
+def merge_sorted(streams: List[Iterator[pd.DataFrame]]) -> Iterator[pd.DataFrame]:
+    """
+    Merge streams of chunks that are each sorted by date into one stream sorted by date.
+    Only the current chunk of each stream is kept in memory.
+    Rows with the same date keep the order of `streams`.
+    """
+    streams = list(map(iter, streams))
+    buffers = [None] * len(streams)
+
+    def fill():
+        for i, stream in enumerate(streams):
+            while stream is not None and (buffers[i] is None or len(buffers[i]) == 0):
+                buffers[i] = next(stream, None)
+                if buffers[i] is None:
+                    streams[i] = stream = None
+
+    fill()
+    while any(b is not None for b in buffers):
+        # Every row up to the smallest last date in the buffers can be emitted
+        # since later chunks of each stream only have later rows.
+        watermark = min(b['Date'].iloc[-1] for b in buffers if b is not None)
+        parts = []
+        for i, buffer in enumerate(buffers):
+            if buffer is None:
+                continue
+            end = np.searchsorted(buffer['Date'].to_numpy(), np.datetime64(watermark), side='right')
+            parts.append(buffer.iloc[:end])
+            buffers[i] = buffer.iloc[end:]
+        result = pd.concat(parts)
+        yield result.sort_values('Date', kind='mergesort')
+        fill()
+
+
+def read_ledgers(paths: List[str], chunk_size: int = 100000) -> Iterator[pd.DataFrame]:
+    """
+    :param paths: The paths to CSV files of ledgers.
+    :param chunk_size: The number of rows to read at a time from each file.
+    :return: The rows of all of the ledgers in chunks sorted by date.
+    """
+    return merge_sorted([read_ledger(path, chunk_size) for path in paths])
@@ -0,0 +1,87 @@
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from altymeter.portfolio.analysis import Portfolio
+from altymeter.portfolio.exchange_ledger import ExchangeLedger
+from altymeter.portfolio.ledger import ledger_columns
+
+
+class _StubPriceData(object):
+    hour_value_stats = dict()
+
+    def __init__(self, prices):
+        # Maps the symbol and day to the value of one unit.
+        self._prices = prices
+
+    def prefetch_hour_values(self, needs):
+        pass
+
+    def get_hour_value(self, symbol, fiat_symbol, time_in_s):
+        return self._prices[(symbol, datetime.fromtimestamp(time_in_s).strftime('%Y-%m-%d'))]
+
+    def flush_hour_values(self):
+        pass
+
+
+def _row(date, row_type, received_quantity, received_currency, sent_quantity, sent_currency) -> dict:
+    result = {column: None for column in ledger_columns}
+    result.update({
+        'Date': date, 'Type': row_type,
+        'Received Quantity': received_quantity, 'Received Currency': received_currency,
+        'Sent Quantity': sent_quantity, 'Sent Currency': sent_currency,
+    })
+    return result
+
+
+class TestPortfolio(unittest.TestCase):
+    def test_analyze(self):
+        data = pd.DataFrame([
+            _row('2017-01-01 12:00', 'Trade', 2., 'BTC', 2000., 'CAD'),
+            # Gain of 1500 - 1000.
+            _row('2017-02-01 12:00', 'Trade', 10., 'ETH', 1., 'BTC'),
+            # Loss of 750 - 500 but ETH is bought again within 30 days so it is added to the ACB.
+            _row('2017-03-01 12:00', 'Trade', 500., 'CAD', 5., 'ETH'),
+            _row('2017-03-10 12:00', 'Trade', 1., 'ETH', 100., 'CAD'),
+            # Loss of 3 * 1100 / 6 - 150 which can be claimed.
+            _row('2017-06-01 12:00', 'Sent', None, None, 3., 'ETH'),
+        ], columns=ledger_columns)
+        price_data = _StubPriceData({('BTC', '2017-02-01'): 1500., ('ETH', '2017-06-01'): 50.})
+        logger = logging.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as dir_path:
+            ledger_path = os.path.join(dir_path, 'ledger.csv')
+            export_path = os.path.join(dir_path, 'export.csv')
+            data.to_csv(ledger_path, index=False)
+            config = dict(analysis={'fiat': 'CAD', 'ignore assets': [], 'num superficial loss days': 30,
+                                    'import': [{'path': ledger_path}], 'export path': export_path})
+            portfolio = Portfolio(config, dict(), ExchangeLedger(config, None, dict(), logger), logger, price_data)
+            summaries = []
+            portfolio.summarize = lambda holdings, losses, year=None, show_all_assets=False: \
+                summaries.append((holdings, losses))
+            with contextlib.redirect_stdout(io.StringIO()):
+                portfolio.analyze()
+            exported = pd.read_csv(export_path)
+
+        holdings, losses = summaries[-1]
+        btc = holdings.get_id('BTC')
+        eth = holdings.get_id('ETH')
+        self.assertAlmostEqual(1, holdings.get_amount(btc))
+        self.assertAlmostEqual(1000, holdings.get_avg_cost(btc))
+        self.assertAlmostEqual(3, holdings.get_amount(eth))
+        self.assertAlmostEqual(1100 / 6, holdings.get_avg_cost(eth))
+        self.assertAlmostEqual(1500, holdings.get_proceeds()[btc])
+        self.assertAlmostEqual(1000, holdings.get_costs_of_amounts_sold()[btc])
+        self.assertAlmostEqual(150, holdings.get_proceeds()[eth])
+        self.assertAlmostEqual(550, holdings.get_costs_of_amounts_sold()[eth])
+        self.assertEqual([(250, 'ETH'), (400, 'ETH')], [(round(loss, 6), asset) for loss, asset in losses])
+
+        np.testing.assert_allclose([2000, 1500, 500, 100, 150], exported['CAD Value'])
+        # The superficial loss is not realized.
+        np.testing.assert_allclose([np.nan, 500, np.nan, np.nan, -400], exported['CAD Gain'])
@@ -0,0 +1,66 @@
+import logging
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from altymeter.portfolio.checkpoint import AnalysisCheckpoints, AnalysisState, get_row_hashes
+from altymeter.portfolio.holdings import HoldingsTable
+from altymeter.portfolio.ledger import Ledger, ledger_columns
+
+
+def _make_data(quantities) -> pd.DataFrame:
+    result = pd.DataFrame({
+        'Date': pd.date_range('2017-01-01', periods=len(quantities), freq='D'),
+        'Type': 'Trade',
+        'Received Quantity': quantities,
+        'Received Currency': 'BTC',
+        'Sent Quantity': 1.,
+        'Sent Currency': 'CAD',
+    })
+    for column in ledger_columns:
+        if column not in result.columns:
+            result[column] = None
+    return result[ledger_columns]
+
+
+class TestAnalysisCheckpoints(unittest.TestCase):
+    def test_get_resume(self):
+        day_ns = 24 * 60 * 60 * 10 ** 9
+        with tempfile.TemporaryDirectory() as dir_path:
+            checkpoints = AnalysisCheckpoints(os.path.join(dir_path, 'checkpoints.pkl'), 'settings',
+                                              lookahead_ns=2 * day_ns, logger=logging.getLogger())
+            data = _make_data(np.arange(10.))
+            ledger = Ledger(data)
+            states = [AnalysisState(row, HoldingsTable(), row // 2, 2017) for row in (3, 6)]
+            checkpoints.save(ledger, get_row_hashes(data), states,
+                             losses=[(1., 'BTC')] * 5,
+                             fiat_values=list(range(10)), gains=[None] * 10,
+                             transfer_pairs=[(1, 2), (5, 7)])
+
+            # Appending rows keeps the last checkpoint.
+            data = _make_data(np.arange(12.))
+            resume = checkpoints.get_resume(Ledger(data), get_row_hashes(data))
+            self.assertEqual(6, resume.state.row)
+            self.assertEqual(3, len(resume.losses))
+            self.assertEqual(list(range(6)), resume.fiat_values)
+            self.assertEqual([(1, 2), (5, 7)], resume.transfer_pairs)
+            self.assertEqual([3, 6], [state.row for state in resume.checkpoints])
+
+            # Rows before the checkpoint could have looked ahead at the changed row.
+            data = _make_data(np.arange(10.))
+            data.loc[7, 'Received Quantity'] = 100
+            resume = checkpoints.get_resume(Ledger(data), get_row_hashes(data))
+            self.assertEqual(3, resume.state.row)
+            self.assertEqual([(1, 2)], resume.transfer_pairs)
+
+            data = _make_data(np.arange(10.))
+            data.loc[2, 'Received Quantity'] = 100
+            self.assertIsNone(checkpoints.get_resume(Ledger(data), get_row_hashes(data)))
+
+            other = AnalysisCheckpoints(os.path.join(dir_path, 'checkpoints.pkl'), 'other settings',
+                                        lookahead_ns=2 * day_ns, logger=logging.getLogger())
+            data = _make_data(np.arange(10.))
+            self.assertIsNone(other.get_resume(Ledger(data), get_row_hashes(data)))
@@ -0,0 +1,84 @@
+import logging
+import sqlite3
+import tempfile
+import unittest
+
+from altymeter.api.kraken import KrakenApi
+from altymeter.api.metadata_cache import MetadataCache
+from altymeter.module.db_module import DbModule
+from altymeter.portfolio.exchange_ledger import ExchangeLedger
+from altymeter.portfolio.ledger import ledger_columns
+
+
+def _kraken_request(method, data=None, timeout=5):
+    if method == 'public/Assets':
+        result = {'XXBT': {'altname': 'XBT'}, 'XETH': {'altname': 'ETH'}, 'ZCAD': {'altname': 'CAD'}}
+    elif method == 'public/AssetPairs':
+        result = {'XETHZCAD': {'altname': 'ETHCAD', 'base': 'XETH', 'quote': 'ZCAD'}}
+    elif method == 'private/TradesHistory':
+        trades = {'T1': {'pair': 'XETHZCAD', 'time': 20., 'type': 'buy', 'price': '100', 'vol': '2', 'fee': '1'}}
+        result = {'trades': trades, 'count': len(trades)}
+    elif method == 'private/Ledgers':
+        if data['type'] == 'deposit':
+            ledger = {'L1': {'asset': 'ZCAD', 'amount': '300', 'fee': '0', 'time': 10.}}
+        else:
+            ledger = {'L2': {'asset': 'XXBT', 'amount': '-0.5', 'fee': '0.001', 'time': 40.}}
+        result = {'ledger': ledger, 'count': len(ledger)}
+    else:
+        raise ValueError(method)
+    return {'result': result}
+
+
+class TestExchangeLedger(unittest.TestCase):
+    def test_load(self):
+        db = sqlite3.connect(':memory:')
+        DbModule()._initialize_db(db)
+        db.executemany('INSERT INTO exchange_fill VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+            ('Kraken', 'b', 'XETHXXBT', 20., 'buy', 'BTC', 'ETH', 0.1, 2., 0.01, 'BTC'),
+            ('Kraken', 's', 'XETHXXBT', 30., 'sell', 'BTC', 'ETH', 0.2, 1., 0.01, 'ETH'),
+            ('Other', 'o', 'XETHXXBT', 30., 'sell', 'BTC', 'ETH', 0.2, 1., 0.01, 'ETH'),
+        ])
+        db.executemany('INSERT INTO exchange_transfer VALUES (?, ?, ?, ?, ?, ?, ?)', [
+            ('Kraken', 'DEPOSIT', 'BTC', 10., 1., None, None),
+            ('Kraken', 'WITHDRAW', 'ETH', 40., 0.5, 0.01, 'address'),
+        ])
+        config = dict(analysis=dict(exchanges=[dict(name='Kraken')]))
+        ledger = ExchangeLedger(config, db, {}, logging.getLogger(__name__))
+
+        data = ledger.load()
+        self.assertEqual(ledger_columns, list(data.columns))
+        self.assertEqual(['Received', 'Trade', 'Trade', 'Sent'], data.Type.tolist())
+        self.assertEqual([10, 20, 30, 40], (data.Date.astype('int64') // 10 ** 9).tolist())
+
+        buy = data.iloc[1]
+        self.assertEqual(('ETH', 'BTC'), (buy['Received Currency'], buy['Sent Currency']))
+        self.assertAlmostEqual(2, buy['Received Quantity'])
+        self.assertAlmostEqual(0.21, buy['Sent Quantity'])
+
+        sell = data.iloc[2]
+        self.assertEqual(('BTC', 'ETH'), (sell['Received Currency'], sell['Sent Currency']))
+        self.assertAlmostEqual(0.2, sell['Received Quantity'])
+        self.assertAlmostEqual(1.01, sell['Sent Quantity'])
+
+        self.assertEqual(('BTC', 1), (data.iloc[0]['Received Currency'], data.iloc[0]['Received Quantity']))
+        self.assertEqual(('ETH', 0.5), (data.iloc[3]['Sent Currency'], data.iloc[3]['Sent Quantity']))
+
+    def test_sync_kraken_symbols(self):
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        DbModule()._initialize_db(db)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            config = {'exchanges': {'Kraken': {'api key': 'key', 'api secret': ''}},
+                      'metadata cache': {'path': cache_dir},
+                      'analysis': {'exchanges': [dict(name='Kraken')]}}
+            logger = logging.getLogger(__name__)
+            kraken = KrakenApi(config, logger, MetadataCache(config, logger), None)
+            kraken._request = _kraken_request
+            ledger = ExchangeLedger(config, db, dict(Kraken=kraken), logger)
+            ledger.sync()
+            data = ledger.load()
+
+        self.assertEqual(['Received', 'Trade', 'Sent'], data.Type.tolist())
+        self.assertEqual('CAD', data.iloc[0]['Received Currency'])
+        self.assertEqual(('ETH', 'CAD'), (data.iloc[1]['Received Currency'], data.iloc[1]['Sent Currency']))
+        self.assertAlmostEqual(201, data.iloc[1]['Sent Quantity'])
+        self.assertEqual('BTC', data.iloc[2]['Sent Currency'])
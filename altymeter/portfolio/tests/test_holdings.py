@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+
+from altymeter.portfolio.holdings import HoldingsTable
+
+
+class TestHoldingsTable(unittest.TestCase):
+    def test_updates(self):
+        holdings = HoldingsTable(capacity=1)
+        btc = holdings.get_id('BTC')
+        eth = holdings.get_id('ETH')
+        self.assertEqual(btc, holdings.get_id('BTC'))
+        self.assertEqual(['BTC', 'ETH'], holdings.names)
+
+        holdings.add(btc, 2., 100.)
+        self.assertEqual(50, holdings.get_avg_cost(btc))
+        holdings.update_cost_of_amount_sold(btc, 1., 2017)
+        holdings.subtract(btc, 1.)
+        holdings.update_proceeds(btc, 80., 2017)
+        self.assertEqual(1, holdings.get_amount(btc))
+        self.assertEqual(50, holdings.get_avg_cost(btc))
+
+        holdings.add(btc, 1., 60.)
+        holdings.update_cost_of_amount_sold(btc, 2., 2018)
+        holdings.subtract(btc, 2.)
+        holdings.update_proceeds(btc, 90., 2018)
+
+        np.testing.assert_allclose([80, 0], holdings.get_proceeds(2017))
+        np.testing.assert_allclose([90, 0], holdings.get_proceeds(2018))
+        np.testing.assert_allclose([170, 0], holdings.get_proceeds())
+        np.testing.assert_allclose([50, 0], holdings.get_costs_of_amounts_sold(2017))
+        np.testing.assert_allclose([160, 0], holdings.get_costs_of_amounts_sold())
+        np.testing.assert_allclose([0, 0], holdings.get_proceeds(2019))
+
+        # Like dividing Python floats.
+        with self.assertRaises(ZeroDivisionError):
+            holdings.update_cost_of_amount_sold(eth, 1., 2018)
+        with self.assertRaises(AssertionError):
+            holdings.subtract(eth, 1.)
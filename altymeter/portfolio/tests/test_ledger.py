@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from altymeter.portfolio.ledger import AssetTimeIndex, ledger_columns, read_ledgers
+
+
+class TestAssetTimeIndex(unittest.TestCase):
+    def test_get_rows(self):
+        day_ns = 24 * 60 * 60 * 10 ** 9
+        assets = np.array(['BTC', 'ETH', 'BTC', 'BTC', 'BTC'], dtype=object)
+        date_ns = np.array([0, 1, 2, 3, 10], dtype=np.int64) * day_ns
+        include = np.array([True, True, True, False, True])
+        index = AssetTimeIndex(assets, date_ns, include)
+
+        np.testing.assert_array_equal([0, 2], index.get_rows('BTC', 0, 3 * day_ns))
+        # Multi-day windows are inclusive.
+        np.testing.assert_array_equal([2, 4], index.get_rows('BTC', 2 * day_ns, 10 * day_ns))
+        np.testing.assert_array_equal([1], index.get_rows('ETH', 0, 10 * day_ns))
+        self.assertEqual(0, len(index.get_rows('BTC', 4 * day_ns, 9 * day_ns)))
+        self.assertEqual(0, len(index.get_rows('LTC', 0, 10 * day_ns)))
+
+    def test_has_rows_after_and_before(self):
+        day_ns = 24 * 60 * 60 * 10 ** 9
+        assets = np.array(['BTC', 'BTC', 'ETH', 'BTC'], dtype=object)
+        date_ns = np.array([0, 5, 5, 40], dtype=np.int64) * day_ns
+        index = AssetTimeIndex(assets, date_ns, np.ones(len(assets), dtype=bool))
+
+        self.assertTrue(index.has_rows_after('BTC', 0, 5 * day_ns))
+        self.assertFalse(index.has_rows_after('BTC', 0, 4 * day_ns))
+        self.assertFalse(index.has_rows_after('BTC', 1, 35 * day_ns))
+        # Rows at the same time count by their order.
+        self.assertTrue(index.has_rows_after('ETH', 1, 5 * day_ns))
+        self.assertFalse(index.has_rows_before('ETH', 2, 0))
+
+        self.assertTrue(index.has_rows_before('BTC', 1, 0))
+        self.assertFalse(index.has_rows_before('BTC', 3, 10 * day_ns))
+        self.assertFalse(index.has_rows_after('LTC', 0, 40 * day_ns))
+
+
+class TestReadLedgers(unittest.TestCase):
+    def test_read_ledgers(self):
+        with tempfile.TemporaryDirectory() as dir_path:
+            # Old column names.
+            old_path = os.path.join(dir_path, 'old.csv')
+            pd.DataFrame({
+                'Date': pd.date_range('2017-01-01', periods=7, freq='5h'),
+                'Type': 'Trade',
+                'Quantity': np.arange(7.),
+                'Currency': 'BTC',
+                'Price': 1.,
+                'Currency.1': 'CAD',
+                'Disabled': np.nan,
+            }).to_csv(old_path, index=False)
+            # Not sorted.
+            new_path = os.path.join(dir_path, 'new.csv')
+            pd.DataFrame({
+                'Date': pd.date_range('2017-01-01 02:00', periods=5, freq='7h')[::-1],
+                'Type': 'Sent',
+                'Sent Quantity': np.arange(5.),
+                'Sent Currency': 'ETH',
+                'Disabled': np.nan,
+                'Notes': 'Not needed',
+            }).to_csv(new_path, index=False)
+
+            chunks = list(read_ledgers([old_path, new_path], chunk_size=2))
+
+        data = pd.concat(chunks, ignore_index=True)
+        self.assertEqual(12, len(data))
+        self.assertEqual(ledger_columns, list(data.columns))
+        self.assertTrue(data.Date.is_monotonic_increasing)
+        self.assertEqual(['BTC'] * 7, data['Received Currency'][data.Type == 'Trade'].tolist())
+        self.assertEqual(['CAD'] * 7, data['Sent Currency'][data.Type == 'Trade'].tolist())
+        self.assertEqual([4., 3., 2., 1., 0.], data['Sent Quantity'][data.Type == 'Sent'].tolist())
@@ -1,16 +1,25 @@
+import itertools
 import logging
+import math
+import multiprocessing
+import os
 import sqlite3
-from collections import namedtuple, Sized
+import time
+from collections import defaultdict, namedtuple, Sized
+from concurrent.futures import as_completed, ProcessPoolExecutor, ThreadPoolExecutor
 from operator import itemgetter
 from threading import Lock
-from typing import Collection, Iterable, List, Optional, Union
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import six
 from injector import inject, ProviderOf, singleton
 from tqdm import tqdm
 
 from altymeter.api.price.cryptocompare import CryptoCompareApi
-from altymeter.module.constants import Configuration
+from altymeter.cache import LruCache
+from altymeter.metrics import Metrics
+from altymeter.module.constants import Configuration, user_dir
 
 Trade = namedtuple('Trade', ['price', 'amount', 'time'])
 """
@@ -19,20 +28,158 @@ A trade that was performed.
 :type time: float
 """
 
+trade_dtype = np.dtype([
+    ('price', np.float64),
+    ('amount', np.float64),
+    # In seconds.
+    ('time', np.float64),
+    # The exchange's id for the trade or -1 if it is not known.
+    ('id', np.int64),
+])
+"""
+The fields of a trade in a `TradeBatch`.
+"""
+
 DEFAULT_TIME_GROUPING = 60 * 10
 """
 The default number of seconds to group transactions into.
 """
 
+bar_dtype = np.dtype([
+    # The time of the bar divided by its resolution.
+    ('time_class', np.int64),
+    # The sum of price * amount for the trades in the bar.
+    ('value', np.float64),
+    ('volume', np.float64),
+    ('count', np.int64),
+])
+"""
+The fields of a bar of grouped trades in a structured array.
+"""
+
+DEFAULT_BAR_RESOLUTIONS = (60, 10 * 60, 60 * 60, 24 * 60 * 60)
+"""
+The default number of seconds in each level of bars, from finest to coarsest.
+"""
+
+_NO_HOUR_VALUE = object()
+"""
+Cached for hours that have no historical value.
+"""
+
+
+class TradeBatch(Sized):
+    """
+    Trades stored as the columns of a NumPy structured array with `trade_dtype`.
+    Indexing with an int gives a `Trade` and slicing gives another `TradeBatch`.
+    """
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data: Optional[np.ndarray] = None):
+        if data is None:
+            data = np.empty(0, dtype=trade_dtype)
+        assert data.dtype == trade_dtype
+        self._data = data
+
+    @classmethod
+    def from_columns(cls, price, amount, time, id=None) -> 'TradeBatch':
+        data = np.empty(len(price), dtype=trade_dtype)
+        data['price'] = price
+        data['amount'] = amount
+        data['time'] = time
+        data['id'] = -1 if id is None else id
+        return cls(data)
+
+    @classmethod
+    def from_trades(cls, trades: Union['TradeBatch', Collection[Trade]]) -> 'TradeBatch':
+        if isinstance(trades, TradeBatch):
+            return trades
+        if len(trades) == 0:
+            return cls()
+        columns = np.array(trades, dtype=np.float64)
+        return cls.from_columns(columns[:, 0], columns[:, 1], columns[:, 2])
+
+    @classmethod
+    def concat(cls, batches: Iterable['TradeBatch']) -> 'TradeBatch':
+        data = [batch.data for batch in batches]
+        if not data:
+            return cls()
+        return cls(np.concatenate(data))
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data
+
+    @property
+    def price(self) -> np.ndarray:
+        return self._data['price']
+
+    @property
+    def amount(self) -> np.ndarray:
+        return self._data['amount']
+
+    @property
+    def time(self) -> np.ndarray:
+        return self._data['time']
+
+    @property
+    def id(self) -> np.ndarray:
+        return self._data['id']
+
+    def sort(self) -> 'TradeBatch':
+        """
+        :return: The trades sorted by time. Trades at the same time keep their order.
+        """
+        return TradeBatch(self._data[np.argsort(self.time, kind='stable')])
+
+    def merge_duplicates(self) -> 'TradeBatch':
+        """
+        Merge consecutive trades with the same price and time by adding their amounts.
+        """
+        if len(self) < 2:
+            return self
+        is_new = np.ones(len(self), dtype=bool)
+        is_new[1:] = (self.price[1:] != self.price[:-1]) | (self.time[1:] != self.time[:-1])
+        if is_new.all():
+            return self
+        starts = np.flatnonzero(is_new)
+        data = self._data[starts]
+        data['amount'] = np.add.reduceat(self.amount, starts)
+        return TradeBatch(data)
+
+    def to_list(self) -> List[Trade]:
+        return list(map(Trade._make, self._data[['price', 'amount', 'time']].tolist()))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            row = self._data[item]
+            return Trade(float(row['price']), float(row['amount']), float(row['time']))
+        return TradeBatch(self._data[item])
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __eq__(self, other):
+        if isinstance(other, TradeBatch):
+            other = other.to_list()
+        return self.to_list() == list(other)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
 
 class SplitPrices(Iterable, Sized):
     """
     Prices over several consecutive periods.
     """
 
-    def __init__(self, prices: list = None, volumes: list = None):
+    def __init__(self, prices: list = None, volumes: list = None, times: list = None):
         self._prices = prices if prices else []
-        self._times = []
+        self._times = times if times else []
         self._volumes = volumes if volumes else []
 
     def iter_prices(self):
@@ -55,6 +202,14 @@ class SplitPrices(Iterable, Sized):
     def volumes(self) -> List[List[float]]:
         return self._volumes
 
+    def extend(self, other: 'SplitPrices'):
+        """
+        Add the periods of `other` after the periods in this.
+        """
+        self._prices.extend(other.prices)
+        self._times.extend(other.times)
+        self._volumes.extend(other.volumes)
+
     def __getitem__(self, item):
         return self.prices[item]
 
@@ -71,44 +226,167 @@ class SplitPrices(Iterable, Sized):
         return str(self._prices)
 
 
+def make_bars(trades: TradeBatch, resolution: int) -> np.ndarray:
+    """
+    Group trades into bars.
+
+    :param trades: Trades sorted by time.
+    :param resolution: The number of seconds in each bar.
+    :return: A bar with `bar_dtype` for each interval with trades.
+    """
+    if len(trades) == 0:
+        return np.empty(0, dtype=bar_dtype)
+    time_classes = (trades.time / resolution).astype(np.int64)
+    # Where each bar starts.
+    starts = np.flatnonzero(np.diff(time_classes)) + 1
+    starts = np.concatenate(([0], starts)).astype(np.intp)
+    result = np.empty(len(starts), dtype=bar_dtype)
+    result['time_class'] = time_classes[starts]
+    result['value'] = np.add.reduceat(trades.price * trades.amount, starts)
+    result['volume'] = np.add.reduceat(trades.amount, starts)
+    result['count'] = np.diff(np.append(starts, len(trades)))
+    return result
+
+
+def roll_up_bars(bars: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Combine bars into coarser bars.
+
+    :param bars: Bars with `bar_dtype` sorted by time.
+    :param factor: The number of bars to combine into each coarser bar.
+    :return: Bars with `factor` times the resolution of `bars`.
+    """
+    if len(bars) == 0:
+        return np.empty(0, dtype=bar_dtype)
+    time_classes = bars['time_class'] // factor
+    starts = np.flatnonzero(np.diff(time_classes)) + 1
+    starts = np.concatenate(([0], starts)).astype(np.intp)
+    result = np.empty(len(starts), dtype=bar_dtype)
+    result['time_class'] = time_classes[starts]
+    for field in ('value', 'volume', 'count'):
+        result[field] = np.add.reduceat(bars[field], starts)
+    return result
+
+
+def split_bars(bars: np.ndarray, resolution: int) -> SplitPrices:
+    """
+    :param bars: Bars with `bar_dtype` sorted by time.
+    :param resolution: The number of seconds in each bar.
+    :return: The average price weighted by amount and the total amount for each bar.
+        Bars are split into separate chunks where there are no trades in an interval.
+    """
+    if len(bars) == 0:
+        return SplitPrices()
+    volumes = bars['volume']
+    prices = bars['value'] / volumes
+    times = (bars['time_class'] + 0.5) * resolution
+    # Where the bars are not consecutive.
+    splits = np.flatnonzero(np.diff(bars['time_class']) != 1) + 1
+    return SplitPrices(prices=[chunk.tolist() for chunk in np.split(prices, splits)],
+                       volumes=[chunk.tolist() for chunk in np.split(volumes, splits)],
+                       times=[chunk.tolist() for chunk in np.split(times, splits)])
+
+
+def split_prices(trades: TradeBatch, time_grouping: float) -> SplitPrices:
+    """
+    Group trades into time intervals.
+
+    :param trades: Trades sorted by time.
+    :param time_grouping: The number of seconds in each interval.
+    :return: The average price weighted by amount and the total amount for each interval with trades.
+        Intervals are split into separate chunks where there are no trades in an interval.
+    """
+    if len(trades) == 0:
+        return SplitPrices()
+    return split_bars(make_bars(trades, time_grouping), time_grouping)
+
+
+def _read_trades(cursor: sqlite3.Cursor, size_hint: int, batch_size: int) -> TradeBatch:
+    """
+    :param cursor: The result of a query for the price, amount, and time of trades.
+    :param size_hint: The number of trades to make room for at first.
+    :param batch_size: The number of rows to fetch at a time.
+    """
+    columns = np.empty((size_hint, 3), dtype=np.float64)
+    num_read = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        end = num_read + len(rows)
+        if end > len(columns):
+            # Double the size so that large reads are only copied a few times.
+            columns = np.concatenate([columns, np.empty((max(end, 2 * len(columns)) - len(columns), 3))])
+        columns[num_read:end] = rows
+        num_read = end
+    columns = columns[:num_read]
+    return TradeBatch.from_columns(columns[:, 0], columns[:, 1], columns[:, 2])
+
+
+def _get_pair_prices(database: str, pair: str, time_grouping: float, batch_size: int) -> SplitPrices:
+    # Runs in a worker process so it opens its own connection.
+    db = sqlite3.connect(database)
+    try:
+        cursor = db.execute('SELECT price, amount, time FROM trade WHERE pair = ? ORDER BY time ASC', (pair,))
+        trades = _read_trades(cursor, batch_size, batch_size)
+    finally:
+        db.close()
+    return split_prices(trades, time_grouping)
+
+
 @singleton
 class PriceData(object):
     @inject
     def __init__(self, config: Configuration,
                  logger: logging.Logger,
                  historical_pricing: CryptoCompareApi,
-                 db_provider: ProviderOf[sqlite3.Connection]):
+                 db_provider: ProviderOf[sqlite3.Connection],
+                 metrics: Metrics):
         self._time_grouping = DEFAULT_TIME_GROUPING
         pricing_config = config.get('pricing')
         if pricing_config:
             self._time_grouping = pricing_config.get('time grouping', self._time_grouping)
+        # The number of symbols to get historical values for at the same time.
+        self._prefetch_max_workers = (pricing_config or {}).get('historical max workers', 4)
+
+        # Keeps hourly values in memory since the same hours are looked up many times.
+        self._hour_values = LruCache((pricing_config or {}).get('hour value cache size', 10 ** 5))
+        # Fetched hourly values waiting to be written to the database together.
+        self._pending_hour_values = dict()
+        self._hour_value_write_batch_size = (pricing_config or {}).get('hour value write batch size', 100)
+        self._hour_value_stats = defaultdict(int)
+        # Lookups happen on several threads.
+        self._hour_value_stats_lock = Lock()
+        # The number of rows to get at a time when reading trades.
+        self._fetch_batch_size = (pricing_config or {}).get('fetch batch size', 10000)
+        # The number of processes to get the prices of pairs with at the same time.
+        self._prices_max_workers = (pricing_config or {}).get('prices max workers', 4)
+        # Raw trades older than this are moved out of the database by `compact`.
+        self._keep_trades_seconds = (pricing_config or {}).get('keep trades days', 90) * 24 * 60 * 60
+        self._archive_dir = os.path.expanduser((pricing_config or {}).get('archive dir') or
+                                               os.path.join(user_dir, 'trade_archive'))
+        self._vacuum_mode = (pricing_config or {}).get('vacuum', 'full')
+        if self._vacuum_mode not in ('full', 'incremental', None):
+            raise ValueError("Invalid vacuum mode: '{}'. Use 'full', 'incremental', or null."
+                             .format(self._vacuum_mode))
+        # Each level of bars is rolled up from the level before it.
+        self._bar_resolutions = sorted((pricing_config or {}).get('bar resolutions', DEFAULT_BAR_RESOLUTIONS))
+        for finer, coarser in zip(self._bar_resolutions, self._bar_resolutions[1:]):
+            if coarser % finer != 0:
+                raise ValueError("Bar resolutions must be multiples of each other. Got {} and {}."
+                                 .format(finer, coarser))
 
         self._lock = Lock()
         self._logger = logger
         self._historical_pricing = historical_pricing
         self._db_provider = db_provider
+        self._metrics = metrics
 
-    def add_prices(self, pair: str, trades: Collection[Trade]):
-        prices = []
-
+    def add_prices(self, pair: str, trades: Union[TradeBatch, Collection[Trade]]):
         # Group by time.
-        trades = sorted(trades, key=lambda t: t.time)
-        prev_trade: Trade = None
-
-        for trade in trades:
-            if prev_trade is not None:
-                if trade.price == prev_trade.price and trade.time == prev_trade.time:
-                    # Merge
-                    prev_trade = Trade(trade.price, trade.amount + prev_trade.amount, trade.time)
-                else:
-                    # New trade is different from the previous. Add the previous.
-                    prices.append((pair, prev_trade.price, prev_trade.amount, prev_trade.time))
-                    prev_trade = trade
-            else:
-                prev_trade = trade
-
-        if prev_trade is not None:
-            prices.append((pair, prev_trade.price, prev_trade.amount, prev_trade.time))
+        trades = TradeBatch.from_trades(trades).sort()
+        merged = trades.merge_duplicates()
+        prices = zip(itertools.repeat(pair), merged.price.tolist(), merged.amount.tolist(), merged.time.tolist())
 
         with self._lock:
             try:
@@ -116,6 +394,7 @@ class PriceData(object):
                 cursor = db.cursor()
                 cursor.executemany('INSERT INTO trade VALUES (?, ?, ?, ?)', prices)
                 db.commit()
+                self._metrics.increment('pricing.trades written', len(merged), pair=pair)
             except sqlite3.IntegrityError as e:
                 if "UNIQUE constraint failed: " in e.args[0]:
                     self._logger.exception("Skipping duplicate trade(s).")
@@ -138,26 +417,150 @@ class PriceData(object):
                 else:
                     raise
 
+    def _flush_hour_values(self):
+        # Must be called with `self._lock`.
+        if not self._pending_hour_values:
+            return
+        db: sqlite3.Connection = self._db_provider.get()
+        cursor = db.cursor()
+        cursor.executemany('INSERT OR IGNORE INTO hour_price VALUES (?, ?, ?, ?)',
+                           [key + (val,) for key, val in self._pending_hour_values.items()])
+        db.commit()
+        self._pending_hour_values.clear()
+
+    def flush_hour_values(self):
+        """
+        Store hourly values that were fetched but not stored yet.
+        """
+        with self._lock:
+            self._flush_hour_values()
+
+    def _add_hour_value_stat(self, name: str, amount: float = 1):
+        with self._hour_value_stats_lock:
+            self._hour_value_stats[name] += amount
+
     def get_hour_value(self, symbol: str, fiat_symbol: str, time_in_s: float) -> float:
+        start = time.perf_counter()
         # Round down to lowest hour.
         time_in_s = int(time_in_s / 3600) * 3600
+        key = (symbol, fiat_symbol, time_in_s)
+
+        try:
+            result = self._hour_values.get(key)
+            if result is _NO_HOUR_VALUE:
+                self._add_hour_value_stat('negative hits')
+                raise ValueError("No value for {} in {} at {}.".format(symbol, fiat_symbol, time_in_s))
+            if result is not None:
+                return result
+
+            result = self._pending_hour_values.get(key)
+            if result is None:
+                db: sqlite3.Connection = self._db_provider.get()
+                cursor = db.cursor()
+                values = cursor.execute('SELECT val FROM hour_price '
+                                        'WHERE symbol = ? AND fiat = ? AND time_in_s = ?',
+                                        key)
+                row = values.fetchone()
+                if row:
+                    self._add_hour_value_stat('db hits')
+                    result = row[0]
+            if result is None:
+                self._add_hour_value_stat('fetches')
+                result = self._historical_pricing.get_hour_value(symbol, fiat_symbol, time_in_s)
+                if result is None:
+                    # Remember that there's no data so that it's not requested again.
+                    self._hour_values.put(key, _NO_HOUR_VALUE)
+                    raise ValueError("No value for {} in {} at {}.".format(symbol, fiat_symbol, time_in_s))
+                with self._lock:
+                    self._pending_hour_values[key] = result
+                    if len(self._pending_hour_values) >= self._hour_value_write_batch_size:
+                        self._flush_hour_values()
+            self._hour_values.put(key, result)
+            return result
+        finally:
+            self._add_hour_value_stat('lookups')
+            self._add_hour_value_stat('total time s', time.perf_counter() - start)
+
+    @property
+    def hour_value_stats(self) -> dict:
+        """
+        :return: Stats about `get_hour_value` lookups such as the cache hit rate and the average latency.
+        """
+        with self._hour_value_stats_lock:
+            result = dict(self._hour_value_stats)
+        result['cache'] = self._hour_values.stats
+        lookups = result.get('lookups', 0)
+        result['average time s'] = result.get('total time s', 0) / lookups if lookups else 0
+        result['pending writes'] = len(self._pending_hour_values)
+        return result
+
+    def prefetch_hour_values(self, needs: Iterable[Tuple[str, str, float]]):
+        """
+        Get and store all of the hourly values that will be needed with as few requests as possible
+        so that `get_hour_value` does not need to make a request for each one.
+
+        :param needs: The symbol, fiat symbol, and time in seconds of each value needed.
+        """
+        hours_needed = defaultdict(set)
+        for symbol, fiat_symbol, time_in_s in needs:
+            hours_needed[(symbol, fiat_symbol)].add(int(time_in_s / 3600) * 3600)
 
         db: sqlite3.Connection = self._db_provider.get()
         cursor = db.cursor()
-        values = cursor.execute('SELECT val FROM hour_price '
-                                'WHERE symbol = ? AND fiat = ? AND time_in_s = ?',
-                                (symbol, fiat_symbol, time_in_s))
-        result = values.fetchone()
-        if result:
-            result = result[0]
-        else:
-            result = self._historical_pricing.get_hour_value(symbol, fiat_symbol, time_in_s)
-            cursor = db.cursor()
-            cursor.execute('INSERT INTO hour_price VALUES (?, ?, ?, ?)',
-                           (symbol, fiat_symbol, time_in_s, result))
-            db.commit()
+        missing_ranges = dict()
+        for (symbol, fiat_symbol), hours in hours_needed.items():
+            stored = cursor.execute('SELECT time_in_s FROM hour_price '
+                                    'WHERE symbol = ? AND fiat = ? AND time_in_s BETWEEN ? AND ?',
+                                    (symbol, fiat_symbol, min(hours), max(hours)))
+            missing = sorted(hours - set(map(itemgetter(0), stored)))
+            if not missing:
+                continue
+            # Group the missing hours into ranges that can each be fetched in one request.
+            ranges = []
+            range_hours = [missing[0]]
+            for hour in missing[1:]:
+                if hour - range_hours[0] >= self._historical_pricing.max_hours_per_request * 3600:
+                    ranges.append(range_hours)
+                    range_hours = []
+                range_hours.append(hour)
+            ranges.append(range_hours)
+            missing_ranges[(symbol, fiat_symbol)] = ranges
 
-        return result
+        if not missing_ranges:
+            return
+
+        def fetch(symbol, fiat_symbol, ranges):
+            result = []
+            for range_hours in ranges:
+                values = self._historical_pricing.get_hour_values(symbol, fiat_symbol,
+                                                                  range_hours[0], range_hours[-1])
+                for hour in range_hours:
+                    val = values.get(hour)
+                    if val is not None:
+                        result.append((symbol, fiat_symbol, hour, val))
+                        self._hour_values.put((symbol, fiat_symbol, hour), val)
+                    else:
+                        # Remember that there's no data so that it's not requested again.
+                        self._hour_values.put((symbol, fiat_symbol, hour), _NO_HOUR_VALUE)
+            return result
+
+        num_requests = sum(map(len, missing_ranges.values()))
+        self._logger.info("Getting hourly values for %d symbol(s) in %d request(s).",
+                          len(missing_ranges), num_requests)
+        with ThreadPoolExecutor(max_workers=self._prefetch_max_workers) as executor:
+            futures = {executor.submit(fetch, symbol, fiat_symbol, ranges): symbol
+                       for (symbol, fiat_symbol), ranges in missing_ranges.items()}
+            for future in as_completed(futures):
+                try:
+                    values = future.result()
+                except:
+                    self._logger.exception("Error getting hourly values for %s.", futures[future])
+                    continue
+                # Only write from this thread since the connection is shared.
+                with self._lock:
+                    cursor = db.cursor()
+                    cursor.executemany('INSERT OR IGNORE INTO hour_price VALUES (?, ?, ?, ?)', values)
+                    db.commit()
 
     def get_pairs(self) -> List[str]:
         """
@@ -169,90 +572,419 @@ class PriceData(object):
         result = list(map(itemgetter(0), result))
         return result
 
-    def get_prices(self, pairs: Union[str, Iterable[str]] = None) -> SplitPrices:
+    def get_prices(self, pairs: Union[str, Iterable[str]] = None,
+                   resolution: Optional[int] = None) -> SplitPrices:
         """
         :param pairs: The traded pairs to get prices for.
-        :return: Prices grouped by time intervals.
+        :param resolution: The number of seconds in each time interval.
+            If given, prices come from the stored bars. Otherwise trades are grouped by `time_grouping`.
+        :return: Prices grouped by time intervals for all of the pairs one after the other.
         """
         result = SplitPrices()
+        for prices in self.get_prices_by_pair(pairs, resolution).values():
+            result.extend(prices)
+        return result
+
+    def get_prices_by_pair(self, pairs: Union[str, Iterable[str]] = None,
+                           resolution: Optional[int] = None) -> Dict[str, SplitPrices]:
+        """
+        Get the prices for several pairs at the same time.
+        When the database is a file, each pair is read and grouped in a worker process with its own connection.
+
+        :param pairs: The traded pairs to get prices for.
+        :param resolution: The number of seconds in each time interval.
+            If given, prices come from the stored bars. Otherwise trades are grouped by `time_grouping`,
+            except for pairs that were compacted, which also come from the stored bars.
+        :return: Prices grouped by time intervals for each pair in the order of `pairs`.
+        """
         if pairs is None:
             pairs = self.get_pairs()
         elif isinstance(pairs, six.string_types):
             pairs = [pairs]
+        else:
+            pairs = list(pairs)
 
         self._logger.info("Getting prices for: %s", pairs)
 
+        if resolution is not None:
+            return {pair: self._get_bar_prices(pair, resolution) for pair in pairs}
+
+        result = dict.fromkeys(pairs)
+        # The old trades of compacted pairs are only in their bars.
+        raw_pairs = []
         for pair in pairs:
-            current_prices = []
-            current_times = []
-            current_volumes = []
-
-            prev_time_class = None
-            grouped_trades = 0
-            total_trade_amount_in_group = 0
-
-            for trade in self.get_trades(pair):
-                price = trade.price
-                amount = trade.amount
-                time_class = int(trade.time / self._time_grouping)
-
-                if prev_time_class == time_class or prev_time_class is None:
-                    grouped_trades += amount * price
-                    total_trade_amount_in_group += amount
-                else:
-                    current_prices.append(grouped_trades / total_trade_amount_in_group)
-                    current_times.append((time_class + 0.5) * self._time_grouping)
-                    current_volumes.append(total_trade_amount_in_group)
-                    grouped_trades = amount * price
-                    total_trade_amount_in_group = amount
-                    if prev_time_class + 1 != time_class:
-                        # Split since trades are not consecutive.
-                        result.prices.append(current_prices)
-                        result.times.append(current_times)
-                        result.volumes.append(current_volumes)
-                        current_prices = []
-                        current_times = []
-                        current_volumes = []
-
-                prev_time_class = time_class
-
-            if total_trade_amount_in_group:
-                current_prices.append(grouped_trades / total_trade_amount_in_group)
-                current_times.append((time_class + 0.5) * self._time_grouping)
-                current_volumes.append(total_trade_amount_in_group)
-                result.prices.append(current_prices)
-                result.times.append(current_times)
-                result.volumes.append(current_volumes)
+            if self._get_compacted_time(pair) is None:
+                raw_pairs.append(pair)
+            else:
+                result[pair] = self._get_bar_prices(pair, self._time_grouping)
+        pairs = raw_pairs
+
+        database = self._get_database_path()
+        max_workers = min(self._prices_max_workers, len(pairs), os.cpu_count() or 1)
+        if database is None or max_workers < 2:
+            # Other connections can't see an in-memory database so get the pairs one at a time.
+            for pair in pairs:
+                result[pair] = split_prices(self.get_trades(pair), self._time_grouping)
+            return result
 
+        start = time.perf_counter()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            futures = {executor.submit(_get_pair_prices, database, pair,
+                                       self._time_grouping, self._fetch_batch_size): pair
+                       for pair in pairs}
+            for future in as_completed(futures):
+                result[futures[future]] = future.result()
+        self._metrics.timing('pricing.get prices', time.perf_counter() - start, num_pairs=len(pairs))
         return result
 
-    def get_trades(self, pair: str, since: Optional[float] = None) -> List[Trade]:
+    def _get_bar_prices(self, pair: str, resolution: int) -> SplitPrices:
+        self.update_bars(pair)
+        return split_bars(self.get_bars(pair, resolution), resolution)
+
+    def update_bars(self, pair: str, since: Optional[float] = None):
+        """
+        Group new trades into bars for each resolution in `bar resolutions`.
+        The finest bars are made from trades and each coarser level is rolled up from the level before it.
+
+        :param pair: The traded pair to update bars for.
+        :param since: Time (in seconds) to rebuild bars from.
+            By default, bars are updated from the last bar,
+            which may have been made before all of its trades were added.
+            Bars for trades that were compacted are never rebuilt.
+        """
+        finest = self._bar_resolutions[0]
+        db = self._db_provider.get()
+        cursor = db.cursor()
+        if since is None:
+            last_time_class = cursor.execute('SELECT MAX(time_class) FROM bar WHERE pair = ? AND resolution = ?',
+                                             (pair, finest)).fetchone()[0]
+            if last_time_class is not None:
+                since = last_time_class * finest
+        else:
+            # Start at a coarse bar so that every level is rebuilt from the same place.
+            since = int(since / self._bar_resolutions[-1]) * self._bar_resolutions[-1]
+            # The trades before the compacted time are no longer in the database.
+            compacted_time = self._get_compacted_time(pair)
+            if compacted_time is not None:
+                since = max(since, compacted_time)
+        trades = self.get_trades(pair, since=since)
+        if len(trades) == 0:
+            return
+
+        bars = make_bars(trades, finest)
+        levels = [(finest, bars)]
+        for finer, resolution in zip(self._bar_resolutions, self._bar_resolutions[1:]):
+            factor = resolution // finer
+            # sqlite3 does not bind NumPy ints as integers.
+            first_time_class = int(bars['time_class'][0]) // factor
+            # Include the finer bars that are already stored for the first coarse bar.
+            stored = cursor.execute('SELECT time_class, value, volume, count FROM bar '
+                                    'WHERE pair = ? AND resolution = ? AND time_class >= ? AND time_class < ? '
+                                    'ORDER BY time_class ASC',
+                                    (pair, finer, first_time_class * factor, int(bars['time_class'][0]))).fetchall()
+            bars = roll_up_bars(np.concatenate([np.array(stored, dtype=bar_dtype), bars]), factor)
+            levels.append((resolution, bars))
+
+        with self._lock:
+            for resolution, bars in levels:
+                cursor.executemany('INSERT OR REPLACE INTO bar VALUES (?, ?, ?, ?, ?, ?)',
+                                   zip(itertools.repeat(pair), itertools.repeat(resolution),
+                                       bars['time_class'].tolist(), bars['value'].tolist(),
+                                       bars['volume'].tolist(), bars['count'].tolist()))
+            db.commit()
+        self._metrics.increment('pricing.bars written', sum(len(bars) for _, bars in levels), pair=pair)
+
+    def get_bars(self, pair: str, resolution: int,
+                 since: Optional[float] = None,
+                 until: Optional[float] = None) -> np.ndarray:
+        """
+        :param pair: The traded pair to get bars for.
+        :param resolution: The number of seconds in each bar.
+            Must be a multiple of one of the `bar resolutions`.
+        :param since: Time (in seconds) to get bars since.
+        :param until: Time (in seconds) to get bars before.
+        :return: Stored bars with `bar_dtype` sorted by time.
+        """
+        stored_resolution = self._get_stored_resolution(resolution)
+        if stored_resolution is None:
+            raise ValueError("Resolution {} is not a multiple of any of the bar resolutions: {}."
+                             .format(resolution, self._bar_resolutions))
+
+        query = 'SELECT time_class, value, volume, count FROM bar WHERE pair = ? AND resolution = ?'
+        params = (pair, stored_resolution)
+        if since is not None:
+            query += ' AND time_class >= ?'
+            params += (int(since / resolution) * resolution // stored_resolution,)
+        if until is not None:
+            query += ' AND time_class < ?'
+            params += (math.ceil(until / resolution) * resolution // stored_resolution,)
+        db = self._db_provider.get()
+        cursor = db.cursor()
+        rows = cursor.execute(query + ' ORDER BY time_class ASC', params).fetchall()
+        result = np.array(rows, dtype=bar_dtype)
+        if resolution != stored_resolution:
+            result = roll_up_bars(result, resolution // stored_resolution)
+        return result
+
+    def _get_stored_resolution(self, resolution: int) -> Optional[int]:
+        """
+        :return: The coarsest bar resolution that `resolution` is a multiple of.
+        """
+        for result in reversed(self._bar_resolutions):
+            if resolution % result == 0:
+                return result
+        return None
+
+    @property
+    def bar_resolutions(self) -> List[int]:
+        return self._bar_resolutions
+
+    def compact(self, pairs: Union[str, Iterable[str]] = None, now: Optional[float] = None) -> int:
+        """
+        Move old trades out of the database so that it stays small and fast.
+
+        Trades older than `keep trades days` are grouped into bars, written to a compressed file
+        for each pair and month in `archive dir`, and then deleted.
+        The database is vacuumed afterwards to release the space.
+
+        :param pairs: The traded pairs to compact. Defaults to all pairs.
+        :param now: The current time (in seconds).
+        :return: The number of trades that were moved.
+        """
+        if self._get_stored_resolution(self._time_grouping) is None:
+            # `get_prices` could not include the moved trades.
+            raise ValueError("Cannot compact trades because the time grouping ({}) is not a multiple "
+                             "of any of the bar resolutions: {}.".format(self._time_grouping, self._bar_resolutions))
+        if pairs is None:
+            pairs = self.get_pairs()
+        elif isinstance(pairs, six.string_types):
+            pairs = [pairs]
+        if now is None:
+            now = time.time()
+        start = time.perf_counter()
+        # Cut at a coarse bar so that the bars of the remaining trades are never partial.
+        coarsest = self._bar_resolutions[-1]
+        cutoff = int((now - self._keep_trades_seconds) / coarsest) * coarsest
+        db = self._db_provider.get()
+        cursor = db.cursor()
+        result = 0
+        for pair in pairs:
+            first_time = cursor.execute('SELECT MIN(time) FROM trade WHERE pair = ?', (pair,)).fetchone()[0]
+            if first_time is None or first_time >= cutoff:
+                continue
+            # Include trades that were added after their bars were made.
+            self.update_bars(pair, since=first_time)
+            with self._lock:
+                trades = self.get_trades(pair, until=cutoff)
+                self._archive_trades(pair, trades)
+                cursor.execute('DELETE FROM trade WHERE pair = ? AND time < ?', (pair, cutoff))
+                cursor.execute('INSERT OR REPLACE INTO trade_compaction VALUES (?, ?)', (pair, cutoff))
+                db.commit()
+            self._logger.info("Archived %d trades for %s.", len(trades), pair)
+            self._metrics.increment('pricing.trades archived', len(trades), pair=pair)
+            result += len(trades)
+
+        if result > 0:
+            self._vacuum()
+        self._metrics.timing('pricing.compact', time.perf_counter() - start)
+        return result
+
+    def get_archived_trades(self, pair: str) -> TradeBatch:
+        """
+        :param pair: The traded pair to get trades for.
+        :return: The trades that were moved out of the database by `compact` sorted by time.
+        """
+        pair_dir = os.path.join(self._archive_dir, pair)
+        if not os.path.isdir(pair_dir):
+            return TradeBatch()
+        batches = []
+        for name in sorted(os.listdir(pair_dir)):
+            if name.endswith('.npz'):
+                batches.append(self._load_archive(os.path.join(pair_dir, name)))
+        return TradeBatch.concat(batches).sort()
+
+    @staticmethod
+    def _load_archive(path: str) -> TradeBatch:
+        with np.load(path) as columns:
+            return TradeBatch.from_columns(columns['price'], columns['amount'], columns['time'])
+
+    def _archive_trades(self, pair: str, trades: TradeBatch):
+        pair_dir = os.path.join(self._archive_dir, pair)
+        os.makedirs(pair_dir, exist_ok=True)
+        months = trades.time.astype('datetime64[s]').astype('datetime64[M]')
+        for month in np.unique(months):
+            path = os.path.join(pair_dir, '{}.npz'.format(month))
+            month_trades = trades[months == month]
+            if os.path.exists(path):
+                # The month was partly archived before.
+                month_trades = TradeBatch.concat([self._load_archive(path), month_trades]).sort()
+            # Write to another file first so that the archive is never left partly written.
+            tmp_path = path[:-len('.npz')] + '.tmp.npz'
+            np.savez_compressed(tmp_path,
+                                price=month_trades.price, amount=month_trades.amount, time=month_trades.time)
+            os.replace(tmp_path, path)
+
+    def _get_compacted_time(self, pair: str) -> Optional[float]:
+        """
+        :return: The time before which trades for `pair` were moved out of the database.
+        """
+        db = self._db_provider.get()
+        row = db.execute('SELECT time FROM trade_compaction WHERE pair = ?', (pair,)).fetchone()
+        return None if row is None else row[0]
+
+    def _vacuum(self):
+        if self._vacuum_mode is None:
+            return
+        db = self._db_provider.get()
+        with self._lock:
+            if self._vacuum_mode == 'incremental':
+                if db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    # Changing to incremental vacuuming only takes effect after a full vacuum.
+                    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    db.execute('VACUUM')
+                else:
+                    # `execute` only frees one page for each step so run it as a script.
+                    db.executescript('PRAGMA incremental_vacuum;')
+            else:
+                db.execute('VACUUM')
+
+    def _get_database_path(self) -> Optional[str]:
+        """
+        :return: The file of the main database or `None` if it is only in memory.
+        """
+        db = self._db_provider.get()
+        for _, name, path in db.execute('PRAGMA database_list'):
+            if name == 'main':
+                return path or None
+        return None
+
+    @staticmethod
+    def _get_trades_filter(pair: str, since: Optional[float], until: Optional[float]) -> Tuple[str, tuple]:
+        where = 'WHERE pair = ?'
+        params = (pair,)
+        if since is not None:
+            where += ' AND time >= ?'
+            params += (since,)
+        if until is not None:
+            where += ' AND time < ?'
+            params += (until,)
+        return where, params
+
+    def get_trades(self, pair: str, since: Optional[float] = None,
+                   until: Optional[float] = None,
+                   limit: Optional[int] = None,
+                   order: str = 'asc',
+                   progress: bool = False) -> TradeBatch:
         """
         :param pair: The traded pair to get trades for.
         :param since: Time (in seconds) to get trades since.
-        :return: Recorded trades sorted in chronological order by time.
+        :param until: Time (in seconds) to get trades before.
+        :param limit: The most trades to get.
+        :param order: 'asc' to start with the oldest trades or 'desc' to start with the newest trades.
+        :param progress: `True` to show a progress bar.
+            Otherwise the trades are read in batches and the throughput is reported to `Metrics`.
+        :return: Recorded trades sorted by time in `order`.
         """
+        order = order.upper()
+        if order not in ('ASC', 'DESC'):
+            raise ValueError("Invalid order: '{}'".format(order))
+        start = time.perf_counter()
         db = self._db_provider.get()
         cursor = db.cursor()
-        result = []
-        if since is None:
-            trades = cursor.execute('SELECT * FROM trade WHERE pair = ? '
-                                    'ORDER BY time ASC', (pair,))
+        where, params = self._get_trades_filter(pair, since, until)
+        query = 'SELECT price, amount, time FROM trade ' + where + ' ORDER BY time ' + order
+        if limit is not None:
+            query += ' LIMIT ?'
+            params += (limit,)
+        trades = cursor.execute(query, params)
+        if progress:
+            rows = list(tqdm(trades, desc="Getting trades for %s" % pair,
+                             unit_scale=True, mininterval=2, unit=" trades"))
+            result = TradeBatch.from_trades(rows)
         else:
-            trades = cursor.execute('SELECT * FROM trade WHERE pair = ? '
-                                    'AND time >= ? '
-                                    'ORDER BY time ASC', (pair, since,))
-        for trade in tqdm(trades, desc="Getting trades for %s" % pair,
-                          unit_scale=True, mininterval=2, unit=" trades"):
-            result.append(Trade(trade[1], trade[2], trade[3]))
+            size_hint = limit if limit is not None else self._fetch_batch_size
+            result = self._read_trades(trades, size_hint)
+        elapsed = time.perf_counter() - start
+        self._metrics.increment('pricing.trades read', len(result), pair=pair)
+        self._metrics.timing('pricing.get trades', elapsed, pair=pair)
         return result
 
-    def has_continuous_trades_since(self, pair: str, since: float) -> bool:
+    def iter_trades(self, pair: str, since: Optional[float] = None,
+                    until: Optional[float] = None,
+                    page_size: Optional[int] = None) -> Iterator[TradeBatch]:
+        """
+        Stream trades in pages without keeping them all in memory.
+        Each page is a separate query that continues after the last trade of the previous page.
+
+        :param pair: The traded pair to get trades for.
+        :param since: Time (in seconds) to get trades since.
+        :param until: Time (in seconds) to get trades before.
+        :param page_size: The number of trades in each page.
+        :return: Pages of trades in chronological order.
+        """
+        if page_size is None:
+            page_size = self._fetch_batch_size
+        where, params = self._get_trades_filter(pair, since, until)
+        last_key = None
+        while True:
+            db = self._db_provider.get()
+            cursor = db.cursor()
+            if last_key is None:
+                page_where, page_params = where, params
+            else:
+                # Break ties between trades at the same time with the rest of the unique key
+                # since row ids can change when the database is vacuumed.
+                page_where = where + ' AND (time, price, amount) > (?, ?, ?)'
+                page_params = params + last_key
+            rows = cursor.execute('SELECT price, amount, time FROM trade ' + page_where +
+                                  ' ORDER BY time ASC, price ASC, amount ASC LIMIT ?',
+                                  page_params + (page_size,)).fetchall()
+            if not rows:
+                return
+            price, amount, trade_time = rows[-1]
+            last_key = (trade_time, price, amount)
+            columns = np.array(rows, dtype=np.float64)
+            self._metrics.increment('pricing.trades read', len(rows), pair=pair)
+            yield TradeBatch.from_columns(columns[:, 0], columns[:, 1], columns[:, 2])
+            if len(rows) < page_size:
+                return
+
+    def get_last_trade(self, pair: str) -> Optional[Trade]:
+        """
+        :param pair: The traded pair to get the trade for.
+        :return: The most recent trade or `None` if there are no trades for `pair`.
+        """
+        db = self._db_provider.get()
+        cursor = db.cursor()
+        row = cursor.execute('SELECT price, amount, time FROM trade WHERE pair = ? '
+                             'ORDER BY time DESC LIMIT 1', (pair,)).fetchone()
+        if row is None:
+            return None
+        return Trade._make(row)
+
+    def get_last_n_trades(self, pair: str, n: int) -> TradeBatch:
+        """
+        :param pair: The traded pair to get trades for.
+        :param n: The number of trades to get.
+        :return: The most recent `n` trades in chronological order.
+        """
+        result = self.get_trades(pair, limit=n, order='desc')
+        return result[::-1]
+
+    def _read_trades(self, cursor: sqlite3.Cursor, size_hint: int) -> TradeBatch:
+        return _read_trades(cursor, size_hint, self._fetch_batch_size)
+
+    def has_continuous_trades_since(self, pair: str, since: float, time_grouping: Optional[float] = None) -> bool:
         """
         :param pair: The traded pair to check.
         :param since: Time (in seconds) to check for continuous trades since.
+        :param time_grouping: The number of seconds in each interval that must have a trade.
+            Defaults to `time_grouping`.
         :return:
         """
+        if time_grouping is None:
+            time_grouping = self.time_grouping
         db = self._db_provider.get()
         cursor = db.cursor()
 
@@ -264,11 +996,11 @@ class PriceData(object):
         prev_time_class = None
         for trade in trades:
             trade_time = trade[3]
-            time_class = int(trade_time / self.time_grouping)
+            time_class = int(trade_time / time_grouping)
 
             # TODO Check first before starting the loop.
             if prev_time_class is None:
-                since_time_class = int(since / self.time_grouping)
+                since_time_class = int(since / time_grouping)
                 if time_class != since_time_class:
                     result = False
                     break
@@ -286,3 +1018,11 @@ class PriceData(object):
     @property
     def time_grouping(self):
         return self._time_grouping
+
+
+if __name__ == '__main__':
+    from altymeter.module.module import AltymeterModule
+
+    inj = AltymeterModule.get_injector()
+    p: PriceData = inj.get(PriceData)
+    p.compact()
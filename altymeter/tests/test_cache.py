@@ -0,0 +1,25 @@
+import unittest
+
+from altymeter.cache import LruCache
+
+
+class TestLruCache(unittest.TestCase):
+    def test_eviction(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        # 'b' is the least recently used.
+        cache.put('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+
+        stats = cache.stats
+        self.assertEqual(3, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0.75, stats['hit_rate'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(2, stats['size'])
@@ -0,0 +1,87 @@
+import logging
+import threading
+import unittest
+from collections import defaultdict
+
+from altymeter.collect_data import DataCollector
+from altymeter.metrics import Metrics
+from altymeter.pricing import Trade
+
+
+class _Exchange(object):
+    name = 'Test'
+    trades_page_size = 2
+    trades_calls_per_second = None
+
+    def __init__(self):
+        self.calls = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get_pair(self, base, to):
+        return to + base
+
+    def fetch_trades(self, pair, since=None):
+        with self._lock:
+            self.calls[pair].append(since)
+            num_calls = len(self.calls[pair])
+        if pair == 'BADBTC' and num_calls == 1:
+            raise Exception("Failed.")
+        since = since or 0
+        return [Trade(1, 1, since + 1)], since + 1
+
+
+class _PriceData(object):
+    def __init__(self, stop_event, num_pairs):
+        self.trades = defaultdict(list)
+        self._stop_event = stop_event
+        self._num_pairs = num_pairs
+
+    def add_prices(self, pair, trades):
+        self.trades[pair].extend(trades)
+        if len(self.trades) == self._num_pairs and all(len(t) >= 2 for t in self.trades.values()):
+            self._stop_event.set()
+
+
+def _get_shard_collector():
+    config = dict(exchanges=dict(Test=dict(collect=['BTC,ETH', 'BTC,XRP', 'BTC,LTC'],
+                                           **{'poll seconds': 0.03})),
+                  collector={'min poll seconds': 0.01})
+    return DataCollector(config, dict(Test=_Exchange()), logging.getLogger(__name__), None, Metrics())
+
+
+class TestDataCollector(unittest.TestCase):
+    def test_collect_data(self):
+        pairs = ['BTC,ETH', 'BTC,XRP', 'BTC,BAD']
+        config = dict(exchanges=dict(Test=dict(collect=pairs, **{'poll seconds': 0.03})),
+                      collector={'max workers': 2, 'min poll seconds': 0.01,
+                                 'retry seconds': 0.01, 'max backoff seconds': 0.05})
+        exchange = _Exchange()
+        stop_event = threading.Event()
+        price_data = _PriceData(stop_event, len(pairs))
+        collector = DataCollector(config, dict(Test=exchange), logging.getLogger(__name__), price_data, Metrics())
+
+        thread = threading.Thread(target=collector.collect_data, args=(stop_event,))
+        thread.start()
+        thread.join(timeout=10)
+        stop_event.set()
+        thread.join()
+
+        self.assertTrue(stop_event.is_set())
+        self.assertEqual({'ETHBTC', 'XRPBTC', 'BADBTC'}, set(price_data.trades))
+        for pair, calls in exchange.calls.items():
+            # Each poll continues from the previous one.
+            trades = price_data.trades[pair]
+            self.assertEqual(list(range(1, len(trades) + 1)), [t.time for t in trades])
+        # The failed poll was retried from the same place.
+        self.assertEqual([None, None], exchange.calls['BADBTC'][:2])
+
+    def test_collect_data_sharded(self):
+        stop_event = threading.Event()
+        price_data = _PriceData(stop_event, 3)
+        collector = DataCollector(dict(exchanges=dict()), dict(), logging.getLogger(__name__), price_data,
+                                  Metrics())
+        collector.collect_data_sharded(2, stop_event, get_collector=_get_shard_collector)
+
+        self.assertEqual({'ETHBTC', 'XRPBTC', 'LTCBTC'}, set(price_data.trades))
+        for trades in price_data.trades.values():
+            self.assertEqual(list(range(1, len(trades) + 1)), [t.time for t in trades])
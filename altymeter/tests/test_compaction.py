@@ -0,0 +1,71 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from altymeter.metrics import Metrics
+from altymeter.module.db_module import DbModule
+from altymeter.pricing import PriceData, split_prices, Trade
+
+
+class _DbProvider(object):
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+
+    def get(self) -> sqlite3.Connection:
+        return self._db
+
+
+class TestCompaction(unittest.TestCase):
+    def test_compact(self):
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        DbModule()._initialize_db(db)
+        with tempfile.TemporaryDirectory() as archive_dir:
+            config = dict(pricing={'keep trades days': 1, 'archive dir': archive_dir,
+                                   'time grouping': 600, 'bar resolutions': [60, 3600]})
+            price_data = PriceData(config, logging.getLogger(__name__), None, _DbProvider(db), Metrics())
+            pair = 'PAIR_compact'
+            day = 24 * 60 * 60
+            # Two months of trades every 10 minutes.
+            t = 1517443200.0
+            trades = [Trade(10 + i % 5, 1 + i % 3, t + i * 600) for i in range(60 * 24 * 6)]
+            price_data.add_prices(pair, trades)
+            price_data.update_bars(pair)
+            now = t + 40 * day
+            cutoff = int((now - day) / 3600) * 3600
+            # Some trades arrive late.
+            late_trade = Trade(20, 2, cutoff - 3 * day + 1)
+            price_data.add_prices(pair, [late_trade])
+            all_trades = sorted(trades + [late_trade], key=lambda trade: trade.time)
+            expected_prices = split_prices(price_data.get_trades(pair), 3600)
+            expected_default_prices = price_data.get_prices(pair)
+
+            num_archived = price_data.compact(pair, now=now)
+
+            self.assertEqual(sum(trade.time < cutoff for trade in all_trades), num_archived)
+            self.assertEqual([trade for trade in all_trades if trade.time < cutoff],
+                             price_data.get_archived_trades(pair))
+            self.assertEqual([trade for trade in all_trades if trade.time >= cutoff],
+                             price_data.get_trades(pair))
+            self.assertEqual(['2018-02.npz', '2018-03.npz'], sorted(os.listdir(os.path.join(archive_dir, pair))))
+            # Prices still include the trades that were moved.
+            self.assertEqual(expected_prices.times, price_data.get_prices(pair, resolution=3600).times)
+            self.assertEqual(expected_prices.volumes, price_data.get_prices(pair, resolution=3600).volumes)
+            default_prices = price_data.get_prices(pair)
+            self.assertEqual(expected_default_prices.times, default_prices.times)
+            self.assertEqual(expected_default_prices.volumes, default_prices.volumes)
+
+            # Compacting again only moves newer trades.
+            self.assertEqual(0, price_data.compact(pair, now=now))
+            num_remaining = len(price_data.get_trades(pair))
+            self.assertEqual(num_remaining, price_data.compact(pair, now=now + 30 * day))
+            self.assertEqual(all_trades, price_data.get_archived_trades(pair))
+            self.assertEqual(0, len(price_data.get_trades(pair)))
+
+    def test_compact_requires_bars_for_time_grouping(self):
+        db = sqlite3.connect(':memory:')
+        DbModule()._initialize_db(db)
+        config = dict(pricing={'time grouping': 90, 'bar resolutions': [60, 3600]})
+        price_data = PriceData(config, logging.getLogger(__name__), None, _DbProvider(db), Metrics())
+        self.assertRaises(ValueError, price_data.compact)
@@ -1,9 +1,35 @@
+import logging
+import sqlite3
 import time
 import unittest
 from operator import itemgetter
 
+from altymeter.api.price.cryptocompare import CryptoCompareApi
+from altymeter.metrics import Metrics
+from altymeter.module.db_module import DbModule
 from altymeter.module.test_module import TestModule
-from altymeter.pricing import PriceData, SplitPrices, Trade
+from altymeter.pricing import PriceData, split_prices, SplitPrices, Trade, TradeBatch
+
+
+class _MissingHistoricalPricing(object):
+    """
+    Has no data for any hour.
+    """
+
+    def __init__(self):
+        self.num_requests = 0
+
+    def get_hour_value(self, symbol, fiat_symbol, time_in_s):
+        self.num_requests += 1
+        return None
+
+
+class _DbProvider(object):
+    def __init__(self, db: sqlite3.Connection):
+        self._db = db
+
+    def get(self) -> sqlite3.Connection:
+        return self._db
 
 
 class TestPriceData(unittest.TestCase):
@@ -123,12 +149,73 @@ class TestPriceData(unittest.TestCase):
         ]
         self.assertEqual(self.price_data.get_trades(pair), expected)
 
+    def test_get_trades(self):
+        pair = 'PAIR_test_get_trades'
+        prices = [Trade(i, 1, 1518214842.0 + i) for i in range(5)]
+        self.price_data.add_prices(pair, prices)
+        self.assertEqual(prices, self.price_data.get_trades(pair))
+        self.assertEqual(prices, self.price_data.get_trades(pair, progress=True))
+        self.assertEqual(prices[2:], self.price_data.get_trades(pair, since=prices[2].time))
+        self.assertEqual(prices[1:3], self.price_data.get_trades(pair, since=prices[1].time, until=prices[3].time))
+        self.assertEqual(prices[::-1][:2], self.price_data.get_trades(pair, limit=2, order='desc'))
+        self.assertRaises(ValueError, self.price_data.get_trades, pair, order='sideways')
+
+    def test_iter_trades(self):
+        pair = 'PAIR_test_iter_trades'
+        # Some trades happen at the same time.
+        prices = [Trade(i, 1, 1518214842.0 + i // 2) for i in range(5)]
+        self.price_data.add_prices(pair, prices)
+        # A page ends between trades at the same time.
+        pages = list(self.price_data.iter_trades(pair, page_size=3))
+        self.assertEqual([3, 2], list(map(len, pages)))
+        self.assertEqual(prices, [trade for page in pages for trade in page])
+        self.assertEqual(prices[2:4], [trade for page in self.price_data.iter_trades(
+            pair, since=prices[2].time, until=prices[4].time) for trade in page])
+
+    def test_get_last_trades(self):
+        pair = 'PAIR_test_get_last_trades'
+        self.assertIsNone(self.price_data.get_last_trade(pair))
+        prices = [Trade(i, 1, 1518214842.0 + i) for i in range(5)]
+        self.price_data.add_prices(pair, prices)
+        self.assertEqual(prices[-1], self.price_data.get_last_trade(pair))
+        self.assertEqual(prices[-3:], self.price_data.get_last_n_trades(pair, 3))
+        self.assertEqual(prices, self.price_data.get_last_n_trades(pair, 10))
+
     def test_get_hour_value(self):
         t = 1516414600
         api_val = self.price_data.get_hour_value('XRP', 'CAD', t)
         stored_val = self.price_data.get_hour_value('XRP', 'CAD', t + 60 * 30)
         self.assertEqual(api_val, stored_val)
 
+    def test_hour_value_stats_before_lookups(self):
+        price_data = PriceData(dict(), logging.getLogger(__name__), None, None, Metrics())
+        stats = price_data.hour_value_stats
+        self.assertEqual(0, stats['average time s'])
+        self.assertEqual(0, stats['pending writes'])
+
+    def test_get_missing_hour_value(self):
+        db = sqlite3.connect(':memory:')
+        DbModule()._initialize_db(db)
+        historical_pricing = _MissingHistoricalPricing()
+        price_data = PriceData(dict(), logging.getLogger(__name__), historical_pricing, _DbProvider(db), Metrics())
+        t = 1516414600
+        self.assertRaises(ValueError, price_data.get_hour_value, 'ETH', 'CAD', t)
+        # The missing value is remembered.
+        self.assertRaises(ValueError, price_data.get_hour_value, 'ETH', 'CAD', t + 60)
+        self.assertEqual(1, historical_pricing.num_requests)
+        stats = price_data.hour_value_stats
+        self.assertEqual(1, stats['negative hits'])
+        self.assertEqual(2, stats['lookups'])
+
+    def test_prefetch_hour_values(self):
+        t = 1516414600
+        needs = [('ETH', 'CAD', t + i * 3600) for i in range(3)]
+        self.price_data.prefetch_hour_values(needs)
+        api = self.inj.get(CryptoCompareApi)
+        for symbol, fiat_symbol, time_in_s in needs:
+            self.assertAlmostEqual(api.get_hour_value(symbol, fiat_symbol, int(time_in_s / 3600) * 3600),
+                                   self.price_data.get_hour_value(symbol, fiat_symbol, time_in_s))
+
     def test_get_prices(self):
         pair = 'PAIR'
         prices = [
@@ -173,6 +260,43 @@ class TestPriceData(unittest.TestCase):
         self.assertIn('PAIR', self.price_data.get_pairs())
         self.assertIn(pair, self.price_data.get_pairs())
 
+    def test_get_prices_by_pair(self):
+        t = 1518214842.0
+        trades = {
+            'PAIR_by_pair_1': [Trade(10, 1, t), Trade(12, 3, t + 1)],
+            'PAIR_by_pair_2': [Trade(20, 1, t), Trade(30, 1, t + self.price_data.time_grouping)],
+        }
+        for pair, pair_trades in trades.items():
+            self.price_data.add_prices(pair, pair_trades)
+
+        prices = self.price_data.get_prices_by_pair(trades)
+        self.assertEqual(list(trades), list(prices))
+        self.assertEqual([[11.5]], prices['PAIR_by_pair_1'].prices)
+        self.assertEqual([[4]], prices['PAIR_by_pair_1'].volumes)
+        self.assertEqual([[20, 30]], prices['PAIR_by_pair_2'].prices)
+        time_class = int(t / self.price_data.time_grouping)
+        self.assertEqual([[(time_class + 0.5) * self.price_data.time_grouping,
+                           (time_class + 1.5) * self.price_data.time_grouping]],
+                         prices['PAIR_by_pair_2'].times)
+
+    def test_get_prices_resolution(self):
+        pair = 'PAIR_test_get_prices_resolution'
+        t = 1518213600.0
+        trades = [Trade(10 + i % 7, 1 + i % 3, t + i * 37.5) for i in range(200)]
+        self.price_data.add_prices(pair, trades[:120])
+        self.price_data.get_prices(pair, resolution=60)
+        # Later trades are added to the last bars.
+        self.price_data.add_prices(pair, trades[120:])
+        for resolution in (60, 120, 600, 3600):
+            expected = split_prices(self.price_data.get_trades(pair), resolution)
+            actual = self.price_data.get_prices(pair, resolution=resolution)
+            self.assertEqual(expected.times, actual.times)
+            self.assertEqual(expected.volumes, actual.volumes)
+            for expected_chunk, actual_chunk in zip(expected, actual):
+                for expected_price, actual_price in zip(expected_chunk, actual_chunk):
+                    self.assertAlmostEqual(expected_price, actual_price)
+        self.assertRaises(ValueError, self.price_data.get_prices, pair, resolution=90)
+
     def test_has_continuous_trades_since(self):
         t = int(time.time())
         pair = 'PAIR_has_trades_since'
@@ -197,5 +321,31 @@ class TestPriceData(unittest.TestCase):
         actual = self.price_data.has_continuous_trades_since(pair, t - self.price_data.time_grouping * 1)
         self.assertTrue(actual)
 
+        # Each interval needs a trade when intervals are shorter.
+        time_grouping = self.price_data.time_grouping / 2
+        actual = self.price_data.has_continuous_trades_since(pair, t - self.price_data.time_grouping * 2,
+                                                             time_grouping)
+        self.assertFalse(actual)
+        actual = self.price_data.has_continuous_trades_since(pair, t - self.price_data.time_grouping * 2,
+                                                             self.price_data.time_grouping * 2)
+        self.assertTrue(actual)
+
         actual = self.price_data.has_continuous_trades_since(pair, t)
         self.assertTrue(actual)
+
+
+class TestTradeBatch(unittest.TestCase):
+    def test_sort_and_merge(self):
+        trades = TradeBatch.from_trades([
+            Trade(3, 4, 10.),
+            Trade(2, 3, 8.),
+            Trade(3, 1, 10.),
+            Trade(5, 7, 10.),
+        ])
+        self.assertEqual(4, len(trades))
+        self.assertEqual(Trade(2, 3, 8.), trades[1])
+
+        trades = trades.sort()
+        self.assertEqual([8, 10, 10, 10], trades.time.tolist())
+        self.assertEqual([Trade(2, 3, 8.), Trade(3, 5, 10.), Trade(5, 7, 10.)], trades.merge_duplicates())
+        self.assertEqual([Trade(3, 4, 10.), Trade(3, 1, 10.)], trades[1:3])
@@ -0,0 +1,144 @@
+from collections import namedtuple
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from altymeter.api.exchange import ExchangeOpenOrder
+
+
+class LegDepth(namedtuple('LegDepth', [
+    'cum_in',
+    'cum_out',
+])):
+    """
+    The cumulative depth of one leg of a cycle.
+    Trading `cum_in[i]` of the asset given uses up the first `i` price levels and obtains `cum_out[i]`.
+    Both start with 0 so that amounts between levels can be interpolated.
+
+    :param cum_in: The cumulative amounts of the asset given.
+    :param cum_out: The cumulative amounts of the asset obtained.
+    """
+
+    @property
+    def max_in(self) -> float:
+        return self.cum_in[-1]
+
+    def get_out(self, amounts):
+        """
+        :param amounts: Amounts of the asset to give.
+        :return: The amounts of the asset obtained, capped at the depth of the leg.
+        """
+        return np.interp(amounts, self.cum_in, self.cum_out)
+
+    def get_in(self, amounts):
+        """
+        :param amounts: Amounts of the asset to obtain.
+        :return: The amounts of the asset needed to give, capped at the depth of the leg.
+        """
+        return np.interp(amounts, self.cum_out, self.cum_in)
+
+
+class CycleLiquidity(namedtuple('CycleLiquidity', [
+    'rate',
+    'max_amount',
+    'amounts',
+    'flows',
+])):
+    """
+    How much can be traded through a cycle given the open orders on each leg.
+    Amounts are in the first asset of the cycle.
+
+    :param rate: The amount obtained after trading 1 through the cycle using only the best price of each leg.
+    :param max_amount: The most that can be traded through the cycle before running out of orders on a leg.
+    :param amounts: Amounts to trade through the cycle, up to `max_amount`.
+    :param flows: The amount obtained after trading each of `amounts` through the cycle.
+    """
+
+    @property
+    def profits(self) -> np.ndarray:
+        return self.flows - self.amounts
+
+    def get_best(self) -> Tuple[float, float]:
+        """
+        :return: The amount to trade that gives the most profit and that profit.
+        """
+        if len(self.amounts) == 0:
+            return 0., 0.
+        profits = self.profits
+        i = int(np.argmax(profits))
+        return float(self.amounts[i]), float(profits[i])
+
+    def get_max_profitable_amount(self, min_profit: float = 0) -> float:
+        """
+        :param min_profit: The minimum profit as a proportion of the amount traded.
+        :return: The largest amount in `amounts` that still gives at least `min_profit`.
+        """
+        profitable = self.flows >= self.amounts * (1 + min_profit)
+        if not profitable.any():
+            return 0.
+        return float(self.amounts[profitable][-1])
+
+
+def get_leg_depth(orders: Sequence[ExchangeOpenOrder], order_type: str) -> LegDepth:
+    """
+    :param orders: Open orders for a pair.
+    :param order_type: 'ask' to buy the pair's `to` asset with its `base`
+        or 'bid' to sell the pair's `to` asset for its `base`.
+    :return: The cumulative depth when trading through the best orders first.
+    """
+    prices = np.fromiter((o.price for o in orders if o.order_type == order_type), dtype=np.float64)
+    volumes = np.fromiter((o.volume for o in orders if o.order_type == order_type), dtype=np.float64)
+    return get_leg_depth_from_levels(prices, volumes, order_type)
+
+
+def get_leg_depth_from_levels(prices: np.ndarray, volumes: np.ndarray, order_type: str) -> LegDepth:
+    """
+    :param prices: The price of each level in the pair's `base` asset.
+    :param volumes: The volume of each level in the pair's `to` asset.
+    :param order_type: 'ask' or 'bid'. See `get_leg_depth`.
+    :return: The cumulative depth when trading through the best orders first.
+    """
+    if order_type == 'ask':
+        # Cheapest asks first. Give `base` to get `to`.
+        order = np.argsort(prices, kind='stable')
+        given = prices[order] * volumes[order]
+        obtained = volumes[order]
+    elif order_type == 'bid':
+        # Highest bids first. Give `to` to get `base`.
+        order = np.argsort(-prices, kind='stable')
+        given = volumes[order]
+        obtained = prices[order] * volumes[order]
+    else:
+        raise ValueError("Invalid order_type: '{}'".format(order_type))
+    cum_in = np.concatenate(([0.], np.cumsum(given)))
+    cum_out = np.concatenate(([0.], np.cumsum(obtained)))
+    return LegDepth(cum_in, cum_out)
+
+
+def evaluate_cycle(legs: List[LegDepth], num_amounts: int = 20) -> CycleLiquidity:
+    """
+    Walk the cumulative depth of each leg to find how much can be traded through a cycle.
+
+    :param legs: The depth of each leg in the order that the cycle is traded.
+    :param num_amounts: The number of amounts to evaluate the flow for.
+    :return: The liquidity of the cycle.
+    """
+    assert legs, "No legs given."
+    if any(len(leg.cum_in) < 2 for leg in legs):
+        empty = np.zeros(0)
+        return CycleLiquidity(0., 0., empty, empty)
+
+    rate = 1.
+    for leg in legs:
+        rate *= leg.cum_out[1] / leg.cum_in[1]
+
+    # Go backwards to find the most that each leg can take without overflowing the legs after it.
+    max_amount = legs[-1].max_in
+    for leg in reversed(legs[:-1]):
+        max_amount = float(leg.get_in(max_amount))
+
+    amounts = np.linspace(0, max_amount, num_amounts + 1)[1:]
+    flows = amounts
+    for leg in legs:
+        flows = leg.get_out(flows)
+    return CycleLiquidity(rate, max_amount, amounts, flows)
@@ -1,9 +1,13 @@
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from logging import Logger
+from threading import RLock
 
 import dpath.util
 import requests
 from injector import inject, singleton
 
+from altymeter.cache import LruCache
 from altymeter.module.constants import Configuration
 
 
@@ -23,9 +27,21 @@ class Ocr(object):
         self._subscription_key = cognitive_config.get('subscription key')
         self._endpoint_base = '{}/vision/v1.0/ocr'.format(cognitive_config.get('endpoint base'))
 
-    def read(self, pic_url):
+        # The same picture is often tweeted several times so remember what was read.
+        cache_size = cognitive_config.get('cache size', 1000)
+        self._text_by_url = LruCache(cache_size)
+        self._text_by_content_hash = LruCache(cache_size)
+
+        self._executor = ThreadPoolExecutor(max_workers=cognitive_config.get('max workers', 4),
+                                            thread_name_prefix='ocr')
+        # Re-entrant since a done callback runs right away if the future is already done.
+        self._pending_lock = RLock()
+        # Maps picture URLs to the futures currently reading them.
+        self._pending = dict()
+
+    def _read_content(self, content: bytes) -> str:
         headers = {
-            'Content-Type': 'application/json',
+            'Content-Type': 'application/octet-stream',
             'Ocp-Apim-Subscription-Key': self._subscription_key,
         }
 
@@ -35,7 +51,7 @@ class Ocr(object):
         )
 
         r = requests.post(self._endpoint_base, params=params,
-                          json=dict(url=pic_url), headers=headers)
+                          data=content, headers=headers)
         r.raise_for_status()
         lines = []
         for line in dpath.util.values(r.json(), 'regions/*/lines/*'):
@@ -43,3 +59,50 @@ class Ocr(object):
             lines.append(" ".join(globs))
         result = "\n".join(lines)
         return result
+
+    def read(self, pic_url: str) -> str:
+        """
+        :param pic_url: The URL of a picture.
+        :return: The lines of text in the picture.
+        """
+        result = self._text_by_url.get(pic_url)
+        if result is not None:
+            return result
+
+        r = requests.get(pic_url)
+        r.raise_for_status()
+        content = r.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        result = self._text_by_content_hash.get(content_hash)
+        if result is None:
+            result = self._read_content(content)
+            self._text_by_content_hash.put(content_hash, result)
+        else:
+            self._logger.debug("Already read the picture at %s.", pic_url)
+        self._text_by_url.put(pic_url, result)
+        return result
+
+    def submit(self, pic_url: str) -> Future:
+        """
+        Read a picture in the background.
+        Reading a picture that is already being read does not send another request.
+
+        :param pic_url: The URL of a picture.
+        :return: A future for the result of `read`.
+        """
+        with self._pending_lock:
+            result = self._pending.get(pic_url)
+            if result is None:
+                result = self._executor.submit(self.read, pic_url)
+                self._pending[pic_url] = result
+                result.add_done_callback(lambda _: self._remove_pending(pic_url))
+        return result
+
+    def _remove_pending(self, pic_url: str):
+        with self._pending_lock:
+            self._pending.pop(pic_url, None)
+
+    @property
+    def cache_stats(self) -> dict:
+        return dict(url=self._text_by_url.stats,
+                    content=self._text_by_content_hash.stats)
@@ -1,4 +1,8 @@
+import json
+import logging
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
 from injector import inject, with_injector
 
@@ -17,3 +21,79 @@ class TestOcr(unittest.TestCase):
         text = ocr.read(
             'https://upload.wikimedia.org/wikipedia/commons/thumb/a/af/Atomist_quote_from_Democritus.png/338px-Atomist_quote_from_Democritus.png')
         self.assertEqual("NOTHING\nEXISTS\nEXCEPT\nATOMS\nAND EMPTY\nSPACE.\nEverything else\nis opinion.", text)
+
+
+class _FakeOcrHandler(BaseHTTPRequestHandler):
+    """
+    Serves pictures and reads the "text" in them which is just the content of the picture.
+    """
+    pictures = {
+        '/a.png': b'BUY ABC',
+        '/a_copy.png': b'BUY ABC',
+        '/b.png': b'nothing\nhere',
+    }
+    num_reads = 0
+
+    def do_GET(self):
+        content = self.pictures.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        type(self).num_reads += 1
+        content = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        lines = [dict(words=[dict(text=word) for word in line.split(' ')])
+                 for line in content.split('\n')]
+        body = json.dumps(dict(regions=[dict(lines=lines)])).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestOcrCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), _FakeOcrHandler)
+        cls.url_base = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _FakeOcrHandler.num_reads = 0
+        config = {'API': {'Azure': {'Cognitive': {
+            'subscription key': 'key',
+            'endpoint base': self.url_base,
+            'cache size': 2,
+        }}}}
+        self.ocr = Ocr(config, logging.getLogger('test'))
+
+    def test_read_cached(self):
+        self.assertEqual("BUY ABC", self.ocr.read(self.url_base + '/a.png'))
+        self.assertEqual("BUY ABC", self.ocr.read(self.url_base + '/a.png'))
+        self.assertEqual(1, _FakeOcrHandler.num_reads)
+
+        # Same content at another URL.
+        self.assertEqual("BUY ABC", self.ocr.read(self.url_base + '/a_copy.png'))
+        self.assertEqual(1, _FakeOcrHandler.num_reads)
+
+        self.assertEqual("nothing\nhere", self.ocr.read(self.url_base + '/b.png'))
+        self.assertEqual(2, _FakeOcrHandler.num_reads)
+        self.assertEqual(1, self.ocr.cache_stats['url']['evictions'])
+
+    def test_submit(self):
+        futures = [self.ocr.submit(self.url_base + path) for path in ['/a.png', '/b.png', '/a.png']]
+        self.assertEqual(["BUY ABC", "nothing\nhere", "BUY ABC"], [f.result(timeout=10) for f in futures])
+        self.assertEqual(2, _FakeOcrHandler.num_reads)
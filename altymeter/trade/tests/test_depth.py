@@ -0,0 +1,52 @@
+import unittest
+
+import numpy as np
+
+from altymeter.api.exchange import ExchangeOpenOrder
+from altymeter.trade.depth import evaluate_cycle, get_leg_depth
+
+
+class TestDepth(unittest.TestCase):
+    def test_get_leg_depth(self):
+        orders = [
+            ExchangeOpenOrder('ETHBTC', 'Test', price=0.2, volume=5, order_type='ask'),
+            ExchangeOpenOrder('ETHBTC', 'Test', price=0.1, volume=10, order_type='ask'),
+            ExchangeOpenOrder('ETHBTC', 'Test', price=0.05, volume=10, order_type='bid'),
+        ]
+        leg = get_leg_depth(orders, 'ask')
+        np.testing.assert_allclose([0, 1, 2], leg.cum_in)
+        np.testing.assert_allclose([0, 10, 15], leg.cum_out)
+        self.assertAlmostEqual(12.5, float(leg.get_out(1.5)))
+        # Capped at the depth.
+        self.assertAlmostEqual(15, float(leg.get_out(3)))
+
+        leg = get_leg_depth(orders, 'bid')
+        np.testing.assert_allclose([0, 10], leg.cum_in)
+        np.testing.assert_allclose([0, 0.5], leg.cum_out)
+
+    def test_evaluate_cycle(self):
+        # BTC -> ETH -> BTC where ETH can be bought for 0.1 BTC and sold for 0.12 BTC.
+        orders = [
+            ExchangeOpenOrder('ETHBTC', 'Test', price=0.1, volume=10, order_type='ask'),
+            ExchangeOpenOrder('ETHBTC', 'Test', price=0.2, volume=10, order_type='ask'),
+            ExchangeOpenOrder('ETHBTC2', 'Test', price=0.12, volume=5, order_type='bid'),
+            ExchangeOpenOrder('ETHBTC2', 'Test', price=0.06, volume=5, order_type='bid'),
+        ]
+        legs = [get_leg_depth(orders, 'ask'), get_leg_depth(orders, 'bid')]
+        liquidity = evaluate_cycle(legs, num_amounts=10)
+        self.assertAlmostEqual(1.2, liquidity.rate)
+        # Only 10 ETH can be sold which costs 1 BTC.
+        self.assertAlmostEqual(1, liquidity.max_amount)
+        self.assertEqual(10, len(liquidity.amounts))
+        best_amount, best_profit = liquidity.get_best()
+        # Selling more than 5 ETH (0.5 BTC) goes into the low bids.
+        self.assertAlmostEqual(0.5, best_amount)
+        self.assertAlmostEqual(0.1, best_profit)
+        self.assertAlmostEqual(0.7, liquidity.get_max_profitable_amount())
+        self.assertAlmostEqual(0.5, liquidity.get_max_profitable_amount(0.2))
+
+    def test_evaluate_cycle_no_orders(self):
+        legs = [get_leg_depth([], 'ask'), get_leg_depth([], 'bid')]
+        liquidity = evaluate_cycle(legs)
+        self.assertEqual(0, liquidity.max_amount)
+        self.assertEqual((0, 0), liquidity.get_best())
@@ -1,9 +1,24 @@
 import unittest
 from injector import with_injector, inject
+from altymeter.api.exchange import ExchangeOpenOrder, TradedPair, TradedPairIndex
 from altymeter.module.module import AltymeterModule
 from altymeter.trade.trade_cycles import InefficientMarkerFinder
 
 
+class _FakeExchange(object):
+    name = 'Fake'
+
+    def __init__(self, traded_pairs):
+        self.traded_pair_index = TradedPairIndex(traded_pairs)
+        self.order_books = dict()
+
+    def get_traded_pair_index(self):
+        return self.traded_pair_index
+
+    def get_order_book(self, pair=None, order_type=None):
+        return [order for order in self.order_books.get(pair, []) if order.order_type == order_type]
+
+
 class TestInefficientMarkerFinder(unittest.TestCase):
     @classmethod
     @with_injector(AltymeterModule)
@@ -55,3 +70,59 @@ class TestInefficientMarkerFinder(unittest.TestCase):
                           ('BTC', 'XRP', 'ETH', 'BTC'),
                           ('BTC', 'NEO', 'ETH', 'BTC')},
                          cycles)
+
+    @inject
+    def test_index_cycles_by_pair(self, t: InefficientMarkerFinder):
+        traded_pairs = [
+            TradedPair('ETHBTC', 'Test', base='BTC', base_full_name='BTC', to='ETH', to_full_name='ETH'),
+            TradedPair('XRPBTC', 'Test', base='BTC', base_full_name='BTC', to='XRP', to_full_name='XRP'),
+            TradedPair('XRPETH', 'Test', base='ETH', base_full_name='ETH', to='XRP', to_full_name='XRP'),
+            TradedPair('NEOBTC', 'Test', base='BTC', base_full_name='BTC', to='NEO', to_full_name='NEO'),
+        ]
+        cycles = [
+            ['BTC', 'ETH', 'XRP', 'BTC'],
+            ['BTC', 'XRP', 'ETH', 'BTC'],
+        ]
+        index = t._index_cycles_by_pair(cycles, TradedPairIndex(traded_pairs))
+        self.assertEqual({'ETHBTC', 'XRPBTC', 'XRPETH'}, set(index.keys()))
+        for pair in ['ETHBTC', 'XRPBTC', 'XRPETH']:
+            self.assertEqual(cycles, index[pair])
+        self.assertNotIn('NEOBTC', index)
+
+    @inject
+    def test_pair_updates(self, t: InefficientMarkerFinder):
+        traded_pairs = [
+            TradedPair('ETHBTC', 'Fake', base='BTC', base_full_name='BTC', to='ETH', to_full_name='ETH'),
+            TradedPair('XRPBTC', 'Fake', base='BTC', base_full_name='BTC', to='XRP', to_full_name='XRP'),
+            TradedPair('XRPETH', 'Fake', base='ETH', base_full_name='ETH', to='XRP', to_full_name='XRP'),
+            TradedPair('NEOBTC', 'Fake', base='BTC', base_full_name='BTC', to='NEO', to_full_name='NEO'),
+            TradedPair('NEOETH', 'Fake', base='ETH', base_full_name='ETH', to='NEO', to_full_name='NEO'),
+        ]
+        exchange = _FakeExchange(traded_pairs)
+        xrp_cycle = ['BTC', 'ETH', 'XRP', 'BTC']
+        neo_cycle = ['BTC', 'ETH', 'NEO', 'BTC']
+        t._pair_cycles[exchange] = t._index_cycles_by_pair([xrp_cycle, neo_cycle], exchange.traded_pair_index)
+        t._get_updated_cycles()
+
+        t.on_pair_updated(exchange, 'XRPBTC')
+        self.assertEqual([(exchange, xrp_cycle)], t._get_updated_cycles())
+        t.on_pair_updated(exchange, 'ETHBTC')
+        t.on_pair_updated(exchange, 'XRPETH')
+        self.assertEqual([(exchange, xrp_cycle), (exchange, neo_cycle)], t._get_updated_cycles())
+        self.assertEqual([], t._get_updated_cycles())
+
+        # Refreshing an order book only signals an update when it changed.
+        exchange.order_books['NEOBTC'] = [
+            ExchangeOpenOrder('NEOBTC', 'Fake', price=0.01, volume=10, order_type='ask')]
+        t._get_leg_depth(exchange, 'NEOBTC', 'ask')
+        t._order_books_cache.clear()
+        t._get_leg_depth(exchange, 'NEOBTC', 'ask')
+        self.assertEqual([], t._get_updated_cycles())
+
+        exchange.order_books['NEOBTC'] = [
+            ExchangeOpenOrder('NEOBTC', 'Fake', price=0.02, volume=10, order_type='ask')]
+        t._order_books_cache.clear()
+        leg = t._get_leg_depth(exchange, 'NEOBTC', 'ask')
+        self.assertEqual([(exchange, neo_cycle)], t._get_updated_cycles())
+        # The refreshed order book is still used.
+        self.assertIs(leg, t._get_leg_depth(exchange, 'NEOBTC', 'ask'))
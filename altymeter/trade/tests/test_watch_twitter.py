@@ -0,0 +1,113 @@
+import logging
+import re
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+from altymeter.api.exchange import ExchangeOrder, PairRecentStats, TradedPair, TradedPairIndex
+from altymeter.trade.watch_twitter import TwitterWatchingTrader
+
+
+class _FakeExchange(object):
+    """
+    Records orders instead of placing them.
+    """
+
+    def __init__(self, name, traded_pairs, failing_sell_price=None):
+        self.name = name
+        self.traded_pair_index = TradedPairIndex(traded_pairs)
+        self.failing_sell_price = failing_sell_price
+        self.orders = []
+
+    def get_traded_pair_index(self):
+        return self.traded_pair_index
+
+    def get_recent_stats(self, pair):
+        return PairRecentStats(pair, self.name, weighted_avg_price=0.0001, last_price=0.0001)
+
+    def create_order(self, pair, action_type, order_type, price, volume, time_in_force=None):
+        self.orders.append((pair, action_type, price, volume))
+        if action_type == 'sell' and self.failing_sell_price is not None \
+                and abs(price - self.failing_sell_price) < 1e-12:
+            raise ValueError("Order rejected.")
+        return ExchangeOrder(pair, self.name, price, volume, 'open', action_type, order_type)
+
+
+class _ImmediateExecutor(object):
+    """
+    Runs tasks as soon as they are submitted so that tests do not need to wait for them.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        result = Future()
+        result.set_result(fn(*args, **kwargs))
+        return result
+
+
+class _FakeDevice(object):
+    nickname = 'phone'
+
+
+class _FakePushbullet(object):
+    def __init__(self, api_key, encryption_password):
+        self.devices = [_FakeDevice()]
+        self.sent = []
+
+    def push_sms(self, device, number, text):
+        self.sent.append((number, text))
+
+
+class TestTwitterWatchingTrader(unittest.TestCase):
+    def _make_trader(self, exchanges, bases) -> TwitterWatchingTrader:
+        config = {
+            'API': {
+                'Pushbullet': {'api key': 'key', 'encryption password': 'password', 'device name': 'phone',
+                               'numbers to notify': ['555']},
+                'Twitter': {'consumer key': 'key', 'consumer secret': 'secret',
+                            'access token key': 'key', 'access token secret': 'secret',
+                            'watch': {'screen names': ['someone'],
+                                      'pattern': r'BUY (?P<coin_name>\w+)(\W*\((?P<coin>\w+)\))?'}},
+            },
+            'exchanges': {name: {'bases': exchange_bases} for name, exchange_bases in bases.items()},
+        }
+        with mock.patch('altymeter.trade.watch_twitter.Pushbullet', _FakePushbullet), \
+                mock.patch('altymeter.trade.watch_twitter.twitter.Api'):
+            result = TwitterWatchingTrader(config, logging.getLogger(__name__), exchanges, ocr=None)
+        result._executor = _ImmediateExecutor()
+        return result
+
+    def _handle_text(self, trader: TwitterWatchingTrader, text: str):
+        tweet = dict(text=text, timestamp_ms='0')
+        m = re.search(trader._watch_config['pattern'], text)
+        trader._handle_tweet(tweet, m, None, None)
+
+    def test_handle_tweet(self):
+        first = _FakeExchange('First', [
+            TradedPair('ABCBTC', 'First', base='BTC', base_full_name='Bitcoin', to='ABC', to_full_name='Abacus'),
+            TradedPair('ABCETH', 'First', base='ETH', base_full_name='Ethereum', to='ABC', to_full_name='Abacus'),
+        ], failing_sell_price=0.00015 * 1.6)
+        second = _FakeExchange('Second', [
+            TradedPair('ABC-BTC', 'Second', base='BTC', base_full_name='Bitcoin', to='ABC', to_full_name='Abacus'),
+        ])
+        # Several keys map to the same exchange.
+        exchanges = {'First': first, 'first': first, 'Second': second, 'second': second}
+        trader = self._make_trader(exchanges, dict(First=['BTC'], Second=[]))
+
+        self._handle_text(trader, "BUY Abacus (ABC)")
+
+        # One buy per exchange and only with allowed bases.
+        self.assertEqual([('ABCBTC', 'buy')], [(o[0], o[1]) for o in first.orders if o[1] == 'buy'])
+        self.assertEqual([('ABC-BTC', 'buy')], [(o[0], o[1]) for o in second.orders if o[1] == 'buy'])
+        # All of the sells are placed even though one failed.
+        for exchange in (first, second):
+            sells = [o for o in exchange.orders if o[1] == 'sell']
+            self.assertEqual(4, len(sells))
+            self.assertEqual([75, 50, 62, 50], [o[3] for o in sells])
+        self.assertEqual(1, len(trader._pushbullet_api.sent))
+
+        # Coins can be matched by their full name.
+        first.orders.clear()
+        second.orders.clear()
+        self._handle_text(trader, "BUY Abacus")
+        self.assertEqual(['ABCBTC'], [o[0] for o in first.orders if o[1] == 'buy'])
+        self.assertEqual(['ABC-BTC'], [o[0] for o in second.orders if o[1] == 'buy'])
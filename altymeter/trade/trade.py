@@ -68,7 +68,7 @@ class Trader(object):
         start_time = time.time()
 
         # Get enough data to show initial classifying data.
-        market_trades_start = int(start_time) - self._price_data.time_grouping * self._trainer.num_look_back_steps
+        market_trades_start = int(start_time) - self._trainer.resolution * self._trainer.num_look_back_steps
 
         model = None
         if not retrain:
@@ -95,10 +95,11 @@ class Trader(object):
                 continue
 
             # Make sure that there are enough recent prices.
-            need_trades_start = int(time.time()) - self._price_data.time_grouping * self._trainer.num_look_back_steps
+            need_trades_start = int(time.time()) - self._trainer.resolution * self._trainer.num_look_back_steps
             # Subtract 2 minutes just to be safe.
             need_trades_start -= 2 * 60
-            if not self._price_data.has_continuous_trades_since(pair, need_trades_start):
+            if not self._price_data.has_continuous_trades_since(pair, need_trades_start,
+                                                                self._trainer.resolution):
                 # TODO Show when automated trading can start
                 # by checking how much time of recent continuous trades exists.
                 self._logger.info("Waiting for more data. Need trades since %s.", time.ctime(need_trades_start))
@@ -107,7 +108,7 @@ class Trader(object):
                 continue
 
             try:
-                prices, _, _, _ = self._trainer.build_training_data([pair], last=1, is_data_plottable=False)
+                prices, _, _, _, _ = self._trainer.build_training_data([pair], last=1, is_data_plottable=False)
                 prediction = model.predict(prices)[0]
                 score = max(prediction)
                 decision = self._trainer.interpret_decision(prediction)
@@ -116,10 +117,10 @@ class Trader(object):
                 volume = purchase_volume_base * score
                 t = time.strftime('%b %d %Y %X %z')
 
-                # XXX Optimize to only get newest data.
-                market_trades = self._price_data.get_trades(pair, since=market_trades_start)
-
-                price = market_trades[-1].price
+                last_trade = self._price_data.get_last_trade(pair)
+                if last_trade is None or last_trade.time < market_trades_start:
+                    raise ValueError("No trades for {} since {}.".format(pair, time.ctime(market_trades_start)))
+                price = last_trade.price
 
                 if decision == TradeDecision.BUY:
                     price *= self._buy_price_multiplier
@@ -162,6 +163,7 @@ class Trader(object):
 
             if self._is_data_plottable:
                 plot_data = []
+                market_trades = self._price_data.get_trades(pair, since=market_trades_start)
                 for market_trade in market_trades:
                     plot_data.append(dict(time=datetime.fromtimestamp(market_trade.time),
                                           price=market_trade.price))
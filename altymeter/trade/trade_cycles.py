@@ -1,14 +1,21 @@
+import queue
 import random
 from collections import defaultdict
 from logging import Logger
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
+from expiringdict import ExpiringDict
 from injector import inject, singleton
 from tqdm import tqdm
 
-from altymeter.api.exchange import TradedPair, TradingExchange
+from altymeter.api.exchange import TradedPair, TradedPairIndex, TradingExchange
 from altymeter.module.constants import Configuration
+from altymeter.trade.depth import CycleLiquidity, evaluate_cycle, get_leg_depth, LegDepth
+
+
+def _leg_depths_equal(a: LegDepth, b: LegDepth) -> bool:
+    return np.array_equal(a.cum_in, b.cum_in) and np.array_equal(a.cum_out, b.cum_out)
 
 
 @singleton
@@ -26,6 +33,13 @@ class InefficientMarkerFinder(object):
         self._min_profit = inefficient_market_config.get('min profit', 0.05)
         self._forbidden = set(inefficient_market_config.get('forbidden') or []) or None
         self._required = set(inefficient_market_config.get('required') or []) or None
+        # The number of amounts to check when determining how much can be traded through a cycle.
+        self._num_amounts = inefficient_market_config.get('num amounts', 20)
+        # Order books are shared by many cycles so keep them briefly.
+        order_book_max_age_s = inefficient_market_config.get('order book max age seconds', 5)
+        self._order_books_cache = ExpiringDict(max_len=10 ** 4, max_age_seconds=order_book_max_age_s)
+        # The last depth fetched for each order book to tell when it changes.
+        self._last_leg_depths: Dict[Tuple[str, str, str], LegDepth] = dict()
 
         allowed_exchanges = inefficient_market_config.get('exchanges')
         if allowed_exchanges:
@@ -33,6 +47,11 @@ class InefficientMarkerFinder(object):
             self._exchanges = {exchange: val for (exchange, val) in self._exchanges.items()
                                if exchange.lower() in allowed_exchanges}
 
+        # Maps each exchange to an index from a traded pair's name to the cycles that contain that pair.
+        self._pair_cycles: Dict[TradingExchange, Dict[str, List[List[str]]]] = dict()
+        # Pairs whose order book or ticker changed and whose cycles should be checked next.
+        self._updated_pairs = queue.Queue()
+
     def _find_cycles_for(self, start: str, edges: Dict[str, List[str]],
                          max_cycle_length=None) -> List[List[str]]:
         result = []
@@ -81,20 +100,150 @@ class InefficientMarkerFinder(object):
                     pass
         return result
 
+    def _index_cycles_by_pair(self, cycles: List[List[str]],
+                              traded_pair_index: TradedPairIndex) -> Dict[str, List[List[str]]]:
+        """
+        :param cycles: Cycles of assets found for the traded pairs.
+        :param traded_pair_index: The pairs traded on the exchange.
+        :return: A map from the name of each traded pair to the cycles that trade that pair.
+        """
+        result = defaultdict(list)
+        for cycle in cycles:
+            for i in range(len(cycle) - 1):
+                tp = traded_pair_index.get(base=cycle[i], to=cycle[i + 1]) or \
+                     traded_pair_index.get(base=cycle[i + 1], to=cycle[i])
+                if tp is not None:
+                    result[tp.name].append(cycle)
+        return result
+
+    def _evaluate_cycle(self, exchange: TradingExchange, cycle: List[str]) -> Optional[CycleLiquidity]:
+        """
+        :param exchange: The exchange to trade on.
+        :param cycle: The assets to trade through in order.
+        :return: How much can be traded through the cycle
+            or `None` if a leg of the cycle has no orders.
+        """
+        traded_pair_index = exchange.get_traded_pair_index()
+        legs = []
+        for i in range(len(cycle) - 1):
+            order_type = 'ask'
+            tp = traded_pair_index.get(base=cycle[i], to=cycle[i + 1])
+            if tp is None:
+                tp = traded_pair_index.get(base=cycle[i + 1], to=cycle[i])
+                order_type = 'bid'
+            leg = self._get_leg_depth(exchange, tp.name, order_type)
+            if leg.max_in == 0:
+                return None
+            legs.append(leg)
+        return evaluate_cycle(legs, self._num_amounts)
+
+    def _get_leg_depth(self, exchange: TradingExchange, pair: str, order_type: str) -> LegDepth:
+        key = (exchange.name, pair, order_type)
+        result = self._order_books_cache.get(key)
+        if result is None:
+            orders = exchange.get_order_book(pair=pair, order_type=order_type)
+            result = get_leg_depth(orders, order_type)
+            previous = self._last_leg_depths.get(key)
+            if previous is not None and not _leg_depths_equal(previous, result):
+                self.on_pair_updated(exchange, pair)
+            self._last_leg_depths[key] = result
+            self._order_books_cache[key] = result
+        return result
+
+    def _get_updated_cycles(self) -> List[Tuple[TradingExchange, List[str]]]:
+        """
+        Drain the pairs that were updated since the last call.
+
+        :return: The distinct cycles that contain at least one of the updated pairs.
+        """
+        result = []
+        seen = set()
+        while True:
+            try:
+                exchange, pair = self._updated_pairs.get_nowait()
+            except queue.Empty:
+                break
+            for cycle in self.get_cycles_for_pair(exchange, pair):
+                key = (exchange.name, tuple(cycle))
+                if key not in seen:
+                    seen.add(key)
+                    result.append((exchange, cycle))
+        return result
+
+    def check_cycle(self, exchange: TradingExchange, cycle: List[str]) -> Optional[CycleLiquidity]:
+        """
+        Check if a cycle is currently profitable.
+
+        :param exchange: The exchange to trade on.
+        :param cycle: The assets to trade through in order.
+        :return: The liquidity of the cycle or `None` if the cycle was skipped.
+        """
+        if self._forbidden and self._forbidden.intersection(cycle):
+            return None
+        if self._required and len(self._required.intersection(cycle)) == 0:
+            return None
+        liquidity = self._evaluate_cycle(exchange, cycle)
+        if liquidity is None:
+            return None
+        self._logger.debug("%s: %s: %s", exchange.name, cycle, liquidity.rate)
+        # The best price might only cover a tiny amount so check the amounts that can actually be traded.
+        max_profitable_amount = liquidity.get_max_profitable_amount(self._min_profit)
+        if max_profitable_amount > 0:
+            best_amount, best_profit = liquidity.get_best()
+            self._logger.info("FOUND cycle on %s: %s: %s"
+                              "\nMax amount: %s"
+                              "\nMax amount with min profit: %s"
+                              "\nBest amount: %s for a profit of %s",
+                              exchange.name, cycle, liquidity.rate,
+                              liquidity.max_amount,
+                              max_profitable_amount,
+                              best_amount, best_profit)
+            # TODO Trade.
+        return liquidity
+
     def find_cycles(self) -> Dict[TradingExchange, List[List[str]]]:
+        """
+        Find the cycles on each exchange
+        and index them by the pairs they trade so that they can be checked when a pair updates.
+        """
         result = defaultdict(list)
         for exchange in self._exchanges.values():
             self._logger.info("Finding cycles on %s.", exchange.name)
             try:
-                traded_pairs = exchange.get_traded_pairs()
-                cycles = self._find_cycles_for_pairs(traded_pairs)
+                traded_pair_index = exchange.get_traded_pair_index()
+                cycles = self._find_cycles_for_pairs(traded_pair_index.traded_pairs)
                 result[exchange] = cycles
+                self._pair_cycles[exchange] = self._index_cycles_by_pair(cycles, traded_pair_index)
                 self._logger.info("Found %d cycles on %s.", len(cycles), exchange.name)
             except:
                 self._logger.exception("Error finding cycles on %s.", exchange.name)
 
         return result
 
+    def get_cycles_for_pair(self, exchange: TradingExchange, pair: str) -> List[List[str]]:
+        """
+        :param exchange: The exchange that `pair` is traded on.
+        :param pair: The name of the traded pair.
+        :return: The cycles found by `find_cycles` that trade `pair`.
+        """
+        pair_cycles = self._pair_cycles.get(exchange)
+        if pair_cycles is None:
+            return []
+        return pair_cycles.get(pair, [])
+
+    def on_pair_updated(self, exchange: TradingExchange, pair: str):
+        """
+        Signal that the order book or ticker for a pair changed
+        so that only the cycles containing that pair get checked again.
+        Safe to call from other threads.
+
+        :param exchange: The exchange that `pair` is traded on.
+        :param pair: The name of the traded pair.
+        """
+        for order_type in ('ask', 'bid'):
+            self._order_books_cache.pop((exchange.name, pair, order_type), None)
+        self._updated_pairs.put((exchange, pair))
+
     def trade(self):
         exchange_cycles = self.find_cycles()
         assert exchange_cycles, "No cycles found."
@@ -102,47 +251,15 @@ class InefficientMarkerFinder(object):
         with tqdm(desc="Finding cycles", unit="cycle") as pbar:
             while True:
                 try:
-                    exchange = random.choice(exchanges)
-                    """:type: TradingExchange"""
-                    cycle = random.choice(exchange_cycles[exchange])
-                    if self._forbidden and self._forbidden.intersection(cycle):
-                        continue
-                    if self._required and len(self._required.intersection(cycle)) == 0:
-                        continue
-                    traded_pairs_map = defaultdict(set)
-                    traded_pairs = exchange.get_traded_pairs()
-                    for tp in traded_pairs:
-                        traded_pairs_map[tp.base].add(tp.to)
-                    flow = 1
-                    skip = False
-                    for i in range(len(cycle) - 1):
-                        order_type = 'ask'
-                        next_price = np.inf
-                        base = cycle[i]
-                        to = cycle[i + 1]
-                        f = min
-                        if to not in traded_pairs_map[base]:
-                            base, to = to, base
-                            order_type = 'bid'
-                            next_price = -np.inf
-                            f = max
-                        orders = exchange.get_order_book(base=base, to=to, order_type=order_type)
-                        if len(orders) == 0:
-                            skip = True
-                            break
-                        # TODO Consider a few orders for the price.
-                        for order in orders:
-                            if order.order_type == order_type:
-                                next_price = f(next_price, order.price)
-                        if order_type == 'ask':
-                            flow /= next_price
-                        else:
-                            flow *= next_price
-                    self._logger.debug("%s: %s: %s", exchange.name, cycle, flow)
-                    if not skip and flow >= 1 + self._min_profit:
-                        self._logger.info("FOUND cycle on %s: %s: %s", exchange.name, cycle, flow)
-                        # TODO Trade.
-                    pbar.update()
+                    cycles = self._get_updated_cycles()
+                    if not cycles:
+                        # No pairs were updated so check a random cycle.
+                        exchange = random.choice(exchanges)
+                        """:type: TradingExchange"""
+                        cycles = [(exchange, random.choice(exchange_cycles[exchange]))]
+                    for exchange, cycle in cycles:
+                        self.check_cycle(exchange, cycle)
+                        pbar.update()
                 except:
                     self._logger.exception("Error finding negative cycles.")
 
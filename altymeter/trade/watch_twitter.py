@@ -1,12 +1,13 @@
 import re
+from concurrent.futures import as_completed, Future, ThreadPoolExecutor
 from logging import Logger
-from typing import Dict
+from typing import Callable, Dict, List
 
 import twitter
 from injector import inject
 from pushbullet import Pushbullet
 
-from altymeter.api.exchange import TradingExchange
+from altymeter.api.exchange import TradedPair, TradingExchange
 from altymeter.module.constants import Configuration
 from altymeter.trade.ocr import Ocr
 import dpath.util
@@ -45,6 +46,17 @@ class TwitterWatchingTrader(object):
 
         self._watch_config = twitter_api_config['watch']
 
+        # `exchanges` has several keys for each exchange.
+        self._unique_exchanges = list({id(e): e for e in self._exchanges.values()}.values())
+        # Determine allowed bases.
+        self._exchange_bases = {e.name: set(self._config['exchanges'][e.name].get('bases') or [])
+                                for e in self._unique_exchanges}
+        # Maps each exchange's name to (the traded pair index used, the pairs to buy for each coin).
+        self._pairs_by_coin = dict()
+        # Notifying, looking up pairs, and placing orders all wait on the network so do them at the same time.
+        self._executor = ThreadPoolExecutor(max_workers=self._watch_config.get('max workers', 16),
+                                            thread_name_prefix='twitter_trader')
+
     def _is_within_times(self, tweet: dict, start_time_s, end_time_s):
         result = True
         utc_time_of_day_s = (int(tweet['timestamp_ms']) / 1000) % (60 * 60 * 24)
@@ -61,76 +73,154 @@ class TwitterWatchingTrader(object):
         for num in self._numbers_to_notify:
             self._pushbullet_api.push_sms(self._pushbullet_device, num, text)
 
-    def _trade(self, tweet: dict, coin: str):
+    def _submit(self, error_message: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Run `fn` in the background and log `error_message` if it fails.
+        """
+
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            except:
+                self._logger.exception(error_message)
+
+        return self._executor.submit(run)
+
+    def _get_pairs_to_buy(self, exchange: TradingExchange, coin: str) -> List[TradedPair]:
+        """
+        :return: The pairs with allowed bases that can be used to buy `coin` on `exchange`.
+        """
+        traded_pair_index = exchange.get_traded_pair_index()
+        pairs_by_coin = self._pairs_by_coin.get(exchange.name)
+        if pairs_by_coin is None or pairs_by_coin[0] is not traded_pair_index:
+            # The traded pairs were refreshed.
+            pairs_by_coin = (traded_pair_index, dict())
+            self._pairs_by_coin[exchange.name] = pairs_by_coin
+        result = pairs_by_coin[1].get(coin)
+        if result is None:
+            exchange_bases = self._exchange_bases[exchange.name]
+            result = []
+            for tp in traded_pair_index.get_by_to(coin) + \
+                      [tp for tp in traded_pair_index.get_by_to_full_name(coin) if tp.to != coin]:
+                if len(exchange_bases) > 0 and tp.base not in exchange_bases:
+                    self._logger.debug("Found pair with non permitted base: %s", tp)
+                    continue
+                result.append(tp)
+            pairs_by_coin[1][coin] = result
+        return result
+
+    def _buy_and_sell(self, exchange: TradingExchange, tp: TradedPair):
+        # Determine volume.
+        recent_stats = exchange.get_recent_stats(pair=tp.name)
+        price = recent_stats.weighted_avg_price or recent_stats.last_price
+        # TODO FIXME Load desired volumes from config.
+        volume = 10
+        if tp.base == "ETH":
+            volume = 0.8 / price
+        elif tp.base == "BTC":
+            volume = 0.025 / price
+
+        # Some exchanges work better with integer volumes.
+        volume = int(volume)
+        # TODO Make price multiplier configurable.
+        price *= 1.5
+        order = exchange.create_order(pair=tp.name,
+                                      action_type='buy',
+                                      order_type='limit',
+                                      price=price,
+                                      volume=volume)
+
+        # Make sure sell price isn't too low.
+        price = max(order.price, price * 0.9)
+
+        # TODO Option to make sure that order was successful before selling
+        # so that the user's existing assets aren't sold.
+
+        # Sell
+        # TODO Load multipliers from config.
+        # Notice that the volume multiplier don't sum to 1: HODL.
+        price_vols = [
+            (1.4, 0.3),
+            (1.6, 0.2),
+            (2, 0.25),
+            (2.2, 0.2),
+        ]
+        # The sell orders are independent so place them all at once.
+        for price_mul, vol_mul in price_vols:
+            self._submit("Error selling {} on {}.".format(tp.name, exchange.name),
+                         exchange.create_order,
+                         pair=tp.name,
+                         action_type='sell',
+                         order_type='limit',
+                         time_in_force='GTC',
+                         price=price * price_mul,
+                         volume=int(volume * vol_mul))
+
+    def _trade_on_exchange(self, exchange: TradingExchange, coin: str, is_dry_run: bool):
+        self._logger.debug("Checking %s.", exchange.name)
+        for tp in self._get_pairs_to_buy(exchange, coin):
+            if is_dry_run:
+                self._logger.info("Would buy %s.", tp.name)
+            else:
+                self._submit("Error exchanging {} on {}.".format(tp.name, exchange.name),
+                             self._buy_and_sell, exchange, tp)
+
+    def _trade(self, tweet: dict, coin: str) -> List[Future]:
+        """
+        Start buying `coin` on all exchanges without waiting for orders to be placed.
+
+        :return: The tasks checking each exchange.
+        """
         is_dry_run = self._config.get('trading', {}).get('dry run', False)
         # Find on an exchange.
-        for exchange in self._exchanges.values():
-            self._logger.debug("Checking %s.", exchange.name)
-            # Determine allowed bases.
-            exchange_bases = set(self._config['exchanges'][exchange.name].get('bases') or [])
+        result = []
+        for exchange in self._unique_exchanges:
+            result.append(self._submit("Error using {} exchange.".format(exchange.name),
+                                       self._trade_on_exchange, exchange, coin, is_dry_run))
+        return result
 
+    def _handle_photos(self, tweet: dict, photo_futures: List[Future],
+                       pattern, photo_text_pattern,
+                       start_time_of_day_s, end_time_of_day_s):
+        """
+        Check the text in pictures as soon as each picture is read.
+        """
+        m = None
+        for future in as_completed(photo_futures):
             try:
-                for tp in exchange.get_traded_pairs():
-                    if tp.to == coin or tp.to_full_name == coin:
-                        if len(exchange_bases) > 0 and tp.base not in exchange_bases:
-                            self._logger.debug("Found pair with non permitted base: %s", tp)
-                            continue
-                        if is_dry_run:
-                            self._logger.info("Would buy %s.", tp.name)
-                        else:
-                            # Buy.
-                            try:
-                                # Determine volume.
-                                recent_stats = exchange.get_recent_stats(pair=tp.name)
-                                price = recent_stats.weighted_avg_price or recent_stats.last_price
-                                # TODO FIXME Load desired volumes from config.
-                                volume = 10
-                                if tp.base == "ETH":
-                                    volume = 0.8 / price
-                                elif tp.base == "BTC":
-                                    volume = 0.025 / price
-
-                                # Some exchanges work better with integer volumes.
-                                volume = int(volume)
-                                # TODO Make price multiplier configurable.
-                                price *= 1.5
-                                order = exchange.create_order(pair=tp.name,
-                                                              action_type='buy',
-                                                              order_type='limit',
-                                                              price=price,
-                                                              volume=volume)
-
-                                # Make sure sell price isn't too low.
-                                price = max(order.price, price * 0.9)
-
-                                # TODO Option to make sure that order was successful before selling
-                                # so that the user's existing assets aren't sold.
-
-                                # Sell
-                                # TODO Load multipliers from config.
-                                # Notice that the volume multiplier don't sum to 1: HODL.
-                                price_vols = [
-                                    (1.4, 0.3),
-                                    (1.6, 0.2),
-                                    (2, 0.25),
-                                    (2.2, 0.2),
-                                ]
-                                for price_mul, vol_mul in price_vols:
-                                    try:
-                                        exchange.create_order(pair=tp.name,
-                                                              action_type='sell',
-                                                              order_type='limit',
-                                                              time_in_force='GTC',
-                                                              price=price * price_mul,
-                                                              volume=int(volume * vol_mul))
-                                    except:
-                                        self._logger.exception("Error selling {} on {}.".format(
-                                            tp.name, exchange.name))
-                            except:
-                                self._logger.exception("Error exchanging {} on {}.".format(
-                                    tp.name, exchange.name))
+                photo_text = future.result()
             except:
-                self._logger.exception("Error using {} exchange.".format(exchange.name))
+                self._logger.exception("Error reading photo.")
+                continue
+            self._logger.debug("Photo text: \"%s\".", photo_text)
+
+            m = pattern.search(photo_text)
+            if m:
+                break
+            if photo_text_pattern:
+                m = photo_text_pattern.search(photo_text)
+                if m:
+                    break
+        self._handle_tweet(tweet, m, start_time_of_day_s, end_time_of_day_s)
+
+    def _handle_tweet(self, tweet: dict, m, start_time_of_day_s, end_time_of_day_s):
+        if m or self._is_within_times(tweet, start_time_of_day_s, end_time_of_day_s):
+            if m:
+                coin_name = m['coin_name']
+                coin = m['coin']
+                if coin is None:
+                    # TODO Try to determine coin.
+                    coin = coin_name
+            else:
+                coin_name = None
+                coin = None
+            if coin is not None:
+                try:
+                    self._trade(tweet, coin)
+                except:
+                    self._logger.exception("Trading failed.")
+            # Notify after trading starts since trading is more time sensitive.
+            self._submit("Notifying failed.", self._notify, tweet, coin_name)
 
     def watch(self):
         screen_names = set(self._watch_config['screen names'])
@@ -150,43 +240,32 @@ class TwitterWatchingTrader(object):
                           screen_names, pattern, photo_text_pattern,
                           start_time_of_day_s, end_time_of_day_s)
         user_ids = [str(self._twitter_api.GetUser(screen_name=screen_name).id) for screen_name in screen_names]
+
+        # Load traded pairs before tweets come in.
+        for exchange in self._unique_exchanges:
+            try:
+                exchange.get_traded_pair_index()
+            except:
+                self._logger.exception("Error getting traded pairs for %s.", exchange.name)
+
         for tweet in self._twitter_api.GetStreamFilter(follow=user_ids):
             if tweet['user']['screen_name'] in screen_names and not tweet['retweeted']:
                 text = tweet['text']
                 self._logger.debug("Tweet: \"%s\"", text)
                 m = pattern.search(text)
+                photo_urls = []
                 if not m:
                     for media in dpath.util.values(tweet, 'entities/media/*'):
                         if media['type'] == 'photo':
-                            photo_url = media['media_url']
-                            photo_text = self._ocr.read(photo_url)
-                            self._logger.debug("Photo text: \"%s\" at %s.", photo_text, photo_url)
-
-                            m = pattern.search(photo_text)
-                            if m:
-                                break
-                            m = photo_text_pattern.search(photo_text)
-                            if m:
-                                break
-                if m or self._is_within_times(tweet, start_time_of_day_s, end_time_of_day_s):
-                    if m:
-                        coin_name = m['coin_name']
-                        coin = m['coin']
-                        if coin is None:
-                            # TODO Try to determine coin.
-                            coin = coin_name
-                    else:
-                        coin_name = None
-                        coin = None
-                    try:
-                        self._notify(tweet, coin_name)
-                    except:
-                        self._logger.exception("Notifying failed.")
-                    if coin is not None:
-                        try:
-                            self._trade(tweet, coin)
-                        except:
-                            self._logger.exception("Trading failed.")
+                            photo_urls.append(media['media_url'])
+                if photo_urls:
+                    # Reading pictures is slow so don't block the stream.
+                    photo_futures = [self._ocr.submit(photo_url) for photo_url in photo_urls]
+                    self._submit("Error handling photos in {}.".format(tweet.get('id')),
+                                 self._handle_photos, tweet, photo_futures,
+                                 pattern, photo_text_pattern, start_time_of_day_s, end_time_of_day_s)
+                else:
+                    self._handle_tweet(tweet, m, start_time_of_day_s, end_time_of_day_s)
 
 
 if __name__ == '__main__':